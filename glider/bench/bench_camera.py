@@ -0,0 +1,120 @@
+"""
+Camera capture cost, a new PiCamera per capture with a /tmp round trip
+(as GliderCamera used to) vs the persistent in-memory session.
+
+    python -m glider.bench.bench_camera [captures]
+
+Runs against FakeCameraBackend on a virtual clock, so "camera seconds" is
+the time the fake says a real PiCamera would take (open/settle, mode
+switch, capture) and "CPU ms" is the real cost of the Python/PIL side.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from PIL import Image
+from glider.modules import glider_clock
+from glider.modules.camera_backend import FakeCameraBackend
+from glider.modules.glider_camera import GliderCamera
+
+
+class CountingClock(object):
+    """Adds up the time slept instead of sleeping"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def legacy_low_pic(backend, photo_path, index):
+    """take_low_pic as it was: open, settle, capture to /tmp, read back, close"""
+    out_path = os.path.join(photo_path, "low_legacy_%s.jpg" % index)
+    precompressed = os.path.join(photo_path, "precompressed.jpg")
+    backend.open()
+    backend.capture(precompressed, "low", format="jpeg", quality=40)
+    image = Image.open(precompressed)
+    image.convert('P', palette=Image.ADAPTIVE, colors=200).convert("RGB").save(
+        out_path, "JPEG", quality=20, optimize=True
+    )
+    backend.close()
+    return out_path
+
+
+def legacy_high_pic(backend, photo_path, index):
+    out_path = os.path.join(photo_path, "high_legacy_%s.png" % index)
+    backend.open()
+    backend.capture(out_path, "high", format="png")
+    backend.close()
+    return out_path
+
+
+def measure(take, captures):
+    clock = CountingClock()
+    real_clock = glider_clock.get_clock()
+    glider_clock.set_clock(clock)
+    try:
+        cpu_start = time.clock()
+        for index in range(captures):
+            take(index)
+        cpu = time.clock() - cpu_start
+    finally:
+        glider_clock.set_clock(real_clock)
+    return {
+        "camera_seconds_per_capture": clock.now / captures,
+        "cpu_ms_per_capture": cpu / captures * 1000,
+    }
+
+
+def run(captures=20):
+    photo_path = tempfile.mkdtemp()
+    try:
+        legacy_backend = FakeCameraBackend()
+
+        def legacy(index):
+            # Every 4th capture is a high pic, like the 15s/60s intervals
+            if index % 4 == 3:
+                legacy_high_pic(legacy_backend, photo_path, index)
+            else:
+                legacy_low_pic(legacy_backend, photo_path, index)
+
+        session_backend = FakeCameraBackend()
+        camera = GliderCamera(photo_path=photo_path, backend=session_backend)
+
+        def session(index):
+            if index % 4 == 3:
+                camera.take_high_pic()
+            else:
+                camera.take_low_pic()
+
+        results = {
+            "legacy": measure(legacy, captures),
+            "session": measure(session, captures),
+        }
+        results["legacy"]["opens"] = legacy_backend.opens
+        results["session"]["opens"] = session_backend.opens
+        return results
+    finally:
+        shutil.rmtree(photo_path)
+
+
+def main():
+    captures = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    results = run(captures)
+    for name in ["legacy", "session"]:
+        result = results[name]
+        print "%-8s %3d opens %6.2f camera s/capture %7.1f CPU ms/capture" % (
+            name, result["opens"], result["camera_seconds_per_capture"], result["cpu_ms_per_capture"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Jitter of a 100 Hz control loop thread while the camera thread captures
+and encodes pictures, encoding on the camera thread vs in the encoder pool.
+
+    python -m glider.bench.bench_encoder [seconds]
+"""
+import sys
+import time
+import logging
+import shutil
+import tempfile
+import threading
+
+from glider.modules.camera_backend import FakeCameraBackend
+from glider.modules.glider_camera import GliderCamera
+from glider.modules.image_encoder import EncoderPool
+
+
+def control_loop(stop, lateness, period=0.01):
+    """Stand-in for the FLIGHT state: a little work every 10 ms on fixed deadlines"""
+    deadline = time.time() + period
+    while not stop.is_set():
+        delay = deadline - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lateness.append(max(0.0, time.time() - deadline))
+        sum(x * x for x in range(200))
+        deadline += period
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(use_pool, seconds):
+    photo_path = tempfile.mkdtemp()
+    backend = FakeCameraBackend(0, 0, 0)
+    camera = GliderCamera(photo_path=photo_path, backend=backend)
+    # Make the fake's frames now so only the encoding is measured
+    backend.open()
+    backend.capture_raw("low")
+    backend.capture_raw("high")
+    if use_pool:
+        camera.encoder = EncoderPool(workers=1, max_pending=2)
+        camera.encoder.start()
+    stop = threading.Event()
+    lateness = []
+    loop = threading.Thread(target=control_loop, args=(stop, lateness))
+    loop.start()
+    captures = 0
+    capture_time = 0.0
+    end = time.time() + seconds
+    try:
+        while time.time() < end:
+            start = time.time()
+            if captures % 4 == 3:
+                camera.take_high_pic()
+            else:
+                camera.take_low_pic()
+            capture_time = max(capture_time, time.time() - start)
+            captures += 1
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        loop.join()
+        stats = None
+        if use_pool:
+            camera.encoder.stop()
+            stats = camera.encoder.stats()
+        shutil.rmtree(photo_path)
+    return {
+        "captures": captures,
+        "longest_capture_ms": capture_time * 1000,
+        "jitter_p50_ms": percentile(lateness, 0.5) * 1000,
+        "jitter_p99_ms": percentile(lateness, 0.99) * 1000,
+        "jitter_max_ms": max(lateness) * 1000,
+        "encoder": stats,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, use_pool in [("inline", False), ("pool", True)]:
+        result = measure(use_pool, seconds)
+        print "%-6s %4d captures, longest capture %6.1f ms, control loop jitter p50 %5.2f ms p99 %6.2f ms max %6.2f ms" % (
+            name, result["captures"], result["longest_capture_ms"],
+            result["jitter_p50_ms"], result["jitter_p99_ms"], result["jitter_max_ms"])
+        if result["encoder"]:
+            print "       encoder: %s" % result["encoder"]
+
+
+if __name__ == '__main__':
+    main()
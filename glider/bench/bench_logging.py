@@ -0,0 +1,109 @@
+"""
+Control loop tick time (wing angles and six servo writes) with the logging
+it did before (eager formatting, the flap scales as indented JSON every
+tick, synchronous handlers) vs HotLog, with synchronous handlers and with
+the queue and writer thread (and at DEBUG without the rate limit). The
+handlers are the ones in glider_conf.ini, writing to temporary files.
+Ticks are 'interval' seconds apart like the control loop's, the sleep
+isn't timed.
+
+    python -m glider.bench.bench_logging [ticks] [interval]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from glider.modules import glider_pilot
+from glider.modules.glider_logging import HotLog, start_async_logging, stop_async_logging
+from glider.bench.fakes import FakeIMU
+
+FORMAT = "%(asctime)s %(name)-12s L.%(lineno)d %(levelname)-8s %(message)s"
+SERVOS = range(6)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def old_tick(pilot, log):
+    # The logging update_flap_angles and _set_servo_angle did before HotLog
+    log.debug("\nCalculating wing angles")
+    log.debug("Current P(%2.1f) R(%2.1f) Y(%2.1f)" % (-5.7, 11.5, 57.3))
+    scales = pilot.update_flap_angles()
+    log.info("Wing Scales: %s" % json.dumps(scales, indent=2))
+    for servo in SERVOS:
+        log.debug("Setting servo(%s) angle %s pulse (%s, %s)" % (servo, 90.0, 0, 307))
+
+
+def hot_tick(pilot, hot_log):
+    pilot.update_flap_angles()
+    for servo in SERVOS:
+        hot_log.debug("Setting servo(%s) angle %s pulse (%s, %s)", servo, 90.0, 0, 307)
+
+
+def configure(directory, level):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    stream = logging.StreamHandler(open(os.path.join(directory, "stderr.log"), "a"))
+    stream.setLevel(logging.DEBUG)
+    log_file = logging.FileHandler(os.path.join(directory, "glider.log"))
+    log_file.setLevel(logging.WARN)
+    for handler in [stream, log_file]:
+        handler.setFormatter(logging.Formatter(FORMAT))
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def measure(name, tick, ticks, interval):
+    costs = []
+    for _ in range(ticks):
+        started = time.time()
+        tick()
+        costs.append(time.time() - started)
+        time.sleep(interval)
+    print "  %-18s mean %7.2f us  p99 %7.2f us  max %8.2f us" % (
+        name, sum(costs) / len(costs) * 1e6, percentile(costs, 0.99) * 1e6, max(costs) * 1e6)
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+    directory = tempfile.mkdtemp()
+    pilot_log = glider_pilot.HOT_LOG.logger
+    try:
+        pilot = glider_pilot.Pilot(FakeIMU())
+        log = logging.getLogger("glider.bench")
+        hot_log = HotLog(log)
+        print "%s ticks, %sms apart" % (ticks, interval * 1000)
+        for level in [logging.DEBUG, logging.INFO, logging.WARN]:
+            print logging.getLevelName(level)
+            configure(directory, level)
+            pilot_log.setLevel(logging.CRITICAL)  # Only the old logging
+            measure("old", lambda: old_tick(pilot, log), ticks, interval)
+            pilot_log.setLevel(logging.NOTSET)
+            measure("hot log", lambda: hot_tick(pilot, hot_log), ticks, interval)
+            start_async_logging()
+            measure("hot log, async", lambda: hot_tick(pilot, hot_log), ticks, interval)
+            stop_async_logging()
+            if level == logging.DEBUG:
+                # Every record written, to see what the writer thread saves
+                unlimited = HotLog(log, interval=0)
+                glider_pilot.HOT_LOG.interval = 0
+                measure("unlimited", lambda: hot_tick(pilot, unlimited), ticks, interval)
+                start_async_logging()
+                measure("unlimited, async", lambda: hot_tick(pilot, unlimited), ticks, interval)
+                stop_async_logging()
+                glider_pilot.HOT_LOG.interval = hot_log.interval
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Write throughput and per-capture latency storing a flight's worth of
+pictures: a file per picture (with and without an fsync per file) vs
+appending to segments. Run it on the SD card to get meaningful numbers.
+
+    python -m glider.bench.bench_media_store [directory] [captures]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from glider.modules.media_store import FileStore, SegmentStore
+
+LOW_SIZE = 40 * 1024  # Downlink JPEG
+HIGH_SIZE = 1536 * 1024  # Archive PNG
+THUMB_SIZE = 6 * 1024
+
+
+def captures(count):
+    """Three downlink pictures per archive picture (and its thumbnail), like the default intervals"""
+    low, high, thumb = os.urandom(LOW_SIZE), os.urandom(HIGH_SIZE), os.urandom(THUMB_SIZE)
+    for index in range(count):
+        if index % 4 == 3:
+            yield "high_%06d.png" % index, high, "high"
+            yield "thumb_%06d.jpg" % index, thumb, "thumb"
+        else:
+            yield "low_%06d.jpg" % index, low, "low"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(name, make_store, directory, count):
+    store_directory = tempfile.mkdtemp(dir=directory)
+    try:
+        store = make_store(store_directory)
+        latencies = []
+        written = 0
+        started = time.time()
+        for index, (capture_name, data, kind) in enumerate(captures(count)):
+            put_started = time.time()
+            store.put(capture_name, data, kind, started + index)
+            latencies.append(time.time() - put_started)
+            written += len(data)
+        store.close()
+        elapsed = time.time() - started
+    finally:
+        shutil.rmtree(store_directory)
+    print "%-24s %7.1f MB/s  p50 %6.2f ms  p99 %7.2f ms  max %7.2f ms" % (
+        name, written / elapsed / 2 ** 20, percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000, max(latencies) * 1000)
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    print "%s captures in %s" % (count, directory or tempfile.gettempdir())
+    measure("files", lambda path: FileStore(path), directory, count)
+    measure("files, fsync each", lambda path: FileStore(path, fsync=True), directory, count)
+    measure("segments, fsync 5s", lambda path: SegmentStore(path, fsync_interval=5), directory, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+What instrumenting a hot path costs per call: a bare call, the same
+function behind timed() with metrics off and on, and a hand timed stage
+(now() and observe()).
+
+    python -m glider.bench.bench_metrics [calls]
+"""
+import sys
+import time
+
+from glider.modules.glider_metrics import Metrics, timed, now
+
+
+def stage(value):
+    return value + 1
+
+
+def measure(name, call, calls):
+    started = time.time()
+    for index in xrange(calls):
+        call(index)
+    elapsed = time.time() - started
+    print "%-24s %6.3f us/call" % (name, elapsed / calls * 1e6)
+    return elapsed
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    off, on = Metrics(enabled=False), Metrics(enabled=True)
+
+    def by_hand(value):
+        started = now()
+        stage(value)
+        on.observe("by_hand", now() - started)
+
+    print "%s calls" % calls
+    measure("bare", stage, calls)
+    measure("timed, metrics off", timed("stage", off)(stage), calls)
+    measure("timed, metrics on", timed("stage", on)(stage), calls)
+    measure("by hand, metrics on", by_hand, calls)
+    print on.summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Heading updates per second: the bearing the pilot worked out before (with
+and without its warning logs) vs the navigator, which also gives the
+distance to go and the cross track error.
+
+    python -m glider.bench.bench_navigator [updates]
+"""
+import os
+import sys
+import math
+import time
+import random
+import shutil
+import logging
+import tempfile
+
+from glider.modules.navigator import Navigator
+
+DESTINATION = (54.673146, -7.490621)
+
+
+def old_heading(log, x1, y1, x2, y2):
+    # Pilot.update_desired_heading before the navigator
+    if log:
+        log.warning("X1 %s Y2 %s" % (x1, y1))
+        log.warning("X2 %s Y2 %s" % (x2, y2))
+    lon1, lat1, lon2, lat2 = map(math.radians, [y1, x1, y2, x2])
+    bearing = math.atan2(
+        math.sin(lon2-lon1) * math.cos(lat2),
+        math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2-lon1)
+    )
+    bearing = (bearing + (2*math.pi)) % (2*math.pi)
+    if log:
+        log.warning("ANG %s" % math.degrees(bearing))
+    return bearing
+
+
+def measure(name, update, positions):
+    started = time.time()
+    for lat, lon in positions:
+        update(lat, lon)
+    elapsed = time.time() - started
+    print "%-28s %9.0f updates/s  %6.2f us/update" % (name, len(positions) / elapsed, elapsed / len(positions) * 1e6)
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    positions = [(random.uniform(54.0, 55.0), random.uniform(-8.0, -7.0)) for _ in range(updates)]
+    directory = tempfile.mkdtemp()
+    try:
+        log = logging.getLogger("bench_navigator")
+        log.propagate = False
+        log.addHandler(logging.FileHandler(os.path.join(directory, "glider.log")))
+        navigator = Navigator(arrival_radius=150)
+        navigator.set_route([DESTINATION])
+        print "%s updates" % updates
+        measure("old bearing + logging", lambda lat, lon: old_heading(log, lat, lon, *DESTINATION), positions)
+        measure("old bearing", lambda lat, lon: old_heading(None, lat, lon, *DESTINATION), positions)
+        measure("navigator", navigator.update, positions)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cost on the control loop of recording one tick (IMU sample, flap scales,
+servo pulses): the flight recorder vs the JSON text logging the pilot does.
+
+    python -m glider.bench.bench_recorder [ticks]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from glider.modules.glider_imu import IMUSample
+from glider.modules.flight_recorder import FlightRecorder, load_flight
+
+FLAP_SCALES = {"rudder": 0.44, "rear": 1.0, "left_near": 0.57, "right_near": 0.43, "left_far": 0.57, "right_far": 0.43}
+PULSES = dict((channel, (0, 300 + channel)) for channel in range(8))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(name, record_tick, ticks):
+    costs = []
+    for tick in range(ticks):
+        started = time.time()
+        record_tick(tick)
+        costs.append(time.time() - started)
+    print "%-16s mean %6.2f us  p99 %6.2f us  max %8.2f us" % (
+        name, sum(costs) / len(costs) * 1e6, percentile(costs, 0.99) * 1e6, max(costs) * 1e6)
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp()
+    try:
+        log = logging.getLogger("bench_recorder")
+        log.propagate = False
+        log.addHandler(logging.FileHandler(os.path.join(directory, "glider.log")))
+        log.setLevel(logging.INFO)
+
+        def log_tick(tick):
+            sample = IMUSample(0.1, -0.2, 1.5, tick, tick)
+            log.info("Current P(%2.1f) R(%2.1f) Y(%2.1f)" % (sample.pitch, sample.roll, sample.yaw))
+            log.info("Wing Scales: %s" % json.dumps(FLAP_SCALES, indent=2))
+            log.info("Pulses: %s" % PULSES)
+
+        recorder = FlightRecorder(os.path.join(directory, "flight.fdr"), 64 * 2 ** 20)
+
+        def record_tick(tick):
+            recorder.record_imu(IMUSample(0.1, -0.2, 1.5, tick, tick))
+            recorder.record_flaps(FLAP_SCALES)
+            recorder.record_servos(PULSES)
+
+        print "%s ticks" % ticks
+        measure("text log", log_tick, ticks)
+        measure("flight recorder", record_tick, ticks)
+        recorder.close()
+        started = time.time()
+        flight = load_flight(recorder.path)
+        print "load_flight: %s records in %.1f ms" % (
+            sum(len(records) for name, records in flight.items() if name != "header"), (time.time() - started) * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+RHSerial receive path, byte at a time state machine vs the buffered FrameDecoder.
+
+    python -m glider.bench.bench_rhserial [recording]
+
+'recording' is a raw capture of the serial port, without one a stream of
+telemetry, glider data and image frames (with some line noise) is generated.
+Reports decoded frames per second and CPU time per frame.
+"""
+import sys
+import time
+import struct
+import random
+import datetime
+
+from glider.modules import telem_codec
+from glider.modules.rhserial import RHSerial, FrameDecoder, build_frame, crc16, DLE, STX, ETX
+from glider.bench.fakes import FakeSerial
+
+
+def legacy_listen_for_msg(self):
+    """RHSerial._listen_for_msg as it was before the FrameDecoder (one read() and state test per byte)"""
+    message = bytearray()
+    checksum = bytearray()
+    state = 'IDLE'
+
+    while self.listen:
+        byte = self.serial.read()
+        if byte:
+            if state == 'IDLE':
+                if ord(byte) == DLE:
+                    state = 'STX'
+            elif state == 'STX':
+                if ord(byte) == STX:
+                    state = 'MESSAGE'
+                    message = bytearray()
+            elif state == 'MESSAGE':
+                if ord(byte) == DLE:
+                    state = 'MSGDLE'
+                else:
+                    message.append(ord(byte))
+            elif state == 'MSGDLE':
+                if ord(byte) == DLE:
+                    message.append(ord(byte))
+                    state = 'MESSAGE'
+                elif ord(byte) == ETX:
+                    message.append(DLE)
+                    message.append(ETX)
+                    state = 'CHECKSUM1'
+                    checksum = bytearray()
+                else:
+                    state = 'IDLE'
+            elif state == 'CHECKSUM1':
+                checksum.append(ord(byte))
+                state = 'CHECKSUM2'
+            elif state == 'CHECKSUM2':
+                checksum.append(ord(byte))
+                calcedcheck = bytearray(struct.pack(">H", crc16(str(message))))
+                if calcedcheck == checksum:
+                    msgto = message[0]
+                    if msgto in [0xFF, self.address] or self.promiscuous:
+                        self.callback({'message': message[4:-2]})
+                state = 'IDLE'
+
+
+def recorded_stream(frames=2000, seed=1):
+    """A stream like the groundstation hears: telemetry, glider data, image parts and some noise"""
+    rng = random.Random(seed)
+    scales = dict((flap, 0.5) for flap in telem_codec.FLAPS)
+    stream = bytearray()
+    for index in range(frames):
+        kind = index % 4
+        if kind == 0:
+            payload = telem_codec.encode_telemetry(
+                index, datetime.time(12, 0, index % 60), 54.45 + index * 1e-5, -7.25, 2.5, 2000 - index, 54.5, -6.9, "FLIGHT")
+        elif kind == 1:
+            payload = telem_codec.encode_glider_data(
+                rng.uniform(-30, 30), rng.uniform(-20, 5), rng.uniform(-180, 180), scales, 45, -10, 12.3, 140, 3, "DEST")
+        elif kind == 2:
+            payload = "D|O:%2.1f_%2.1f_%2.1f|W:0.50_0.50_0.50_0.50_0.50_0.50" % (
+                rng.uniform(-30, 30), rng.uniform(-20, 5), rng.uniform(-180, 180))
+        else:
+            payload = "I|P|%s|%s" % (index, "".join(chr(rng.randint(65, 90)) for _ in range(220)))
+        stream += build_frame(payload, to=0xFF, frm=0xAA, id=index % 250)
+        if rng.random() < 0.02:
+            stream += bytearray(rng.randint(0, 255) for _ in range(rng.randint(1, 20)))
+    return bytes(stream)
+
+
+def run_receiver(listen, stream, buffered):
+    frames = []
+    radio = RHSerial.__new__(RHSerial)
+    radio.address = 0xFF
+    radio.promiscuous = True
+    radio.callback = frames.append
+    radio.listen = True
+    radio.decoder = FrameDecoder()
+    radio.serial = FakeSerial(stream, buffered=buffered, on_empty=lambda: setattr(radio, "listen", False))
+    cpu_start = time.clock()
+    wall_start = time.time()
+    listen(radio)
+    cpu = time.clock() - cpu_start
+    wall = time.time() - wall_start
+    return {
+        "frames": len(frames),
+        "reads": radio.serial.reads,
+        "frames_per_second": len(frames) / wall if wall else float("inf"),
+        "cpu_us_per_frame": cpu / len(frames) * 1e6 if frames else None,
+    }
+
+
+def run(stream=None, buffered=64):
+    stream = stream or recorded_stream()
+    return {
+        "bytes": len(stream),
+        "legacy": run_receiver(legacy_listen_for_msg, stream, buffered),
+        "buffered": run_receiver(RHSerial._listen_for_msg, stream, buffered),
+    }
+
+
+def main():
+    stream = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as recording:
+            stream = recording.read()
+    results = run(stream)
+    print "Stream: %s bytes" % results["bytes"]
+    for name in ["legacy", "buffered"]:
+        result = results[name]
+        print "%-9s %5d frames %7d reads %9.0f frames/s %7.1f us CPU/frame" % (
+            name, result["frames"], result["reads"], result["frames_per_second"], result["cpu_us_per_frame"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+CPU time and wakeups of an idle glider (a state ticking every 'period'
+seconds, nothing to say on the radio but telemetry) with a thread per
+module vs everything on the glider_runtime event loop. The radio is a
+pseudo terminal, the servos and camera are fakes.
+
+    python -m glider.bench.bench_runtime [seconds] [period]
+
+Wakeups are the process's voluntary context switches (each thread going
+to sleep), from getrusage.
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import resource
+import tempfile
+
+from glider.modules import glider_config
+from glider.modules.camera_backend import FakeCameraBackend
+from glider.modules.glider_camera import GliderCamera
+from glider.modules.glider_gps import GPSFix
+from glider.modules.glider_pilot import Pilot
+from glider.modules.glider_pwm_controller import GliderPWMController
+from glider.modules.glider_radio import GliderRadio
+from glider.modules.glider_runtime import EventLoop, GliderRuntime
+from glider.modules.glider_scheduler import StateScheduler
+from glider.modules.glider_telem import TelemetryHandler
+from glider.bench.fakes import FakeIMU, FakePCA9685
+
+
+class IdleState(object):
+    overrunPolicy = "skip"
+
+    def __init__(self, period):
+        self.sleepTime = period
+
+
+class FakeGPS(object):
+    data = GPSFix(54.45, -7.25, 1200.0, 5.0, 90.0, 5.0, 3.0, 3.0, None, 3, None)
+
+
+class IdleGlider(object):
+    """The modules a Glider runs, with a state that does nothing"""
+    commands_received = 0
+    last_command_dir = ""
+    current_state = "ASCENT"
+
+    def __init__(self, period, photo_path):
+        self.state = IdleState(period)
+        self.scheduler = StateScheduler()
+        self.running = True
+        self.ticks = 0
+        self.radio = GliderRadio(lambda msg_dict: None)
+        self.camera = GliderCamera(photo_path=photo_path, backend=FakeCameraBackend())
+        self.pwm_controller = GliderPWMController(pwm=FakePCA9685(), autostart=False)
+        self.pwm_controller.servo_init_position = lambda delay=0: None  # No 3s of centring
+        self.pilot = Pilot(FakeIMU())
+        self.telemetry_handler = TelemetryHandler(self.radio, FakeIMU(), self.pilot, FakeGPS(), self)
+
+    def start(self, threaded):
+        self.camera.start(threaded)
+        self.radio.start(threaded)
+        if threaded:
+            self.telemetry_handler.start()
+        self.pwm_controller.start(threaded)
+
+    def stop(self):
+        self.camera.stop()
+        self.radio.stop()
+        self.telemetry_handler.stop()
+        self.pwm_controller.threadAlive = False
+
+    def step(self, wait=True):
+        if wait:
+            self.scheduler.wait(self.current_state, self.state)
+        else:
+            delay = self.scheduler.delay(self.current_state, self.state)
+            if delay > 0:
+                return delay
+            self.scheduler.tick(self.state)
+        self.ticks += 1
+        return 0
+
+
+def measure(threaded, seconds, period, photo_path):
+    glider = IdleGlider(period, photo_path)
+    glider.start(threaded)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.time()
+    if threaded:
+        while time.time() - started < seconds:
+            glider.step()
+        wakeups = None
+    else:
+        loop = EventLoop()
+        GliderRuntime(glider, loop).start()
+        loop.run(until=loop.clock() + seconds)
+        wakeups = loop.wakeups
+        loop.close()
+    wall = time.time() - started
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    glider.stop()
+    time.sleep(2.5)  # The RHSerial thread's read timeout, so it is gone before the next run
+    return {
+        "ticks": glider.ticks,
+        "cpu_percent": (end.ru_utime + end.ru_stime - usage.ru_utime - usage.ru_stime) / wall * 100,
+        "wakeups_per_second": (end.ru_nvcsw - usage.ru_nvcsw) / wall,
+        "loop_passes_per_second": wakeups / wall if wakeups is not None else None,
+    }
+
+
+def run(seconds=5.0, period=1.0):
+    master, slave = os.openpty()
+    glider_config.set("radio", "port", os.ttyname(slave))
+    photo_path = tempfile.mkdtemp()
+    try:
+        return {
+            "threads": measure(True, seconds, period, photo_path),
+            "event_loop": measure(False, seconds, period, photo_path),
+        }
+    finally:
+        os.close(master)
+        os.close(slave)
+        shutil.rmtree(photo_path)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    period = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(logging.WARN)
+    results = run(seconds, period)
+    print "%.1fs idle, state period %ss" % (seconds, period)
+    for name in ["threads", "event_loop"]:
+        result = results[name]
+        print "%-10s %4d ticks %6.2f%% CPU %8.1f wakeups/s%s" % (
+            name, result["ticks"], result["cpu_percent"], result["wakeups_per_second"],
+            "" if result["loop_passes_per_second"] is None else
+            " (%.1f loop passes/s)" % result["loop_passes_per_second"])
+
+
+if __name__ == "__main__":
+    main()
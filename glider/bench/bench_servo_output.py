@@ -0,0 +1,78 @@
+"""
+Cost of getting flap scales out to the PCA9685 registers, before and after the pulse tables.
+
+    python -m glider.bench.bench_servo_output
+"""
+import math
+import timeit
+import logging
+
+from glider.modules.glider_pwm_controller import GliderPWMController
+from glider.bench.fakes import FakePCA9685
+
+LOG = logging.getLogger("glider.bench")
+
+
+def legacy_set_servo_angle(controller, servo_address, angle):
+    """The per-write work done before the pulse tables (float math, eager debug strings, 4 register writes)"""
+    min_ms = controller.servo_min_ms
+    max_ms = controller.servo_max_ms
+    angle = math.ceil(angle)
+    ms_range = float(max_ms - min_ms)
+    LOG.debug("Servo pulse ms range: %s" % ms_range)
+    angle_pulse = (angle/180.0 * ms_range)
+    LOG.debug("Angle fraction (%s = %s)" % (angle, angle_pulse))
+    pulse_width = int(4096/(1000/controller.frequency)*(min_ms + angle_pulse))
+    LOG.debug("Setting servo(%s) pulse (fraction=%s duration=%sms)" % (
+        servo_address, min_ms+angle_pulse, pulse_width))
+    controller.pwm.set_pwm(servo_address, controller.servo_pulse_lag, pulse_width + controller.servo_pulse_lag)
+
+
+def legacy_sweep(controller, scales):
+    """set_flap_scales + one pass of update_servo_angles as they were (every channel, every pass)"""
+    flap_angles = {}
+    for flap, scale in scales.items():
+        angle_range = controller.flap_ranges[flap]
+        flap_angles[flap] = angle_range[0] + scale*(angle_range[1]-angle_range[0])
+    for flap, angle in flap_angles.items():
+        legacy_set_servo_angle(controller, controller.flap_addresses[flap], angle)
+    for servo, angle in controller.servo_angles.items():
+        legacy_set_servo_angle(controller, controller.servo_addresses[servo], angle)
+    return len(flap_angles) + len(controller.servo_angles)
+
+
+def table_sweep(controller, scales):
+    """set_flap_scales + one pass of update_servo_angles with the pulse tables"""
+    controller.set_flap_scales(scales)
+    pulses = controller._desired_pulses()
+    changed = sum(1 for address, pulse in pulses.items() if controller._written_pulses.get(address) != pulse)
+    controller._write_changed_pulses(pulses)
+    return changed
+
+
+def run(number=5000):
+    """Cost per sweep for each path (every flap is moved on every sweep), I2C transactions are what cost on the Pi"""
+    controller = GliderPWMController(pwm=FakePCA9685(), autostart=False)
+    flaps = list(controller.flap_addresses)
+    sweeps = [dict((flap, ((i + n) % 100) / 100.0) for n, flap in enumerate(flaps)) for i in range(100)]
+    results = {}
+    for name, sweep in [("legacy", legacy_sweep), ("table", table_sweep)]:
+        state = {"i": 0, "writes": 0}
+
+        def run_sweep():
+            state["i"] += 1
+            state["writes"] += sweep(controller, sweeps[state["i"] % len(sweeps)])
+        controller.pwm._device.transactions = 0
+        seconds = min(timeit.repeat(run_sweep, number=number, repeat=3))
+        results[name] = {
+            "us_per_sweep": seconds / number * 1e6,
+            "writes_per_sweep": state["writes"] / float(state["i"]),
+            "i2c_per_sweep": controller.pwm._device.transactions / float(state["i"]),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in sorted(run().items()):
+        print("%-8s %7.2f us/sweep %4.1f channels written/sweep %5.1f i2c transactions/sweep" % (
+            name, result["us_per_sweep"], result["writes_per_sweep"], result["i2c_per_sweep"]))
@@ -0,0 +1,86 @@
+"""
+Size of the telemetry frames in the text and binary formats, and the most
+frames per second the radio link can carry in each.
+
+    python -m glider.bench.bench_telemetry [baud_rate]
+
+On the wire each byte costs 10 bits (8N1) and every frame carries the
+RHSerial framing (DLE STX, to/from/id/flags, DLE ETX, CRC, doubled DLEs).
+"""
+import sys
+import math
+import datetime
+
+from glider.modules import telem_codec
+from glider.modules.rhserial import build_frame
+from glider.modules.sat_radio import SatRadio
+
+FLAP_SCALES = {
+    "rudder": 0.44, "rear": 1.0, "left_near": 0.57, "right_near": 0.43,
+    "left_far": 0.57, "right_far": 0.43,
+}
+
+
+def text_glider_data():
+    # Same formatting as TelemetryHandler.send_glider_data / GliderRadio.send_data
+    data = [
+        "O:%2.1f_%2.1f_%2.1f" % (-12.3, -8.2, 137.9),
+        "W:%s" % ("_".join(["%1.2f" % float(x) for x in FLAP_SCALES.values()])),
+        "H:%s_%s" % (math.degrees(2.4), -10),
+        "G:%s_%s" % (12.35, 141.2),
+        "C:%s_%s" % (3, "DEST"),
+    ]
+    return "|".join(["D"] + data)
+
+
+def binary_glider_data():
+    return telem_codec.encode_glider_data(-12.3, -8.2, 137.9, FLAP_SCALES, math.degrees(2.4), -10,
+                                          12.35, 141.2, 3, "DEST")
+
+
+def telemetry_args():
+    return (datetime.time(12, 34, 56), 54.4512345, -7.2512345, 12.5, 2345.67, 54.5, -6.9, "FLIGHT")
+
+
+def text_telemetry():
+    radio = SatRadio.__new__(SatRadio)  # Only the formatting, no serial port
+    return radio._construct_telemetry("glider  ", 123, *telemetry_args())
+
+
+def binary_telemetry():
+    return telem_codec.encode_telemetry(123, *telemetry_args())
+
+
+def report(baud_rate=38400):
+    bytes_per_second = baud_rate / 10.0
+    frames = [
+        ("telemetry", "text", text_telemetry()),
+        ("telemetry", "binary", binary_telemetry()),
+        ("glider data", "text", text_glider_data()),
+        ("glider data", "binary", binary_glider_data()),
+    ]
+    results = []
+    for name, frame_format, payload in frames:
+        wire = len(build_frame(payload, to=0xFF, frm=0xAA, id=1))
+        results.append({
+            "frame": name,
+            "format": frame_format,
+            "payload_bytes": len(payload),
+            "wire_bytes": wire,
+            "max_frames_per_second": bytes_per_second / wire,
+        })
+    return results
+
+
+def main():
+    baud_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 38400
+    print "Link: %s baud = %d bytes/s" % (baud_rate, baud_rate / 10)
+    print "%-12s %-7s %8s %6s %10s" % ("frame", "format", "payload", "wire", "max/s")
+    for result in report(baud_rate):
+        print "%-12s %-7s %8d %6d %10.1f" % (
+            result["frame"], result["format"], result["payload_bytes"],
+            result["wire_bytes"], result["max_frames_per_second"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Stand-ins for the hardware so the hot paths can be timed on any machine
+"""
+import math
+
+from glider.modules.glider_imu import IMUSample
+from glider.modules.glider_clock import monotonic
+
+
+class FakeI2CDevice(object):
+    """Records register writes like Adafruit_GPIO.I2C.Device would send them"""
+
+    def __init__(self):
+        self.registers = {}
+        self.transactions = 0
+
+    def write8(self, register, value):
+        self.registers[register] = value
+        self.transactions += 1
+
+    def writeList(self, register, data):
+        for offset, value in enumerate(data):
+            self.registers[register + offset] = value
+        self.transactions += 1
+
+    def readU8(self, register):
+        self.transactions += 1
+        return self.registers.get(register, 0)
+
+
+class FakePCA9685(object):
+    """Same interface as Adafruit_PCA9685.PCA9685"""
+
+    def __init__(self):
+        self._device = FakeI2CDevice()
+
+    def set_pwm_freq(self, freq_hz):
+        self.frequency = freq_hz
+
+    def set_pwm(self, channel, on, off):
+        # The Adafruit driver writes the four registers one at a time
+        for offset, value in enumerate([on & 0xFF, on >> 8, off & 0xFF, off >> 8]):
+            self._device.write8(0x06 + 4 * channel + offset, value)
+
+
+class FakeSerial(object):
+    """
+    Plays back a recorded byte stream like a pyserial port would.
+    'buffered' is how many bytes the port has waiting for each read.
+    Calls on_empty() once the recording has all been read.
+    """
+
+    def __init__(self, data, buffered=64, on_empty=None):
+        self.data = bytes(data)
+        self.position = 0
+        self.buffered = buffered
+        self.on_empty = on_empty
+        self.reads = 0
+
+    def isOpen(self):
+        return True
+
+    def inWaiting(self):
+        return min(self.buffered, len(self.data) - self.position)
+
+    def read(self, size=1):
+        self.reads += 1
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        if self.position >= len(self.data) and self.on_empty:
+            self.on_empty()
+        return data
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeTransmitScheduler(object):
+    """Stands in for TransmitScheduler where only the packet sources are exercised"""
+
+    def __init__(self):
+        self.wakes = 0
+
+    def wake(self):
+        self.wakes += 1
+
+
+class FakeIMU(object):
+    """Same interface as glider_imu.IMU, the attitude wanders a little with every sample"""
+
+    def __init__(self):
+        self.seq = 0
+
+    def snapshot(self):
+        self.seq += 1
+        return IMUSample(math.sin(self.seq / 50.0) * 0.2, -0.1, math.cos(self.seq / 80.0), monotonic(), self.seq)
+
+    def is_stale(self, sample):
+        return False
@@ -0,0 +1,291 @@
+"""
+Hardware-free benchmarks of the hot paths, compared against stored baselines.
+
+    python -m glider.bench.suite                  # fails (exit 1) if anything regressed
+    python -m glider.bench.suite --update         # store the results as the baselines
+    python -m glider.bench.suite --tolerance 0.5 pilot rhserial
+
+Benchmarks are timed in microseconds per call. Baselines are kept in
+baselines.json for each machine type and Python version, as a Pi and a
+laptop can't be compared. The speed of the same machine drifts too (CPU
+frequency, other processes), so each timeit repeat of a benchmark is
+paired with one of a fixed reference workload, straight after it, and the
+comparison is of the benchmark relative to the reference: the median of
+the repeats, so one busy repeat doesn't move it. A result more than its
+tolerance slower than its baseline is timed again (twice, keeping the
+best) before it counts as a regression. Benchmarks of a few microseconds
+a call are noisier than the rest and have a larger tolerance of their own.
+"""
+import os
+import sys
+import json
+import shutil
+import timeit
+import logging
+import argparse
+import platform
+import tempfile
+
+from glider.modules.glider_pilot import Pilot
+from glider.modules.glider_pwm_controller import GliderPWMController
+from glider.modules.glider_radio import GliderRadio
+from glider.modules.image_downlink import ImageDownlink
+from glider.modules.rhserial import RHSerial, FrameDecoder
+from glider.modules.sat_radio import SatRadio
+from glider.bench.fakes import FakeIMU, FakePCA9685, FakeSerial, FakeTransmitScheduler
+from glider.bench.bench_rhserial import recorded_stream
+from glider.bench.bench_servo_output import table_sweep
+from glider.bench.bench_telemetry import telemetry_args
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+TOLERANCE = 0.25  # For the benchmarks that don't set their own
+MIN_REPEAT_TIME = 0.2  # Seconds, calls per repeat are raised until a repeat takes at least this long
+REPEATS = 7
+CONFIRM_RUNS = 2  # Extra runs of a benchmark that looks like it regressed
+
+BENCHMARKS = []  # (name, setup), setup(directory) returns the function to time
+TOLERANCES = {}  # name: tolerance, of the benchmarks with their own
+
+
+def benchmark(name, tolerance=None):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        if tolerance is not None:
+            TOLERANCES[name] = tolerance
+        return setup
+    return register
+
+
+@benchmark("pilot.update_flap_angles")
+def pilot_flap_angles(directory):
+    return Pilot(FakeIMU()).update_flap_angles
+
+
+@benchmark("pilot.convert_angle_to_scale", tolerance=0.4)
+def pilot_angle_to_scale(directory):
+    pilot = Pilot(FakeIMU())
+    return lambda: pilot.convert_angle_to_scale(0.3)
+
+
+@benchmark("pilot.update_desired_heading")
+def pilot_desired_heading(directory):
+    pilot = Pilot(FakeIMU())
+    pilot.location = [54.45, -7.25]
+    return pilot.update_desired_heading
+
+
+def _sweeps(controller):
+    flaps = list(controller.flap_addresses)
+    return [dict((flap, ((i + n) % 100) / 100.0) for n, flap in enumerate(flaps)) for i in range(100)]
+
+
+@benchmark("pwm.set_flap_scales", tolerance=0.4)
+def pwm_set_flap_scales(directory):
+    controller = GliderPWMController(pwm=FakePCA9685(), autostart=False)
+    sweeps = _sweeps(controller)
+    state = {"i": 0}
+
+    def set_flap_scales():
+        state["i"] += 1
+        controller.set_flap_scales(sweeps[state["i"] % len(sweeps)])
+    return set_flap_scales
+
+
+@benchmark("pwm.servo_output")
+def pwm_servo_output(directory):
+    # set_flap_scales and one pass of the servo thread, every flap moves
+    controller = GliderPWMController(pwm=FakePCA9685(), autostart=False)
+    sweeps = _sweeps(controller)
+    state = {"i": 0}
+
+    def servo_output():
+        state["i"] += 1
+        table_sweep(controller, sweeps[state["i"] % len(sweeps)])
+    return servo_output
+
+
+@benchmark("rhserial.send", tolerance=0.4)
+def rhserial_send(directory):
+    radio = RHSerial.__new__(RHSerial)  # No serial port
+    radio.serial = FakeSerial(b"")
+    radio.address = 0xAA
+    payload = "D|O:-12.3_-8.2_137.9|W:0.44_1.00_0.57_0.43_0.57_0.43|H:137.5_-10|G:12.35_141.2|C:3_DEST"
+    return lambda: radio.send(payload, to=0x01, id=7)
+
+
+@benchmark("rhserial.decode_100_frames")
+def rhserial_decode(directory):
+    stream = recorded_stream(100)
+    return lambda: FrameDecoder().feed(stream)
+
+
+@benchmark("satradio.construct_telemetry", tolerance=0.4)
+def satradio_telemetry(directory):
+    radio = SatRadio.__new__(SatRadio)  # Only the formatting, no serial port
+    telemetry = telemetry_args()
+    return lambda: radio._construct_telemetry("glider  ", 123, *telemetry)
+
+
+@benchmark("radio.send_image_40k")
+def radio_send_image(directory):
+    # sendImage and taking every chunk packet of a downlink sized image off the downlink
+    path = os.path.join(directory, "low.jpg")
+    with open(path, "wb") as image:
+        image.write(os.urandom(40 * 1024))
+    radio = GliderRadio.__new__(GliderRadio)  # No serial port or scheduler thread
+    radio.image_downlink = ImageDownlink(0x01, chunk_size=165, keep_transfers=4)
+    radio.tx_scheduler = FakeTransmitScheduler()
+
+    def send_image():
+        radio.sendImage(path)
+        while radio.image_downlink.next_packet() is not None:
+            pass
+    return send_image
+
+
+def reference():
+    """Plain Python work (calls, allocation, string formatting, sorting) to compare the benchmarks against"""
+    return sorted("%s" % (i * 7 % 100) for i in range(100))
+
+
+def calls_per_repeat(function):
+    """Enough calls for a repeat to take at least MIN_REPEAT_TIME"""
+    number = 1
+    while True:
+        seconds = timeit.timeit(function, number=number)
+        if seconds >= MIN_REPEAT_TIME:
+            return number
+        number *= 2 if seconds > MIN_REPEAT_TIME / 10 else 10
+
+
+def _relative(result):
+    return result["us"] / result["reference_us"]
+
+
+def time_call(function, reference_number):
+    """
+    {"us": us per call, "reference_us": us per reference() call} of the
+    repeat with the median time relative to the reference
+    """
+    number = calls_per_repeat(function)
+    timings = []
+    for _ in range(REPEATS):
+        us = timeit.timeit(function, number=number) / number * 1e6
+        reference_us = timeit.timeit(reference, number=reference_number) / reference_number * 1e6
+        timings.append({"us": us, "reference_us": reference_us})
+    timings.sort(key=_relative)
+    return timings[len(timings) // 2]
+
+
+def run(names=None, runs=1):
+    """
+    {benchmark: {"us": us per call, "reference_us": us per reference() call}}
+    for the benchmarks whose names start with one of 'names' (all by
+    default), the best (relative to the reference) of 'runs'
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        results = {}
+        reference_number = calls_per_repeat(reference)
+        for name, setup in BENCHMARKS:
+            if not names or any(name.startswith(prefix) for prefix in names):
+                function = setup(directory)
+                timings = [time_call(function, reference_number) for _ in range(runs)]
+                results[name] = min(timings, key=_relative)
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def machine_key():
+    return "%s-python%s" % (platform.machine(), platform.python_version())
+
+
+def tolerance_for(name, tolerance=None):
+    """'tolerance' if set, otherwise the benchmark's own"""
+    if tolerance is not None:
+        return tolerance
+    return TOLERANCES.get(name, TOLERANCE)
+
+
+def compare(results, baselines, tolerance=None):
+    """
+    [(name, us per call, change relative to the reference or None, status)],
+    status is ok, regressed, faster or new. Each benchmark has its own
+    tolerance unless 'tolerance' is given.
+    """
+    comparison = []
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name)
+        change = None
+        if baseline is None:
+            status = "new"
+        else:
+            change = _relative(result) / _relative(baseline) - 1
+            if change > tolerance_for(name, tolerance):
+                status = "regressed"
+            elif change < -tolerance_for(name, tolerance):
+                status = "faster"
+            else:
+                status = "ok"
+        comparison.append((name, result["us"], change, status))
+    return comparison
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baselines_file:
+        return json.load(baselines_file)
+
+
+def save_baselines(baselines, path=BASELINES):
+    with open(path, "w") as baselines_file:
+        json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths against fake hardware")
+    parser.add_argument("names", nargs="*", help="Only the benchmarks starting with these")
+    parser.add_argument("--update", action="store_true", help="Store the results as this machine's baselines")
+    parser.add_argument("--tolerance", type=float,
+                        help="Fraction slower than the baseline that is a regression, for every benchmark "
+                             "(default %s, or the benchmark's own)" % TOLERANCE)
+    parser.add_argument("--baselines", default=BASELINES)
+    args = parser.parse_args(argv)
+    # Log like a flight (warnings and up), without writing anything
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(logging.WARN)
+
+    key = machine_key()
+    all_baselines = load_baselines(args.baselines)
+    baselines = all_baselines.get(key, {})
+    results = run(args.names)
+    suspects = [name for name, _, _, status in compare(results, baselines, args.tolerance) if status == "regressed"]
+    if suspects:
+        for name, result in run(suspects, CONFIRM_RUNS).items():
+            if name in suspects:
+                results[name] = min(results[name], result, key=_relative)
+    comparison = compare(results, baselines, args.tolerance)
+    print key
+    for name, us, change, status in comparison:
+        print "%-32s %10.2f us %8s (+-%d%%)  %s" % (
+            name, us, "-" if change is None else "%+.0f%%" % (change * 100),
+            tolerance_for(name, args.tolerance) * 100, status)
+    if args.update:
+        baselines.update((name, dict((key, round(us, 3)) for key, us in result.items()))
+                         for name, result in results.items())
+        all_baselines[key] = baselines
+        save_baselines(all_baselines, args.baselines)
+        print "Baselines updated: %s" % args.baselines
+        return 0
+    regressed = [name for name, _, _, status in comparison if status == "regressed"]
+    if regressed:
+        print "Regressed: %s" % ", ".join(regressed)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
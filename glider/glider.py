@@ -1,4 +1,3 @@
-import glob
 import os
 import logging
 import logging.config
@@ -15,16 +14,28 @@ logging.config.fileConfig(conf_path)
 LOG = logging.getLogger("glider")
 logging.getLogger("Adafruit_I2C").setLevel(logging.WARN)
 
+from modules import glider_logging
+glider_logging.configure()
+HOT_LOG = glider_logging.HotLog(LOG)
+
 #########################################
 # Import glider modules and states
 #########################################
 from modules.glider_gps import GPS
 from modules.glider_camera import GliderCamera
+from modules.media_catalog import LOW
 from modules.glider_imu import IMU
 from modules.glider_pilot import Pilot
 from modules.glider_pwm_controller import GliderPWMController
 from modules.glider_radio import GliderRadio
 from modules.glider_telem import TelemetryHandler
+from modules.glider_scheduler import StateScheduler
+from modules.glider_clock import monotonic
+from modules.flight_recorder import open_recorder, set_recorder
+from modules.glider_speech import open_speaker
+from modules.glider_metrics import METRICS, now, open_metrics_server
+from modules.glider_runtime import GliderRuntime
+from modules import glider_config
 
 import glider_states as gstates
 
@@ -34,6 +45,8 @@ import glider_states as gstates
 ##########################################
 class GliderCommandMixin(object):
     COMMAND_DIRECTIVES = None
+    COMMAND_PHRASES = ["Updating pitch", "Updating severity", "Updating destination", "Updating route",
+                       "Sending image"]
     commands_received = 0
     last_command_dir = ""
 
@@ -43,12 +56,17 @@ class GliderCommandMixin(object):
             "O": self.state_change,
             "TS": self.turn_severity_change,
             "DEST": self.destination_change,
+            "ROUTE": self.route_change,
             "IMAGE": self.image_command,
+            "RESEND": self.resend_command,
+            "STATS": self.stats_command,
         }
 
     def command_handler(self, msg_dict, **kwargs):
         LOG.info("Handling command: %s %s" % (msg_dict, kwargs))
         command_data = str(msg_dict['message'])
+        self.recorder.record_command(command_data)
+        METRICS.increment("commands")
         command_parts = command_data.split("|")
         command_instruction = command_parts[0]
         command_function = self.COMMAND_DIRECTIVES.get(command_instruction)
@@ -93,10 +111,40 @@ class GliderCommandMixin(object):
         self.speak("Updating destination")
         self.pilot.update_destination(lat, lon)
 
+    def route_change(self, arg_array):
+        # ROUTE|<lat>,<lon>|<lat>,<lon>|... waypoints in the order to fly them
+        waypoints = [waypoint.split(",") for waypoint in arg_array[1:] if waypoint]
+        self.speak("Updating route")
+        self.pilot.set_route(waypoints)
+
     def image_command(self, arg_array):
+        # IMAGE sends the newest low image not sent yet, IMAGE|<unix time> the low image nearest that time
+        if len(arg_array) > 1 and arg_array[1]:
+            image = self.camera.catalog.nearest(LOW, float(arg_array[1]))
+        else:
+            image = self.camera.catalog.newest(LOW, unsent=True)
+        if image is None:
+            LOG.error("No image to send")
+            return None
         self.speak("Sending image")
-        newest_image = max(glob.iglob('%s/low_*.jpg' % self.camera.photo_path), key=os.path.getctime)
-        self.radio.sendImage(newest_image)
+        path, offset, length = self.camera.locate(image.path)
+        transfer_id = self.radio.sendImage(path, offset, length, os.path.basename(image.path))
+        if transfer_id is not None:
+            self.camera.catalog.mark_sent(image.path)
+        return transfer_id
+
+    def resend_command(self, arg_array):
+        # RESEND|<transfer id>|<chunk indices, e.g. 1,5,7-9>
+        transfer_id = int(arg_array[1])
+        self.radio.resend_image_chunks(transfer_id, arg_array[2])
+
+    def stats_command(self, arg_array):
+        # STATS replies with p50/p99/max of each timed stage and the counters, STATS|<page> with the
+        # page after the first when that doesn't fit in one message
+        page = int(arg_array[1]) if len(arg_array) > 1 and arg_array[1] else 1
+        summary = METRICS.summary(page)
+        self.telemetry_handler.set_message(summary)
+        return summary
 
 
 class Glider(GliderCommandMixin):
@@ -114,30 +162,52 @@ class Glider(GliderCommandMixin):
         "TEST_RELEASE": gstates.test_release(),
     }
     current_state = "FLIGHT"
+    gps_record_interval = 1  # Seconds between GPS records in the flight recorder
 
-    def __init__(self):
-        # Initialize all modules
+    def __init__(self, gps=None, imu=None, radio=None, camera=None, pwm_controller=None, recorder=None,
+                 speaker=None):
+        # Initialize all modules (the simulator passes in stand-ins for the hardware)
+        self.speaker = speaker or open_speaker()
         self.speak("Initializing")
-        self.gps = GPS()
-        self.imu = IMU()
-        self.radio = GliderRadio(self.command_handler)
-        self.camera = GliderCamera()
-        self.pwm_controller = GliderPWMController()
+        # First, so everything after can record to it
+        self.recorder = recorder or open_recorder()
+        set_recorder(self.recorder)
+        self.recorded_state = None
+        self.recorded_pilot = None
+        self.recorded_imu_seq = None
+        self.last_gps_record = None
+        self.gps = gps or GPS()
+        self.imu = imu or IMU()
+        self.radio = radio or GliderRadio(self.command_handler)
+        self.camera = camera or GliderCamera()
+        self.pwm_controller = pwm_controller or GliderPWMController(autostart=False)
+        self.state_machine["RECOVER"].setup_siren()
         # The pilot and telemetry handler need access to the instances we created
         self.pilot = Pilot(self.imu)
         self.telemetry_handler = TelemetryHandler(self.radio, self.imu, self.pilot, self.gps, self)
+        # Runs each state's execute() at its own rate against monotonic deadlines
+        self.scheduler = StateScheduler()
+        # Everything but the GPS, speech and metrics on one thread (see glider_runtime) rather than a thread each
+        self.event_loop = glider_config.getboolean("runtime", "event_loop")
+        self.metrics_server = open_metrics_server()
         self.start_modules()
         self.setup_command_directives()
         self.speak("IKAHRO ready")
+        self.speaker.prerender(self.fixed_phrases())
 
     def start_modules(self):
         # Start up modules
         self.speak("Starting modules")
+        threaded = not self.event_loop
+        # First, so the image encoder processes are forked before the modules' threads start. The log
+        # writer and speech threads already run, the encoders set their logging up again (after_fork)
+        self.camera.start(threaded)
         self.gps.start()
-        self.radio.start()
-        self.camera.start()
-        self.telemetry_handler.start()
-        self.pwm_controller.start()
+        self.radio.start(threaded)
+        if threaded:
+            self.telemetry_handler.start()
+        self.pwm_controller.start(threaded)
+        self.metrics_server.start()
 
     def stop_modules(self):
         self.speak("Stopping modules")
@@ -146,42 +216,106 @@ class Glider(GliderCommandMixin):
         self.camera.stop()
         self.telemetry_handler.stop()
         self.pwm_controller.stop()
+        self.metrics_server.stop()
 
     def stop(self):
         self.speak("Shutting down")
         self.stop_modules()
+        self.recorder.close()
+        self.speaker.stop()
+        glider_logging.stop_async_logging()
+
+    def speak(self, text, alarm=False, topic=None):
+        # Queued for the speaker's thread, see glider_speech.Speaker for alarm and topic
+        self.speaker.say(text, alarm, topic)
+
+    def fixed_phrases(self):
+        """What is said over and over, for the speaker to render ahead of time"""
+        phrases = list(self.COMMAND_PHRASES)
+        for state_name, state in sorted(self.state_machine.items()):
+            phrases.append("Switching state to %s" % state_name)
+            phrases.append("Updating state: %s" % state_name)
+            phrases.extend(state.phrases)
+        return phrases
 
-    def speak(self, text):
-        LOG.info("Speaking %s" % text)
-        with open(os.devnull, "w") as f:
-            subprocess.Popen(["espeak", "-ven-us", "-m", "-p", "70", "-s", "180", text], stdout=f, stderr=f)
+    def play_sound(self, command):
+        return subprocess.Popen(command)
+
+    def record_state(self):
+        # Commands change the state from the radio thread too, so compare rather than record at each change
+        if self.current_state != self.recorded_state:
+            self.recorder.record_state(self.recorded_state, self.current_state)
+            self.recorded_state = self.current_state
+
+    def record_flight_data(self):
+        """What the pilot saw and decided this tick, for the flight recorder"""
+        # The sample the pilot acted on, the IMU is only read here if the state didn't fly
+        sample = self.pilot.last_sample or self.imu.snapshot()
+        if sample.seq != self.recorded_imu_seq:
+            self.recorder.record_imu(sample)
+            self.recorded_imu_seq = sample.seq
+        pilot = (self.pilot.desired_yaw, self.pilot.desired_pitch_deg)
+        if pilot != self.recorded_pilot:
+            self.recorder.record_pilot(*pilot)
+            self.recorded_pilot = pilot
+        self.recorder.record_flaps(self.pilot.flap_angle_scales)
+        now = monotonic()
+        if self.last_gps_record is None or now - self.last_gps_record >= self.gps_record_interval:
+            self.recorder.record_gps(self.gps.data)
+            self.last_gps_record = now
 
     def run_state_machine(self):
         self.running = True
+        if self.event_loop:
+            GliderRuntime(self).run()
+            return
         while self.running:
-            try:
-                LOG.debug("Current state: %s" % self.current_state)
-                stateClass = self.state_machine[self.current_state]
-                stateClass.rest()
-                stateClass.execute(self)
-
-                # Check if we switch
-                newState = stateClass.switch()
-                LOG.debug("New state: %s" % newState)
-
-                # Switch in to new state
-                if newState:
-                    LOG.debug("State is changing from (%s) to (%s)" % (
-                        self.current_state, newState))
-                    self.speak("Switching state to %s" % newState)
-                    self.current_state = newState
-
-            except KeyboardInterrupt:
-                self.stop()
-                raise # Don't go to error state, close the program!
-            except:
-                LOG.exception("Error in Glider state machine")
-                self.current_state = "ERROR"
+            self.step()
+
+    def step(self, wait=True):
+        """
+        Wait for the current state's next tick, execute it and switch state if it is done.
+        Without wait it returns the seconds until the tick is due instead of waiting for it,
+        0 once it has run.
+        """
+        try:
+            HOT_LOG.debug("Current state: %s", self.current_state)
+            stateClass = self.state_machine[self.current_state]
+            self.record_state()
+            if wait:
+                self.scheduler.wait(self.current_state, stateClass)
+            else:
+                delay = self.scheduler.delay(self.current_state, stateClass)
+                if delay > 0:
+                    return delay
+                self.scheduler.tick(stateClass)
+            started = now()
+            self.pilot.last_sample = None
+            stateClass.execute(self)
+            self.record_flight_data()
+            METRICS.observe("state.%s" % self.current_state, now() - started)
+
+            # Check if we switch
+            newState = stateClass.switch()
+            HOT_LOG.debug("New state: %s", newState)
+
+            # Switch in to new state
+            if newState:
+                started = now()
+                LOG.debug("State is changing from (%s) to (%s)" % (
+                    self.current_state, newState))
+                self.speak("Switching state to %s" % newState, topic="state")
+                self.current_state = newState
+                self.record_state()
+                METRICS.observe("transition", now() - started)
+            return 0
+
+        except KeyboardInterrupt:
+            self.stop()
+            raise # Don't go to error state, close the program!
+        except:
+            LOG.exception("Error in Glider state machine")
+            self.current_state = "ERROR"
 
 
 if __name__ == '__main__':
@@ -1,10 +1,9 @@
 import math
-import time
 import logging
-import subprocess
-import RPi.GPIO as GPIO
 
 from config import glider_config
+from modules import glider_clock as clock
+from modules.glider_scheduler import SKIP, CATCH_UP
 LOG = logging.getLogger("glider.states")
 
 
@@ -20,10 +19,10 @@ class gliderState(object):
         self.readyToSwitch = False
         self.nextState = None
         self.exitState = ""
-        self.sleepTime = 1 # How long to sleep between execute() calls
-
-    def rest(self):
-        time.sleep(self.sleepTime)
+        self.sleepTime = 1 # Period between execute() calls
+        self.overrunPolicy = SKIP # What the scheduler does when execute() runs late (SKIP or CATCH_UP)
+        self.phrases = [] # What the state says, rendered ahead of time so it plays without synthesis
+        self.blocking = False # execute() sleeps for seconds, the event loop runs it on a worker (see glider_runtime)
 
     def execute(self, glider_instance):
         raise NotImplementedError("Execute function is required")
@@ -48,6 +47,9 @@ class packaging(gliderState):
         super(packaging, self).__init__()
         self.nextState = "HEALTH_CHECK"
         self.sleepTime = 5
+        self.blocking = True
+        self.phrases = ["Prepare Release Rod", "Open in 3 seconds", "Close in 3 seconds", "Prepare Parachute",
+                        "Close in 20 seconds", "Wing test"] + ["Scale %s" % scale for scale in [0, 0.5, 1]]
 
     def execute(self, glider_instance):
         self.wing_test(glider_instance)
@@ -57,35 +59,35 @@ class packaging(gliderState):
 
     def prepare_release(self, glider_instance):
         glider_instance.speak("Prepare Release Rod")
-        time.sleep(2)
+        clock.sleep(2)
         glider_instance.speak("Open in 3 seconds")
-        time.sleep(4)
+        clock.sleep(4)
         glider_instance.pwm_controller.release_from_balloon()
         glider_instance.speak("Close in 3 seconds")
-        time.sleep(4)
+        clock.sleep(4)
         glider_instance.pwm_controller.release_from_balloon(reset=True)
 
     def prepare_parachute(self, glider_instance):
         glider_instance.speak("Prepare Parachute")
-        time.sleep(2)
+        clock.sleep(2)
         glider_instance.speak("Open in 3 seconds")
-        time.sleep(4)
+        clock.sleep(4)
         glider_instance.pwm_controller.release_parachute()
         glider_instance.speak("Close in 20 seconds")
-        time.sleep(21)
+        clock.sleep(21)
         glider_instance.pwm_controller.release_parachute(reset=True)
 
     def wing_test(self, glider_instance):
         glider_instance.speak("Wing test")
-        time.sleep(1)
+        clock.sleep(1)
         for scale in [0.5, 0, 0.5, 1, 0.5]:
-            glider_instance.speak("Scale %s" % scale)
-            time.sleep(1)
+            glider_instance.speak("Scale %s" % scale, topic="wing test")
+            clock.sleep(1)
             glider_instance.pwm_controller.set_flap_scales({
                 'left_near': scale, 'right_near': scale,
                 'left_far': scale, 'right_far': scale
             })
-        time.sleep(1)
+        clock.sleep(1)
 
 #-----------------------------------
 #         Health Check
@@ -95,12 +97,13 @@ class healthCheck(gliderState):
         super(healthCheck, self).__init__()
         self.nextState = "ASCENT"
         self.sleepTime = 5
+        self.phrases = ["Waiting for GPS"]
 
     def execute(self, glider_instance):
         # Get the location data, figure if locked
         location = glider_instance.gps.data
-        max_error = max(location.epx, location.epy)
-        locationLocked = max_error < 50
+        max_error = location.max_error
+        locationLocked = location.has_fix and max_error < 50
         # Get battery data. Figure if healthy
         if not locationLocked:
             glider_instance.speak("Waiting for GPS")
@@ -132,7 +135,7 @@ class ascent(gliderState):
         LOG.info("Checking alt (%s) > target (%s)" % (
             self.location.alt, self.desiredAltitude
         ))
-        if type(self.location.alt) == float and self.location.alt > self.desiredAltitude:
+        if self.location.alt is not None and self.location.alt > self.desiredAltitude:
             self.readyToSwitch = True
         return super(ascent, self).switch()
         
@@ -145,15 +148,16 @@ class release(gliderState):
         self.nextState = "FLIGHT"
         self.song_cmd = ["mpg321", "/opt/glider/release_song.mp3", "-q"]
         self.releaseDelay = 144
+        self.blocking = True
 
     def execute(self, glider_instance):
         LOG.info("Playing song")
         glider_instance.camera.take_video(300)
-        song = subprocess.Popen(self.song_cmd)
-        time.sleep(self.releaseDelay)
+        song = glider_instance.play_sound(self.song_cmd)
+        clock.sleep(self.releaseDelay)
         LOG.info("Releasing cable")
         glider_instance.pwm_controller.release_from_balloon()
-        time.sleep(5)
+        clock.sleep(5)
         song.kill()
         self.readyToSwitch = True
 
@@ -167,32 +171,34 @@ class glide(gliderState):
         self.parachute_height = glider_config.getfloat("mission", "parachute_height")
         self.location = None
         self.sleepTime = glider_config.getfloat("flight", "wing_update_interval")
-        self.recalculation_timestamp_location = 0 # Counter to reduce CPU load
+        self.recalculation_timestamp_location = None # Counter to reduce CPU load, None until the first refresh
         self.recalculation_interval_location = glider_config.getfloat("flight", "location_refresh_interval")
 
     def execute(self, glider_instance):
-        now = time.time()
+        now = clock.monotonic()
 
         # Check if we need to recalculate a bearing to our destination
-        if now - self.recalculation_timestamp_location > self.recalculation_interval_location :
+        if (self.recalculation_timestamp_location is None or
+                now - self.recalculation_timestamp_location > self.recalculation_interval_location):
             self.recalculation_timestamp_location = now
             self.location = glider_instance.gps.data # Get our new location
-            if self.location.lat == "n/a": # Ensure that the latitude is a value before continuing
+            if not self.location.has_fix: # Ensure that we have a position before continuing
                 LOG.error("Bad location, course unchanged")
-            elif self.location.track == "0.0" or self.location.speed < 10: # Check that we have a heading and speed
+            elif self.location.track is None or self.location.speed is None or self.location.speed < 10: # Check that we have a heading and speed
                 LOG.error("Bad heading or speed too low, orientation uncorrected (track:%s)" % self.location.track)
             else:
                 glider_instance.imu.correct_heading(self.location.track)
                 glider_instance.pilot.update_location(self.location.lat, self.location.lon) # Update the desired heading
 
-        # Update the desired pitch relative to current speed (GPS)
-        glider_instance.pilot.scale_pitch_for_speed(self.location.speed)
+        # Update the desired pitch relative to current speed (GPS), unchanged until there is a speed
+        if self.location is not None and self.location.speed is not None:
+            glider_instance.pilot.scale_pitch_for_speed(self.location.speed)
         # Update the servos
         flap_scale_dict = glider_instance.pilot.update_flap_angles()
         # Set the flaps to the flap_angle_dict
         glider_instance.pwm_controller.set_flap_scales(flap_scale_dict)
         # Check if we're ready to switch
-        if (self.location and self.location.alt and type(self.location.alt) == float and self.location.alt < self.parachute_height):
+        if self.location is not None and self.location.alt is not None and self.location.alt < self.parachute_height:
             self.readyToSwitch = True
 
 #-----------------------------------
@@ -203,6 +209,7 @@ class parachute(gliderState):
         super(parachute, self).__init__()
         self.nextState = "RECOVER"
         self.sleepTime = glider_config.getfloat("flight", "wing_update_interval")
+        self.overrunPolicy = CATCH_UP # chute_delay counts executions, so don't drop any
         self.chute_delay = glider_config.getfloat("mission", "dive_time_before_chute")
 
     def execute(self, glider_instance):
@@ -228,25 +235,34 @@ class recovery(gliderState):
         super(recovery, self).__init__()
         self.nextState = "RECOVER"
         self.sleepTime = 15
+        self.blocking = True
         self.contact_detail = glider_config.get("mission", "contact_detail")
         self.siren_duration = glider_config.getint("mission", "siren_duration")
         self.siren_pin = glider_config.getint("mission", "siren_pin")
-        self.setup_siren()
+        self.gpio = None # RPi.GPIO, set up by setup_siren() (the simulator puts a stand-in here)
+        self.help_phrase = "Please help me! Contact %s" % self.contact_detail
+        self.silence_phrase = "Disconnect the Green Blue exposed jumper leads to silence alarm"
+        self.phrases = [self.help_phrase, self.silence_phrase]
 
     def setup_siren(self):
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.siren_pin, GPIO.OUT)
+        if self.gpio is None:
+            import RPi.GPIO as GPIO # Only importable on the Pi
+            self.gpio = GPIO
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.siren_pin, self.gpio.OUT)
 
     def execute(self, glider_instance):
-        GPIO.output(self.siren_pin, GPIO.HIGH)
-        time.sleep(self.siren_duration)
-        GPIO.output(self.siren_pin, GPIO.LOW)
-        time.sleep(3)
+        if self.gpio is None:
+            self.setup_siren()
+        self.gpio.output(self.siren_pin, self.gpio.HIGH)
+        clock.sleep(self.siren_duration)
+        self.gpio.output(self.siren_pin, self.gpio.LOW)
+        clock.sleep(3)
         for i in range(3):
-            glider_instance.speak("Please help me! Contact %s" % self.contact_detail)
-            time.sleep(10)
-        glider_instance.speak("Disconnect the Green Blue exposed jumper leads to silence alarm")
-        time.sleep(10)
+            glider_instance.speak(self.help_phrase, alarm=True)
+            clock.sleep(10)
+        glider_instance.speak(self.silence_phrase, alarm=True)
+        clock.sleep(10)
 
     def switch(self):
         pass
@@ -280,11 +296,12 @@ class test_chute(gliderState):
         self.nextState = "RECOVER"
         self.sleepTime = glider_config.getfloat("flight", "wing_update_interval")
         self.chute_deploy_delay = glider_config.getfloat("test_chute", "chute_delay_time")
+        self.phrases = ["Parachute test"] + [str(i) for i in range(int(math.ceil(self.chute_deploy_delay)) + 1)]
         self.deploy_init_timestamp = None
         self.spoken_integer = -1
 
     def execute(self, glider_instance):
-        now = time.time()
+        now = clock.monotonic()
         if not self.deploy_init_timestamp:
             self.readyToSwitch = False
             glider_instance.pwm_controller.release_parachute(reset=True)
@@ -302,7 +319,7 @@ class test_chute(gliderState):
         # Convert the times to a countdown
         delay_sec = int(math.ceil(self.chute_deploy_delay - (now - self.deploy_init_timestamp)))
         if delay_sec != self.spoken_integer:
-            glider_instance.speak(str(delay_sec))
+            glider_instance.speak(str(delay_sec), topic="countdown")
         self.spoken_integer = delay_sec
 
         # Check if we're ready to switch
@@ -320,11 +337,12 @@ class test_release(gliderState):
         self.nextState = "RECOVER"
         self.sleepTime = glider_config.getfloat("flight", "wing_update_interval")
         self.deploy_delay = glider_config.getfloat("test_release", "release_delay_time")
+        self.phrases = ["Release test"] + [str(i) for i in range(int(math.ceil(self.deploy_delay)) + 1)]
         self.deploy_init_timestamp = None
         self.spoken_integer = -1
 
     def execute(self, glider_instance):
-        now = time.time()
+        now = clock.monotonic()
         if not self.deploy_init_timestamp:
             self.readyToSwitch = False
             glider_instance.pwm_controller.release_from_balloon(reset=True)
@@ -338,7 +356,7 @@ class test_release(gliderState):
         # Convert the times to a countdown
         delay_sec = int(math.ceil(self.deploy_delay - (now - self.deploy_init_timestamp)))
         if delay_sec != self.spoken_integer:
-            glider_instance.speak(str(delay_sec))
+            glider_instance.speak(str(delay_sec), topic="countdown")
         self.spoken_integer = delay_sec
 
         # Check if we're ready to switch
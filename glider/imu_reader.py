@@ -4,9 +4,10 @@ sys.path.append('.')
 import RTIMU
 import os.path
 import time
-import redis
 
 from config import glider_config
+from modules.glider_clock import monotonic
+from modules.imu_transport import get_transport
 SETTINGS_FILE = glider_config.get("imu", "conf_path")
 
 print("Using settings file " + SETTINGS_FILE + ".ini")
@@ -24,11 +25,8 @@ if (not imu.IMUInit()):
 else:
     print("IMU Init Succeeded")
 
-redis_client = redis.StrictRedis(
-    host=glider_config.get("redis_client", "host"),
-    port=glider_config.get("redis_client", "port"),
-    db=glider_config.get("redis_client", "db")
-)
+transport = get_transport(writer=True)
+print("Publishing samples over %s" % glider_config.get("imu", "transport"))
 
 # this is a good time to set any fusion parameters
 imu.setSlerpPower(0.02)
@@ -39,11 +37,24 @@ imu.setCompassEnable(True)
 poll_interval = imu.IMUGetPollInterval()
 
 print("Recommended Poll Interval: %dmS\n" % poll_interval)
+# Track the achieved publish rate against what the poll interval allows
+rate_report_interval = glider_config.getfloat("imu", "rate_report_interval")
+rate_window_start = monotonic()
+rate_window_count = 0
+seq = 0
 while True:
   if imu.IMURead():
     r,p,y = imu.getFusionData()
-    redis_client.set("roll", r)
-    redis_client.set("pitch", p)
-    redis_client.set("yaw", y)
-
-    time.sleep(poll_interval*1.0/1000.0)
\ No newline at end of file
+    seq += 1
+    # Publish the whole sample at once so readers never see a mix of two samples
+    transport.publish(r, p, y, monotonic(), seq)
+
+    rate_window_count += 1
+    rate_window_elapsed = monotonic() - rate_window_start
+    if rate_window_elapsed > rate_report_interval:
+      print("Published %.1f samples/s (poll interval allows %.1f/s)" % (
+        rate_window_count / rate_window_elapsed, 1000.0 / poll_interval))
+      rate_window_start = monotonic()
+      rate_window_count = 0
+
+    time.sleep(poll_interval*1.0/1000.0)
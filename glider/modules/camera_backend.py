@@ -0,0 +1,202 @@
+import io
+import logging
+
+from PIL import Image
+from . import glider_config
+from . import glider_clock
+from .image_encoder import RawFrame
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+MODES = {
+    "low": (640, 480),
+    "high": (1296, 972),
+    "video": (1296, 972),
+}
+
+
+def raw_buffer_size(size):
+    """Unencoded captures are padded to a width multiple of 32 and a height multiple of 16"""
+    width, height = size
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+
+class CameraBackend(object):
+    """
+    A camera session. open() once, then capture/record as often as needed;
+    set_mode() switches resolution without closing the session.
+    'output' is a file path or a writable file object (e.g. io.BytesIO).
+    """
+    mode = None
+
+    def open(self):
+        raise NotImplementedError()
+
+    def set_mode(self, mode):
+        raise NotImplementedError()
+
+    def capture(self, output, mode, format="jpeg", **options):
+        raise NotImplementedError()
+
+    def capture_raw(self, mode):
+        """An unencoded RGB RawFrame"""
+        raise NotImplementedError()
+
+    def record(self, output, mode, seconds):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+    @property
+    def is_open(self):
+        raise NotImplementedError()
+
+
+class PiCameraBackend(CameraBackend):
+    """One long lived picamera.PiCamera, configured once"""
+    warmup_time = 2  # Sensor start up and auto exposure settling after open()
+
+    def __init__(self):
+        self.camera = None
+
+    @property
+    def is_open(self):
+        return self.camera is not None
+
+    def open(self):
+        import picamera  # Only importable on the Pi
+        camera = picamera.PiCamera()
+        camera.sharpness = 0
+        camera.contrast = 0
+        camera.brightness = 50
+        camera.saturation = 0
+        camera.image_effect = 'none'
+        camera.color_effects = None
+        camera.rotation = 0
+        camera.hflip = False
+        camera.vflip = False
+        camera.video_stabilization = True
+        camera.exposure_compensation = 0
+        camera.exposure_mode = 'auto'
+        camera.meter_mode = 'average'
+        camera.awb_mode = 'auto'
+        camera.crop = (0.0, 0.0, 1.0, 1.0)
+        self.camera = camera
+        self.mode = None
+        glider_clock.sleep(self.warmup_time)
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            # Changing the resolution restarts the camera's ports but keeps the sensor running and exposure settled
+            self.camera.resolution = MODES[mode]
+            self.mode = mode
+
+    def capture(self, output, mode, format="jpeg", **options):
+        self.set_mode(mode)
+        self.camera.capture(output, format=format, **options)
+
+    def capture_raw(self, mode):
+        self.set_mode(mode)
+        stream = io.BytesIO()
+        self.camera.capture(stream, format="rgb")
+        return RawFrame(stream.getvalue(), MODES[mode], raw_buffer_size(MODES[mode]))
+
+    def record(self, output, mode, seconds):
+        self.set_mode(mode)
+        self.camera.start_recording(output)
+        try:
+            self.camera.wait_recording(seconds)
+        finally:
+            self.camera.stop_recording()
+
+    def close(self):
+        if self.camera is not None:
+            self.camera.close()
+            self.camera = None
+            self.mode = None
+
+
+class FakeCameraBackend(CameraBackend):
+    """
+    Camera with no hardware, for the simulator and benchmarks.
+    Takes glider_clock time like a PiCamera would (roughly) and writes real
+    image files so what happens to them afterwards costs the same.
+    """
+
+    def __init__(self, open_time=2.0, mode_switch_time=0.1, capture_time=0.2):
+        self.open_time = open_time
+        self.mode_switch_time = mode_switch_time
+        self.capture_time = capture_time
+        self._open = False
+        self._images = {}
+        self.opens = 0
+        self.captures = 0
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def open(self):
+        glider_clock.sleep(self.open_time)
+        self._open = True
+        self.mode = None
+        self.opens += 1
+
+    def set_mode(self, mode):
+        if not self._open:
+            raise IOError("Camera is closed")
+        if mode != self.mode:
+            glider_clock.sleep(self.mode_switch_time)
+            self.mode = mode
+
+    def _image(self, mode, format, options):
+        key = (mode, format, tuple(sorted(options.items())))
+        if key not in self._images:
+            # The GPU does the encoding on the Pi, so only encode once per mode/format
+            image = Image.effect_noise(MODES[mode], 64).convert("RGB")
+            stream = io.BytesIO()
+            image.save(stream, format.upper(), **options)
+            self._images[key] = stream.getvalue()
+        return self._images[key]
+
+    def capture(self, output, mode, format="jpeg", **options):
+        self.set_mode(mode)
+        glider_clock.sleep(self.capture_time)
+        data = self._image(mode, format, options)
+        self.captures += 1
+        if hasattr(output, "write"):
+            output.write(data)
+        else:
+            with open(output, "wb") as image_file:
+                image_file.write(data)
+
+    def capture_raw(self, mode):
+        self.set_mode(mode)
+        glider_clock.sleep(self.capture_time)
+        buffer_size = raw_buffer_size(MODES[mode])
+        key = (mode, "rgb")
+        if key not in self._images:
+            self._images[key] = Image.effect_noise(buffer_size, 64).convert("RGB").tobytes()
+        self.captures += 1
+        return RawFrame(self._images[key], MODES[mode], buffer_size)
+
+    def record(self, output, mode, seconds):
+        self.set_mode(mode)
+        glider_clock.sleep(seconds)
+        with open(output, "wb") as video_file:
+            video_file.write(b"\x00\x00\x00\x01")  # An (empty) H264 stream
+
+    def close(self):
+        self._open = False
+        self.mode = None
+
+
+def get_backend():
+    """Build the camera backend selected by [camera] backend in glider_conf.ini"""
+    backend = glider_config.get("camera", "backend")
+    if backend == "picamera":
+        return PiCameraBackend()
+    if backend == "fake":
+        return FakeCameraBackend()
+    raise ValueError("Unknown camera backend: %s" % backend)
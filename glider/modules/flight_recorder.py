@@ -0,0 +1,293 @@
+import os
+import mmap
+import ctypes
+import ctypes.util
+import struct
+import logging
+import threading
+from datetime import datetime
+
+from . import glider_config
+from . import glider_clock
+from .telem_codec import FLAPS
+
+try:
+    import numpy as np  # Only needed to read flights back (load_flight)
+except ImportError:
+    np = None
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _posix_fallocate = _libc.posix_fallocate64  # 64 bit offsets on the 32 bit Pi too
+    _posix_fallocate.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+except (OSError, AttributeError):
+    _posix_fallocate = None
+
+MAGIC = b"GFDR"
+VERSION = 1
+RECORD_SIZE = 64
+# magic, version, record size, record capacity, wall time and monotonic time when the log was opened
+FILE_HEADER = struct.Struct("<4sHHIdd")
+FILE_HEADER_SIZE = RECORD_SIZE
+# Every record starts with: type, sequence number, monotonic time
+RECORD_HEADER = [("type", "B", "u1"), ("", "3x", None), ("seq", "I", "<u4"), ("t", "d", "<f8")]
+
+# Record types: (type code, [(field, struct format, numpy format)])
+IMU = "imu"
+GPS = "gps"
+PILOT = "pilot"
+FLAP_SCALES = "flaps"
+SERVOS = "servos"
+STATE = "state"
+COMMAND = "command"
+SERVO_CHANNELS = 16  # PCA9685
+RECORD_TYPES = {
+    IMU: (1, [("roll", "f", "<f4"), ("pitch", "f", "<f4"), ("yaw", "f", "<f4"),
+              ("sample_seq", "I", "<u4"), ("sample_t", "d", "<f8")]),
+    GPS: (2, [("lat", "d", "<f8"), ("lon", "d", "<f8"), ("alt", "f", "<f4"), ("speed", "f", "<f4"),
+              ("track", "f", "<f4"), ("epx", "f", "<f4"), ("epy", "f", "<f4")]),
+    PILOT: (3, [("desired_yaw", "f", "<f4"), ("desired_pitch", "f", "<f4")]),
+    FLAP_SCALES: (4, [(flap, "f", "<f4") for flap in FLAPS]),
+    SERVOS: (5, [("pulses", "%sH" % SERVO_CHANNELS, ("<u2", (SERVO_CHANNELS,)))]),
+    STATE: (6, [("from_state", "16s", "S16"), ("to_state", "16s", "S16")]),
+    COMMAND: (7, [("command", "40s", "S40")]),
+}
+
+
+def _record_struct(fields):
+    record_struct = struct.Struct("<" + "".join(fmt for _, fmt, _ in RECORD_HEADER + fields))
+    assert record_struct.size <= RECORD_SIZE
+    return record_struct
+
+
+def _record_dtype(fields):
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name, fmt, numpy_format in RECORD_HEADER + fields:
+        if numpy_format is not None:
+            names.append(name)
+            formats.append(numpy_format)
+            offsets.append(offset)
+        offset += struct.calcsize("<" + fmt)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": RECORD_SIZE})
+
+
+def _reserve(fd, size):
+    """
+    Give the file 'size' bytes of disk blocks, so a full card fails here
+    rather than with a SIGBUS on the first write to an unbacked page of the map.
+    """
+    if _posix_fallocate is None:
+        LOG.warning("No posix_fallocate, the flight recorder log is sparse")
+        os.ftruncate(fd, size)
+        return
+    error = _posix_fallocate(fd, 0, size)
+    if error:
+        raise OSError(error, os.strerror(error))
+
+
+def _number(value):
+    """Values a module doesn't have yet (None) are recorded as NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class NullRecorder(object):
+    """Records nothing (no [recorder] data_dir, or the log couldn't be opened)"""
+    path = None
+
+    def record_imu(self, sample):
+        pass
+
+    def record_gps(self, data):
+        pass
+
+    def record_pilot(self, desired_yaw, desired_pitch_deg):
+        pass
+
+    def record_flaps(self, flap_scales):
+        pass
+
+    def record_servos(self, pulses):
+        pass
+
+    def record_state(self, from_state, to_state):
+        pass
+
+    def record_command(self, command):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FlightRecorder(NullRecorder):
+    """
+    Fixed size binary records appended to a preallocated, memory mapped log.
+
+    A record is one struct.pack_into straight into the map, no system call
+    and no formatting, so recording is cheap enough for the control loop.
+    The log is a ring: when it is full the oldest records are overwritten
+    (the sequence number says which came first). Read a flight back with
+    load_flight().
+    """
+
+    def __init__(self, path, size=256 * 2 ** 20):
+        self.path = path
+        self.capacity = (size - FILE_HEADER_SIZE) // RECORD_SIZE
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.errors = 0
+        self._structs = dict((name, (code, _record_struct(fields))) for name, (code, fields) in RECORD_TYPES.items())
+        file_size = FILE_HEADER_SIZE + self.capacity * RECORD_SIZE
+        with open(path, "w+b") as log_file:
+            # Sized once, the map never grows. The blocks are reserved rather than zero filled (too slow for
+            # 256MB on the SD card at startup), the first write to each page still costs a page fault
+            try:
+                _reserve(log_file.fileno(), file_size)
+            except OSError:
+                os.remove(path)
+                raise
+            self._map = mmap.mmap(log_file.fileno(), file_size)
+        FILE_HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD_SIZE, self.capacity,
+                              glider_clock.wall_time(), glider_clock.monotonic())
+        LOG.info("Flight recorder: %s (%s records)" % (path, self.capacity))
+
+    def _record(self, record_type, *values):
+        code, record_struct = self._structs[record_type]
+        with self.lock:
+            if self._map is None:
+                return
+            seq = self.seq
+            self.seq += 1
+            offset = FILE_HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE
+            try:
+                record_struct.pack_into(self._map, offset, code, seq & 0xFFFFFFFF, glider_clock.monotonic(), *values)
+            except (struct.error, TypeError) as e:
+                # Never let recording break flying, e.g. a None from a module that has no data yet.
+                # Part of the record may be written, mark the slot empty
+                self._map[offset] = b"\x00"
+                self.seq -= 1
+                self.errors += 1
+                if self.errors == 1:
+                    LOG.error("Can't record %s %s: %s" % (record_type, values, e))
+
+    def record_imu(self, sample):
+        self._record(IMU, sample.roll, sample.pitch, sample.yaw, sample.seq or 0, sample.timestamp or 0.0)
+
+    def record_gps(self, data):
+        self._record(GPS, _number(data.lat), _number(data.lon), _number(data.alt), _number(data.speed),
+                     _number(data.track), _number(data.epx), _number(data.epy))
+
+    def record_pilot(self, desired_yaw, desired_pitch_deg):
+        self._record(PILOT, desired_yaw, desired_pitch_deg)
+
+    def record_flaps(self, flap_scales):
+        self._record(FLAP_SCALES, *[_number(flap_scales.get(flap)) for flap in FLAPS])
+
+    def record_servos(self, pulses):
+        """pulses: {channel: (on, off)} as written to the PCA9685"""
+        widths = [0] * SERVO_CHANNELS
+        for channel, (on, off) in pulses.items():
+            if channel is not None and 0 <= channel < SERVO_CHANNELS:
+                widths[channel] = off - on
+        self._record(SERVOS, *widths)
+
+    def record_state(self, from_state, to_state):
+        self._record(STATE, str(from_state or ""), str(to_state or ""))
+
+    def record_command(self, command):
+        self._record(COMMAND, str(command))
+
+    def flush(self):
+        with self.lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self.lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._map = None
+        LOG.info("Flight recorder: %s records in %s (%s unrecordable)" % (self.seq, self.path, self.errors))
+
+
+def load_flight(path):
+    """
+    Read a flight recorder log into a NumPy structured array per record
+    type (keyed by the names in RECORD_TYPES), each in recording order.
+    Every array has 'seq' and 't' (monotonic seconds) as well as the
+    record's own fields; 'header' has the wall/monotonic time the log was
+    started with, to turn 't' into wall clock time.
+    """
+    if np is None:
+        raise ImportError("numpy is needed to read flight recorder logs")
+    with open(path, "rb") as log_file:
+        magic, version, record_size, capacity, wall_time, monotonic = FILE_HEADER.unpack(
+            log_file.read(FILE_HEADER.size))
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError("Not a flight recorder log: %s" % path)
+    if version != VERSION:
+        raise ValueError("Unsupported flight recorder log version %s: %s" % (version, path))
+    records = np.memmap(path, dtype=np.uint8, mode="r", offset=FILE_HEADER_SIZE,
+                        shape=(capacity * RECORD_SIZE,))
+    headers = records.view(_record_dtype([]))
+    flight = {"header": {"wall_time": wall_time, "monotonic": monotonic, "capacity": capacity}}
+    for name, (code, fields) in RECORD_TYPES.items():
+        of_type = records.view(_record_dtype(fields))[headers["type"] == code]
+        # In a log that wrapped the oldest records aren't at the start
+        flight[name] = np.array(of_type[np.argsort(of_type["seq"], kind="mergesort")])
+    return flight
+
+
+def remove_old_logs(data_dir, keep):
+    """Delete all but the newest 'keep' logs in data_dir (the names sort by when they were started)"""
+    logs = sorted(name for name in os.listdir(data_dir) if name.startswith("flight_") and name.endswith(".fdr"))
+    removed = []
+    for name in logs[:max(0, len(logs) - keep)]:
+        path = os.path.join(data_dir, name)
+        LOG.info("Removing old flight recorder log %s" % path)
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def open_recorder():
+    """
+    A FlightRecorder for this flight in [recorder] data_dir (a NullRecorder if
+    there is none). Old logs are deleted first, so with this one there are
+    at most [recorder] keep_logs.
+    """
+    data_dir = glider_config.get("recorder", "data_dir")
+    if not data_dir:
+        return NullRecorder()
+    path = os.path.join(data_dir, "flight_%s.fdr" % datetime.now().strftime("%Y%m%d_%H%M%S"))
+    try:
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+        remove_old_logs(data_dir, glider_config.getint("recorder", "keep_logs") - 1)
+        return FlightRecorder(path, glider_config.getint("recorder", "size_mb") * 2 ** 20)
+    except (IOError, OSError, ValueError) as e:
+        LOG.error("Can't open flight recorder %s, not recording: %s" % (path, e))
+        return NullRecorder()
+
+
+_recorder = NullRecorder()
+
+
+def set_recorder(recorder):
+    """The recorder modules without a reference to the Glider (e.g. the PWM controller) record to"""
+    global _recorder
+    _recorder = recorder
+
+
+def get_recorder():
+    return _recorder
@@ -1,12 +1,15 @@
 import os
 import time
 import logging
-import picamera
 
-from PIL import Image
 from datetime import datetime
 from threading import Thread
 from . import glider_config
+from . import glider_clock
+from .camera_backend import get_backend, MODES
+from .media_catalog import MediaCatalog, scan_directory, LOW, HIGH, THUMB, VIDEO
+from .media_store import get_store, FileStore
+from .image_encoder import EncoderPool, encode_frame, DOWNLINK_JPEG, ARCHIVE_PNG, THUMBNAIL
 
 LOG = logging.getLogger("glider.%s" % __name__)
 
@@ -18,100 +21,136 @@ class GliderCamera(object):
     def __init__(self, 
         low_quality_interval=15,
         high_quality_interval=60,
-        photo_path=None):
+        photo_path=None,
+        backend=None,
+        store=None):
         LOG.info("Camera init")
         if not photo_path:
             photo_path = glider_config.get("camera", "data_dir")
         self.photo_path = photo_path
+        self.backend = backend or get_backend()
+        self.store = store or get_store(photo_path)
+        self.catalog = MediaCatalog(photo_path)
+        entries = list(self.store.entries())
+        videos = []
+        if not isinstance(self.store, FileStore):
+            # Videos are always plain files
+            videos = sorted(scan_directory(photo_path, [VIDEO]), key=lambda entry: entry[3])
+            entries.extend(videos)
+        self.catalog.rebuild({LOW: MODES["low"], HIGH: MODES["high"], VIDEO: MODES["video"]}, entries)
+        self.store.on_evict = self.catalog.remove
+        for path, _, kind, timestamp, _ in videos:
+            # Counted against the store's budget, oldest first
+            self.store.add_file(path, kind, timestamp)
+        self.encoder = None
+        thumbnail_size = glider_config.get("camera", "thumbnail_size")
+        self.thumbnail_size = tuple(int(x) for x in thumbnail_size.split("x")) if thumbnail_size else None
         self.last_low_pic = time.time()
         self.last_high_pic = time.time()
         self.low_quality_interval = low_quality_interval
         self.high_quality_interval = high_quality_interval
         self.video_requested = 0
+        self.waker = None  # Called when something is asked for, without a camera thread (see glider_runtime)
 
-
-    def get_cam(self, cam_type):
-        camera = picamera.PiCamera()
-        camera.sharpness = 0
-        camera.contrast = 0
-        camera.brightness = 50
-        camera.saturation = 0
-        camera.image_effect = 'none'
-        camera.color_effects = None
-        camera.rotation = 0
-        camera.hflip = False
-        camera.vflip = False
-        camera.video_stabilization = True
-        camera.exposure_compensation = 0
-        camera.exposure_mode = 'auto'
-        camera.meter_mode = 'average'
-        camera.awb_mode = 'auto'
-        camera.crop = (0.0, 0.0, 1.0, 1.0)
-        if cam_type == "high":
-            camera.resolution = (1296, 972)
-        if cam_type == "low":
-            camera.resolution = (640, 480)
-        if cam_type == "video":
-            camera.resolution = (1296,972)
-        return camera
+    def _session(self):
+        """The camera session, opened once and kept open between captures"""
+        if not self.backend.is_open:
+            LOG.info("Opening camera session")
+            self.backend.open()
+        return self.backend
 
     def _take_video(self):
         timestamp = datetime.now().strftime("%H%M%S%f")
         out_path = os.path.join(self.photo_path, "video_%s.h264" % timestamp)
         LOG.info("Creating (%ss) video at %s" % (self.video_requested, out_path))
-        with self.get_cam("video") as camera:
-            LOG.info("Starting recording")
-            camera.start_recording(out_path)
-            camera.wait_recording(self.video_requested)
-            LOG.info("Stopping recording")
-            camera.stop_recording()
-            camera.close()
+        started = glider_clock.wall_time()
+        self._session().record(out_path, "video", self.video_requested)
+        self.catalog.add(out_path, VIDEO, started, MODES["video"])
+        self.store.add_file(out_path, VIDEO, started)  # Might evict older media, so after the catalog has it
         return out_path
 
     def take_video(self, seconds):
         self.video_requested = seconds
+        if self.waker is not None:
+            self.waker()
+
+    def _encode(self, frame, outputs, media_kinds, captured):
+        """Encode a frame, each output goes in the store and the catalog (as the matching media kind)"""
+        def store(encoded):
+            for (name, resolution, data), kind in zip(encoded, media_kinds):
+                key = self.store.put(name, data, kind, captured)
+                self.catalog.add(key, kind, captured, resolution, len(data))
+        if self.encoder is None:
+            # No pool (not started), encode here
+            store(encode_frame(frame, outputs))
+        else:
+            self.encoder.submit(frame, outputs, callback=store)
+
+    def locate(self, key):
+        """(file path, offset, length) of a capture's bytes"""
+        return self.store.locate(key)
 
     def take_low_pic(self):
-        timestamp = datetime.now().strftime("%H%M%S%f")
-        out_path = os.path.join(self.photo_path, "low_%s.jpg" % timestamp)
-        with self.get_cam("low") as camera:
-            camera.capture("/tmp/precompressed.jpg", format="jpeg", quality=40)
-            image = Image.open("/tmp/precompressed.jpg")
-            image.convert('P', palette=Image.ADAPTIVE, colors=200).convert("RGB").save(
-                out_path, "JPEG", quality=20, optimize=True
-            )
-            camera.close()
-        return out_path
+        """Capture a downlink picture, it is stored once the encoder is done with it"""
+        name = "low_%s.jpg" % datetime.now().strftime("%H%M%S%f")
+        frame = self._session().capture_raw("low")
+        self._encode(frame, [(DOWNLINK_JPEG, name)], [LOW], glider_clock.wall_time())
+        return name
 
     def take_high_pic(self):
+        """Capture an archive picture (plus thumbnail), they are stored once the encoder is done with them"""
         timestamp = datetime.now().strftime("%H%M%S%f")
-        out_path = os.path.join(self.photo_path, "high_%s.png" % timestamp)
-        with self.get_cam("high") as camera:
-            camera.capture(out_path, format="png")
-            camera.close()
-        return out_path
+        name = "high_%s.png" % timestamp
+        outputs = [(ARCHIVE_PNG, name)]
+        media_kinds = [HIGH]
+        if self.thumbnail_size:
+            outputs.append((THUMBNAIL, "thumb_%s.jpg" % timestamp, self.thumbnail_size))
+            media_kinds.append(THUMB)
+        frame = self._session().capture_raw("high")
+        self._encode(frame, outputs, media_kinds, glider_clock.wall_time())
+        return name
+
+    def take_due(self):
+        """Take the video asked for and whichever pictures are due"""
+        now = time.time()
+        try:
+            if self.video_requested:
+                out_path = self._take_video()
+                self.video_requested = 0
+                LOG.debug("Created video: %s" % out_path)
+            if now - self.last_low_pic >= self.low_quality_interval:
+                out_path = self.take_low_pic()
+                self.last_low_pic = now
+                LOG.debug("Created low pic: %s" % out_path)
+            if now - self.last_high_pic >= self.high_quality_interval:
+                out_path = self.take_high_pic()
+                self.last_high_pic = now
+                LOG.debug("Created high pic: %s" % out_path)
+        except:
+            LOG.error("Camera can't initialize, try again later")
+            self.backend.close()  # Start a fresh session next time
+
+    def next_due(self):
+        """Seconds until take_due() has something to take"""
+        if self.video_requested:
+            return 0.0
+        due = min(self.last_low_pic + self.low_quality_interval, self.last_high_pic + self.high_quality_interval)
+        return max(0.0, due - time.time())
 
     def take_pictures(self):
         while self.threadAlive:
-            now = time.time()
-            try:
-                if self.video_requested:
-                    out_path = self._take_video()
-                    self.video_requested = 0
-                    LOG.debug("Created video: %s" % out_path)
-                if now - self.last_low_pic > self.low_quality_interval:
-                    out_path = self.take_low_pic()
-                    self.last_low_pic = now
-                    LOG.debug("Created low pic: %s" % out_path)
-                if now - self.last_high_pic > self.high_quality_interval:
-                    out_path = self.take_high_pic()
-                    self.last_high_pic = now
-                    LOG.debug("Created high pic: %s" % out_path)
-            except:
-                LOG.error("Camera can't initialize, try again later")
+            self.take_due()
             time.sleep(1)
 
-    def start(self):
+    def start(self, threaded=True):
+        # The encoder processes are forked from this one, start them before the camera thread
+        self.encoder = EncoderPool(
+            workers=glider_config.getint("camera", "encoder_workers"),
+            max_pending=glider_config.getint("camera", "encoder_max_pending")
+        )
+        self.encoder.start()
+        if not threaded:
+            return  # glider_runtime calls take_due()
         cameraThread = Thread( target=self.take_pictures, args=() )
         self.threadAlive = True
         LOG.info("Starting up Camera thread now")
@@ -121,4 +160,9 @@ class GliderCamera(object):
     def stop(self):
         self.threadAlive = False
         for t in self.threads:
-            t.join()
\ No newline at end of file
+            t.join()
+        self.backend.close()
+        if self.encoder is not None:
+            self.encoder.stop()
+            self.encoder = None
+        self.store.close()
\ No newline at end of file
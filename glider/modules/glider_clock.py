@@ -0,0 +1,70 @@
+import os
+import time
+import ctypes
+import ctypes.util
+
+CLOCK_MONOTONIC = 1  # linux/time.h
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+try:
+    _librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1", use_errno=True)
+    _clock_gettime = _librt.clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
+class SystemClock(object):
+    """The real clocks of the machine we are running on"""
+
+    def monotonic(self):
+        """
+        Seconds from the system wide monotonic clock.
+        Unlike time.time() it never jumps (e.g. when NTP or the GPS sets the clock)
+        and it is the same clock in every process, so timestamps can be shared.
+        """
+        if _clock_gettime is None:
+            return time.time()
+        t = _timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+_clock = SystemClock()
+
+
+def set_clock(clock):
+    """
+    Replace the clock behind monotonic(), wall_time() and sleep().
+    The simulator uses this to run the glider on virtual time.
+    """
+    global _clock
+    _clock = clock
+
+
+def get_clock():
+    return _clock
+
+
+def monotonic():
+    return _clock.monotonic()
+
+
+def wall_time():
+    return _clock.time()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
@@ -1,43 +1,304 @@
 import json
+import time
+import bisect
+import calendar
 import logging
 import os
+import socket
+import traceback
+from collections import namedtuple
+from threading import Thread
 
-from gps3.agps3threaded import AGPS3mechanism
+from gps3.agps3 import GPSDSocket
 from . import glider_config
+from . import glider_clock
 # https://pypi.python.org/pypi/gps3/
 
 LOG = logging.getLogger("glider.%s" % __name__)
 
+# gpsd fix modes
+MODE_UNKNOWN = 0
+MODE_NO_FIX = 1
+MODE_2D = 2
+MODE_3D = 3
+
+
+def _number(value):
+    """gpsd leaves out what it doesn't know, gps3 used to report that as "n/a" """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_time(value):
+    """gpsd's ISO 8601 UTC time (e.g. 2018-06-01T12:00:00.000Z) as unix seconds, None if there isn't one"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        seconds = calendar.timegm(time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S"))
+        fraction = value[19:].rstrip("Z")
+        return seconds + (float(fraction) if fraction.startswith(".") and len(fraction) > 1 else 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class GPSFix(namedtuple("GPSFix", ["lat", "lon", "alt", "speed", "track", "climb", "epx", "epy",
+                                   "time", "mode", "received"])):
+    """
+    One gpsd position report, parsed once when it arrives.
+    Numbers are floats (metres, m/s, degrees), None when gpsd didn't have
+    them. time is the GPS time in unix seconds, mode the gpsd fix mode and
+    received the monotonic time the report came in.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_report(cls, report, received=None):
+        """A fix from a decoded gpsd TPV report (or a dict with the same keys)"""
+        mode = report.get("mode")
+        return cls(
+            _number(report.get("lat")), _number(report.get("lon")), _number(report.get("alt")),
+            _number(report.get("speed")), _number(report.get("track")), _number(report.get("climb")),
+            _number(report.get("epx")), _number(report.get("epy")),
+            parse_time(report.get("time")),
+            mode if mode in (MODE_NO_FIX, MODE_2D, MODE_3D) else MODE_UNKNOWN,
+            received
+        )
+
+    @property
+    def has_fix(self):
+        return self.mode >= MODE_2D and self.lat is not None and self.lon is not None
+
+    @property
+    def max_error(self):
+        """The larger of the lat/lon error estimates (metres), infinite when unknown"""
+        if self.epx is None or self.epy is None:
+            return float("inf")
+        return max(self.epx, self.epy)
+
+    @property
+    def age(self):
+        if self.received is None:
+            return float("inf")
+        return glider_clock.monotonic() - self.received
+
+
+NO_FIX = GPSFix(None, None, None, None, None, None, None, None, None, MODE_UNKNOWN, None)
+
+
+class FakeLocation(object):
+    """
+    GPS values from a JSON file, for debugging and simulations. The file is
+    either fixed values, e.g. {"lat": 54.6, "lon": -7.4, "alt": 1200}, or a
+    playback script of positions at seconds since playback started:
+
+        [{"time": 0, "lat": 54.6, "lon": -7.4, "alt": 1200, "speed": 20, "track": 90},
+         {"time": 60, "lat": 54.6, "lon": -7.38, "alt": 1000, "speed": 20, "track": 90}]
+
+    Numbers are interpolated between positions, after the last one it is held.
+    Playback (re)starts whenever the file is loaded, and the GPS time of
+    played back fixes is the current time. Without a "mode" a fake location
+    is a 3D fix. The file is only read again when its mtime changes, which
+    is checked at most every check_interval seconds.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.mtime = None
+        self.next_check = None
+        self.values = {}
+        self.script = None
+        self.script_times = None
+        self.script_changes = None
+        self.started = None
+        self.loads = 0
+
+    @staticmethod
+    def _fix_values(values):
+        """The GPSFix fields in 'values', parsed"""
+        parsed = GPSFix.from_report(dict({"mode": MODE_3D}, **values))._asdict()
+        return dict((field, parsed[field]) for field in GPSFix._fields if field in values or field == "mode")
+
+    def _check(self, now):
+        if self.next_check is not None and now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return  # Keep what we have, e.g. the file is being replaced
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path) as fake_file:
+                fake_data = json.load(fake_file)
+        except ValueError as e:
+            # Probably caught mid write, try again next check
+            LOG.error("Bad fake location file %s: %s" % (self.path, e))
+            return
+        self.mtime = mtime
+        self.loads += 1
+        if isinstance(fake_data, list):
+            script = sorted(fake_data, key=lambda position: position["time"])
+            self.script_times = [position.pop("time") for position in script]
+            self.script = [self._fix_values(position) for position in script]
+            self.script_changes = [self._changes(before, after, end - start) for before, after, start, end in zip(
+                self.script, self.script[1:], self.script_times, self.script_times[1:])]
+            self.started = now
+            LOG.warning("Playing back %s fake positions from %s" % (len(self.script), self.path))
+        else:
+            self.script = None
+            self.values = self._fix_values(fake_data)
+            LOG.warning("Using fake location from %s" % self.path)
+
+    @staticmethod
+    def _changes(before, after, duration):
+        """(key, start, change per second) of the numbers interpolated from one position to the next"""
+        changes = []
+        for key, value in before.items():
+            other = after.get(key)
+            if key == "mode" or not duration or value is None or other is None:
+                continue
+            change = other - value
+            if key == "track":
+                change = (change + 180) % 360 - 180  # The short way round
+            changes.append((key, value, change / float(duration)))
+        return changes
+
+    def _playback(self, now):
+        elapsed = now - self.started
+        index = bisect.bisect_right(self.script_times, elapsed) - 1
+        if index < 0:
+            values = dict(self.script[0])
+        elif index >= len(self.script) - 1:
+            values = dict(self.script[-1])
+        else:
+            elapsed -= self.script_times[index]
+            values = dict(self.script[index])
+            for key, start, rate in self.script_changes[index]:
+                values[key] = start + rate * elapsed
+                if key == "track":
+                    values[key] %= 360
+        values["time"] = glider_clock.wall_time()
+        return values
+
+    def fix(self, real_fix):
+        """real_fix with the fake values for now"""
+        now = glider_clock.monotonic()
+        self._check(now)
+        return real_fix._replace(received=now, **(self._playback(now) if self.script else self.values))
+
 
 class GPS(object):
-    fake_location_file = None
+    """
+    Reads gpsd's reports on a thread of its own and keeps the latest
+    position as a GPSFix, so 'data' is just a read of a parsed, immutable
+    fix and nobody else needs to check or convert gpsd's values.
+    """
+    fake_location = None
+    poll_timeout = 1  # Seconds to wait for gpsd before checking if we should stop
+    max_reconnect_wait = 10  # Seconds, the wait between attempts doubles up to this while gpsd is down
 
-    def __init__(self):
-        # Instantiate AGPS3 Mechanisms
-        self.gps3_thread = AGPS3mechanism()
-        # From localhost (), or other hosts, by example, (host='gps.ddns.net')
-        self.gps3_thread.stream_data()
+    def __init__(self, host="127.0.0.1", port=2947):
+        self.fix = NO_FIX
+        self.reports = 0
+        self.reconnects = 0
+        self.threadAlive = False
+        self.thread = None
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.reconnect_wait = None  # Until the next attempt, None when connected and reading
+        self.connected = self._connect()
+        if not self.connected:
+            LOG.warning("gpsd isn't running, will keep trying")
         # Used for debugging purposes
         fake_location = glider_config.get("gps", "fake_location")
         if fake_location and os.path.exists(fake_location):
             LOG.warning("Using fake data file! %s" % fake_location)
-            self.fake_location_file = fake_location
+            self.fake_location = FakeLocation(
+                fake_location, glider_config.getfloat("gps", "fake_location_check_interval"))
+
+    def _connect(self):
+        """Connect to gpsd and ask for its reports, False if it isn't there"""
+        self.socket = GPSDSocket()
+        self.socket.connect(self.host, self.port)
+        try:
+            self.socket.streamSock.getpeername()  # GPSDSocket.connect() only prints its errors
+        except socket.error:
+            self.socket.streamSock.close()
+            return False
+        self.socket.watch()
+        return True
+
+    def _disconnect(self):
+        self.connected = False
+        try:
+            self.socket.close()
+        except IOError:
+            self.socket.streamSock.close()  # Couldn't tell it to stop watching, it has gone
+
+    def _reconnect(self):
+        """Wait, then try gpsd again, backing off while it stays down"""
+        wait = self.reconnect_wait or self.poll_timeout
+        glider_clock.sleep(wait)
+        self.reconnect_wait = min(wait * 2, self.max_reconnect_wait)
+        self.reconnects += 1
+        self.connected = self._connect()
+        if not self.connected:
+            LOG.warning("gpsd still isn't running, trying again in %ss" % self.reconnect_wait)
+
+    def handle_report(self, line):
+        """Parse one line from gpsd, position (TPV) reports replace the current fix"""
+        try:
+            report = json.loads(line)
+        except ValueError:
+            LOG.warning("Bad report from gpsd: %r" % line)
+            return
+        if report.get("class") == "TPV":
+            self.fix = GPSFix.from_report(report, glider_clock.monotonic())
+            self.reports += 1
+
+    def read_reports(self):
+        while self.threadAlive:
+            if not self.connected:
+                self._reconnect()
+                continue
+            try:
+                line = self.socket.next(timeout=self.poll_timeout)
+                if line:
+                    self.reconnect_wait = None
+                    self.handle_report(line)
+                elif line is not None:
+                    # Readable but nothing to read: gpsd went away, every read would return straight away
+                    LOG.warning("gpsd closed the connection, reconnecting")
+                    self._disconnect()
+            except Exception:
+                LOG.error("Reading gpsd failed, reconnecting: %s" % traceback.format_exc())
+                self._disconnect()
 
     def start(self):
         LOG.info("Starting GPS thread now")
-        # Throttle time to sleep after an empty lookup, default '()' 0.2 two tenths of a second
-        self.gps3_thread.run_thread()
+        self.threadAlive = True
+        self.thread = Thread(target=self.read_reports, args=())
+        self.thread.daemon = True
+        self.thread.start()
 
     def stop(self):
         LOG.info("Stopping GPS thread now")
-        self.gps3_thread.stop()
+        self.threadAlive = False
+        if self.thread is not None:
+            self.thread.join()
+        if self.connected:
+            self._disconnect()
 
     @property
     def data(self):
-        data = self.gps3_thread.data_stream
-        if self.fake_location_file:
-            with open(self.fake_location_file) as fake_file:
-                fake_data = json.load(fake_file)
-                for key, val in fake_data.items():
-                    setattr(data, key, val)
-        return data
+        """The latest GPSFix"""
+        if self.fake_location:
+            return self.fake_location.fix(self.fix)
+        return self.fix
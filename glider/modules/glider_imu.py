@@ -1,7 +1,10 @@
 import math
-import redis
 import logging
+from collections import namedtuple
 from . import glider_config
+from .glider_clock import monotonic
+from .imu_transport import get_transport
+from .glider_metrics import timed
 
 
 ##############################################
@@ -9,6 +12,21 @@ from . import glider_config
 ##############################################
 LOG = logging.getLogger("glider.%s" % __name__)
 
+
+class IMUSample(namedtuple("IMUSample", ["roll", "pitch", "yaw", "timestamp", "seq"])):
+    """
+    A single fused orientation sample (radians) as published by 'imu_reader.py'
+    timestamp is the monotonic time the sample was read, seq increments for every sample
+    """
+    __slots__ = ()
+
+    @property
+    def age(self):
+        if not self.timestamp:
+            return float("inf")
+        return monotonic() - self.timestamp
+
+
 class IMU(object):
 
     """
@@ -22,22 +40,30 @@ class IMU(object):
 
     offset_yaw= 0
 
-    def __init__(self):
-        self.redis_client = redis.StrictRedis(
-            host=glider_config.get("redis_client", "host"),
-            port=glider_config.get("redis_client", "port"),
-            db=glider_config.get("redis_client", "db")
-        )
+    def __init__(self, transport=None):
+        # Samples come from 'imu_reader.py' over redis or shared memory (see [imu] transport)
+        self.transport = transport or get_transport()
         self.heading_discrepancy_tolerance_degrees = glider_config.getfloat("flight", "heading_discrepancy_allowance")
+        self.max_sample_age = glider_config.getfloat("imu", "max_sample_age")
+
+    @timed("imu.read")
+    def snapshot(self):
+        """Get roll/pitch/yaw of a single sample, with its timestamp and sequence, in one read"""
+        roll, pitch, yaw, timestamp, seq = self.transport.read()
+        return IMUSample(roll, pitch, yaw + self.offset_yaw, timestamp, seq)
+
+    def history(self, count):
+        """The last 'count' samples, oldest first"""
+        return [IMUSample(roll, pitch, yaw + self.offset_yaw, timestamp, seq)
+                for roll, pitch, yaw, timestamp, seq in self.transport.history(count)]
 
-    def _val_or_default(self, name, default=0.0):
-        val = self.redis_client.get(name)
-        if not val:
-            return default
-        return float(val)
+    def is_stale(self, sample):
+        # A sample from the future was published before a reboot restarted the monotonic clock
+        age = sample.age
+        return age < 0 or age > self.max_sample_age
 
     def correct_heading(self, gps_heading):
-        imu_heading = self.yaw
+        imu_heading = self.snapshot().yaw
         gps_heading_rad = math.radians(gps_heading)
         if math.degrees(math.fabs(gps_heading_rad - imu_heading)) < self.heading_discrepancy_tolerance_degrees:
             LOG.info("Heading offset within tolerance of %s deg" % self.heading_discrepancy_tolerance_degrees)
@@ -48,14 +74,12 @@ class IMU(object):
 
     @property
     def roll(self):
-        return self._val_or_default("roll")
+        return self.snapshot().roll
 
     @property
     def yaw(self):
-        imu_val = self._val_or_default("yaw")
-        imu_val += self.offset_yaw
-        return imu_val
+        return self.snapshot().yaw
 
     @property
     def pitch(self):
-        return self._val_or_default("pitch")
+        return self.snapshot().pitch
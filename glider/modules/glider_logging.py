@@ -0,0 +1,195 @@
+import sys
+import Queue
+import atexit
+import logging
+import threading
+
+from . import glider_config
+from . import glider_clock
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+_STOP = object()
+
+
+def _copy(arg):
+    """Formatting happens later on the listener thread, so containers the caller goes on changing are copied"""
+    if isinstance(arg, dict):
+        return dict(arg)
+    if isinstance(arg, list):
+        return list(arg)
+    return arg
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts records on a queue for a QueueListener to format and write, so
+    whoever logs never waits on a stream or the SD card. It never blocks
+    either: when the queue is full records are dropped (and counted).
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        if isinstance(record.args, dict):
+            record.args = dict(record.args)
+        elif record.args:
+            record.args = tuple(_copy(arg) for arg in record.args)
+        if record.exc_info:
+            # The traceback is only good while it is being handled
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Writes the records from a QueueHandler's queue to the real handlers, on a thread of its own"""
+
+    def __init__(self, queue, handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """Write everything queued so far and stop"""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        for handler in self.handlers:
+            handler.flush()
+
+
+class HotLog(object):
+    """
+    Logging for the control loop, wrapping a logger:
+
+      - nothing is done (not even finding the caller) unless the level is enabled,
+      - the message is formatted when it is written, so pass the args, don't % them,
+      - each call site logs at most once every 'interval' seconds, the next
+        record it logs says how many were skipped (0 logs everything).
+    """
+
+    def __init__(self, logger, interval=None):
+        self.logger = logger
+        if interval is None:
+            interval = glider_config.getfloat("logging", "hot_path_interval")
+        self.interval = interval
+        self.sites = {}  # (code, line) -> [next time it may log, records skipped]
+
+    def _log(self, level, msg, args):
+        if not self.logger.isEnabledFor(level):
+            return
+        frame = sys._getframe(2)
+        site = (frame.f_code, frame.f_lineno)
+        if self.interval:
+            now = glider_clock.monotonic()
+            limit = self.sites.get(site)
+            if limit is None:
+                self.sites[site] = [now + self.interval, 0]
+            elif now < limit[0]:
+                limit[1] += 1
+                return
+            else:
+                if limit[1]:
+                    msg = "%s (%s more in %ss)" % (msg, limit[1], self.interval)
+                limit[0], limit[1] = now + self.interval, 0
+        record = self.logger.makeRecord(self.logger.name, level, frame.f_code.co_filename, frame.f_lineno,
+                                        msg, args, None, frame.f_code.co_name)
+        self.logger.handle(record)
+
+    def debug(self, msg, *args):
+        self._log(logging.DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        self._log(logging.INFO, msg, args)
+
+    def warning(self, msg, *args):
+        self._log(logging.WARNING, msg, args)
+
+    def error(self, msg, *args):
+        self._log(logging.ERROR, msg, args)
+
+
+_async = None  # (logger, QueueHandler, QueueListener)
+
+
+def start_async_logging(logger=None, queue_size=10000):
+    """Move the logger's (default root) handlers on to a QueueListener thread"""
+    global _async
+    logger = logger or logging.getLogger()
+    queue = Queue.Queue(queue_size)
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    queue_handler = QueueHandler(queue)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue, handlers)
+    listener.start()
+    _async = (logger, queue_handler, listener)
+    atexit.register(stop_async_logging)
+    return queue_handler
+
+
+def stop_async_logging():
+    """Write what is queued and give the handlers back to the logger (e.g. on shutdown)"""
+    global _async
+    if _async is None:
+        return
+    logger, queue_handler, listener = _async
+    _async = None
+    logger.removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+    if queue_handler.dropped:
+        LOG.warning("%s log records were dropped, the log writer couldn't keep up" % queue_handler.dropped)
+
+
+def after_fork():
+    """
+    In a forked child (e.g. an image encoder process): the log writer thread
+    wasn't forked with it, so the logger gets its handlers back and writes
+    itself. Locks some other thread may have held at the fork are made anew.
+    """
+    global _async
+    if _async is None:
+        return
+    logging._lock = threading.RLock()
+    logger, queue_handler, listener = _async
+    _async = None
+    logger.removeHandler(queue_handler)
+    for handler in listener.handlers:
+        handler.createLock()
+        logger.addHandler(handler)
+
+
+def configure():
+    """Start the log writer thread if [logging] async is set"""
+    if glider_config.getboolean("logging", "async"):
+        start_async_logging(queue_size=glider_config.getint("logging", "queue_size"))
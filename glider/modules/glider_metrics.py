@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import bisect
+import socket
+import logging
+import functools
+import threading
+
+from . import glider_config
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+# Histogram bucket upper bounds in seconds, 4 a decade from 10us to 10s (and one more for anything longer)
+BUCKETS = tuple(float("%.3g" % 10 ** (exponent / 4.0)) for exponent in range(-20, 5))
+
+# Characters of summary in one radio message, as many as an image chunk's base64
+SUMMARY_SIZE = 220
+
+# Durations are microseconds long: time.time() costs a 30th of the ctypes monotonic clock, and a clock
+# step can only spoil the one sample it lands in (a negative one goes in the first bucket)
+_now = time.time
+
+
+class Histogram(object):
+    """Counts of durations in fixed buckets, so observing one is a bisect and a few additions"""
+
+    def __init__(self, name, bounds=BUCKETS):
+        self.name = name
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket the fraction'th duration is in (the max for the last bucket)"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "buckets": self.counts[:],
+        }
+
+
+def _short(seconds):
+    """A duration in as few characters as possible, e.g. 85u, 1.2m, 3s"""
+    if seconds < 1e-3:
+        return "%du" % round(seconds * 1e6)
+    if seconds < 1:
+        return "%.3gm" % (seconds * 1e3)
+    return "%.3gs" % seconds
+
+
+class Metrics(object):
+    """
+    Histograms of how long the stages of the control loop take and counters,
+    by name. Updates aren't locked: losing the odd count to a race between
+    threads is better than making every tick take a lock.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(name))
+        return histogram
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def increment(self, name, count=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def snapshot(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+        return {
+            "uptime": time.time() - self.started,
+            "histograms": dict((histogram.name, histogram.snapshot()) for histogram in histograms),
+            "counters": dict(self.counters),
+        }
+
+    def summary(self, page=1, size=SUMMARY_SIZE):
+        """
+        One line for the radio: name p50/p99/max for each histogram, then the
+        counters. Lines longer than 'size' characters are split into pages,
+        each starting with "<page>/<pages> " (out of range pages give the last).
+        """
+        if not self.enabled:
+            return "metrics off"
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        parts = ["%s %s/%s/%s" % (name, _short(histogram.percentile(0.5)), _short(histogram.percentile(0.99)),
+                                  _short(histogram.max)) for name, histogram in histograms if histogram.count]
+        parts += ["%s=%s" % item for item in sorted(self.counters.items())]
+        summary = " ".join(parts)
+        if len(summary) <= size:
+            return summary
+        size -= len("99/99 ")
+        pages = [[]]
+        for part in parts:
+            part = part[:size]
+            if pages[-1] and len(" ".join(pages[-1] + [part])) > size:
+                pages.append([])
+            pages[-1].append(part)
+        page = max(1, min(page, len(pages)))
+        return "%s/%s %s" % (page, len(pages), " ".join(pages[page - 1]))
+
+
+METRICS = Metrics(glider_config.getboolean("metrics", "enabled"))
+
+
+def timed(name, metrics=None):
+    """
+    Decorator timing each call into histogram 'name'. With metrics off it
+    hands back the function itself, so it costs nothing at all.
+    """
+    metrics = metrics or METRICS
+
+    def decorate(function):
+        if not metrics.enabled:
+            return function
+        histogram = metrics.histogram(name)
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            started = _now()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(_now() - started)
+        return timed_function
+    return decorate
+
+
+def now():
+    """For timing a stage by hand: metrics.observe(name, now() - started)"""
+    return _now()
+
+
+class MetricsServer(object):
+    """
+    Serves the metrics as JSON on a UNIX socket, one snapshot per
+    connection, e.g. socat - UNIX-CONNECT:/tmp/glider_metrics.sock
+    Does nothing without a path.
+    """
+    accept_timeout = 1  # Seconds between checks if we should stop
+
+    def __init__(self, path, metrics=None):
+        self.path = path
+        self.metrics = metrics or METRICS
+        self.socket = None
+        self.thread = None
+        self.threadAlive = False
+
+    def start(self):
+        if not self.path:
+            return
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left over from the last run
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        self.socket.listen(2)
+        self.socket.settimeout(self.accept_timeout)
+        self.threadAlive = True
+        self.thread = threading.Thread(target=self.serve, name="metrics")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while self.threadAlive:
+            try:
+                connection, _ = self.socket.accept()
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                LOG.error("Metrics socket failed: %s" % e)
+                break
+            try:
+                connection.sendall(json.dumps(self.metrics.snapshot()))
+            except socket.error as e:
+                LOG.warning("Couldn't send metrics: %s" % e)
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.threadAlive = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            os.unlink(self.path)
+
+
+def open_metrics_server():
+    return MetricsServer(glider_config.get("metrics", "socket"))
@@ -1,13 +1,21 @@
 import math
-import json
 import logging
 from threading import Thread
 from . import glider_config
+from .navigator import Navigator
+from .glider_logging import HotLog
+from .glider_metrics import METRICS, timed
+
+try:
+    import numpy as np  # Only needed for the batch_* methods (offline tuning)
+except ImportError:
+    np = None
 
 ##############################################
 # GLOBALS
 ##############################################
 LOG = logging.getLogger("glider.%s" % __name__)
+HOT_LOG = HotLog(LOG)  # For update_flap_angles, every control loop tick
 
 deg = math.degrees # Tired of writing this so much
 rad = math.radians
@@ -42,8 +50,11 @@ class Pilot(object):
         self.pitch_nominal_ground_speed = glider_config.getfloat("flight", "pitch_nominal_ground_speed")
         self.desired_pitch_deg = self.nominal_pitch_deg
 
-        # Current GPS destination
-        self.destination = [float(i) for i in glider_config.get("flight", "initial_destination").split(",")]
+        # Route to fly, a single waypoint until one is uploaded
+        self.navigator = Navigator(glider_config.getfloat("flight", "waypoint_arrival_radius"))
+        self.navigator.set_route([glider_config.get("flight", "initial_destination").split(",")])
+        self.navigation = None  # The latest bearing/distance/cross track from the navigator
+        self.last_sample = None  # The IMU sample the flaps were last set from
 
     def _center_all_flaps(self):
         for flap in self.flap_angle_scales.keys():
@@ -69,14 +80,20 @@ class Pilot(object):
         else:
             return init_scale
 
+    @timed("pilot.flaps")
     def update_flap_angles(self):
-        # Get the readings from the IMU
-        current_pitch = self.IMU.pitch
-        current_roll = self.IMU.roll
-        current_yaw = self.IMU.yaw
-        LOG.debug("\nCalculating wing angles")
-        LOG.debug("Current P(%2.1f) R(%2.1f) Y(%2.1f)" % (
-            deg(current_pitch), deg(current_roll), deg(current_yaw)))
+        # Get the readings from the IMU (one sample, so pitch/roll/yaw all agree)
+        sample = self.IMU.snapshot()
+        self.last_sample = sample
+        if self.IMU.is_stale(sample):
+            HOT_LOG.error("IMU sample %s is stale (%.2fs old), centering flaps", sample.seq, sample.age)
+            METRICS.increment("imu.stale")
+            return self._center_all_flaps()
+        current_pitch = sample.pitch
+        current_roll = sample.roll
+        current_yaw = sample.yaw
+        HOT_LOG.debug("Calculating wing angles, current P(%2.1f) R(%2.1f) Y(%2.1f)",
+                      deg(current_pitch), deg(current_roll), deg(current_yaw))
 
         #---- Rear Flap ----
         delta_pitch = math.radians(self.desired_pitch_deg) - current_pitch
@@ -104,39 +121,40 @@ class Pilot(object):
         self.flap_angle_scales['rear'] = rear_flap
         self.flap_angle_scales['rudder'] = rudder
 
-        # Log the update and sleep for the wing calc interval
-        LOG.info("Wing Scales: %s" % json.dumps(self.flap_angle_scales, indent=2))
+        HOT_LOG.info("Wing Scales: %s", self.flap_angle_scales)
         return self.flap_angle_scales
 
-    def update_destination(self, lat, lon):
-        """Method to enforce that the heading is updated when current location is updated"""
-        self.destination = [float(lat), float(lon)]
+    @property
+    def destination(self):
+        """[lat, lon] of the waypoint we're flying to"""
+        waypoint = self.navigator.waypoint
+        return [waypoint.lat, waypoint.lon]
+
+    def set_route(self, waypoints):
+        """Fly to each of [(lat, lon), ...] in turn"""
+        self.navigator.set_route(waypoints)
         self.update_desired_heading()
 
+    def update_destination(self, lat, lon):
+        """A new destination is a route of one waypoint"""
+        self.set_route([(lat, lon)])
+
     def update_location(self, lat, lon):
         """Method to enforce that the heading is updated when current location is updated"""
         self.location = [lat, lon]
         self.update_desired_heading()
 
     def update_desired_heading(self):
-        # http://stackoverflow.com/questions/4913349/haversine-formula-in-python-bearing-and-distance-between-two-gps-points
-        x1, y1 = float(self.location[0]), float(self.location[1])
-        x2, y2 = float(self.destination[0]), float(self.destination[1])
-        LOG.warning("X1 %s Y2 %s" % (x1, y1))
-        LOG.warning("X2 %s Y2 %s" % (x2, y2))
-        all_coord = [x1, x2, y1, y2]
-        if None in all_coord or min([abs(x) for x in all_coord]) == 0:
-            LOG.warning("Some coordinates are blank/0")
+        # Great circle bearing to the current waypoint, see navigator
+        lat, lon = self.location
+        if lat is None or lon is None or lat == 0 or lon == 0:
+            LOG.warning("Location is blank/0, heading unchanged")
             return
-        # Convert gps coordinates to radian degrees
-        lon1, lat1, lon2, lat2 = map(math.radians, [y1, x1, y2, x2])
-        bearing = math.atan2(
-            math.sin(lon2-lon1) * math.cos(lat2), 
-            math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2-lon1)
-        )
-        bearing = (bearing + (2*math.pi)) % (2*math.pi)
-        LOG.warning("ANG %s" % deg(bearing))
-        self.desired_yaw = bearing
+        self.navigation = self.navigator.update(lat, lon)
+        LOG.debug("Waypoint %s: bearing %.1f, %.0fm to go, %sm off track",
+                  self.navigation.index, deg(self.navigation.bearing), self.navigation.distance,
+                  self.navigation.cross_track)
+        self.desired_yaw = self.navigation.bearing
 
     def scale_pitch_for_speed(self, speed_mps):
         # Speed in m/s from GPS
@@ -145,3 +163,109 @@ class Pilot(object):
         relevant_speed_delta = min(pos_speed_delta, self.pitch_nominal_ground_speed) # bound to nominal speed
         self.desired_pitch_deg = critical_pitch + (self.nominal_pitch_deg - critical_pitch) * \
                 math.sin(math.pi/2 * (relevant_speed_delta/self.pitch_nominal_ground_speed))
+
+    #---------------------------------------------------------------
+    # Batch versions of the control laws, for tuning over recorded flights.
+    # Same maths as the methods above but on NumPy arrays, and they don't
+    # change the pilot's state. Gains/set-points default to the pilot's
+    # current values and can be arrays too (they broadcast), so a column
+    # of gains against a row of samples evaluates every combination at once.
+    #---------------------------------------------------------------
+    def _require_numpy(self):
+        if np is None:
+            raise ImportError("numpy is required for the Pilot batch methods")
+
+    def _batch_angle_to_scale(self, angle, min=-math.pi, max=math.pi):
+        return (np.clip(angle, min, max) - min) / (max - min)
+
+    def batch_flap_scales(self, pitch, roll, yaw, desired_yaw=None, desired_pitch_deg=None,
+                          turn_multiplier=None, pitch_correction_multiplier=None):
+        """update_flap_angles for arrays of pitch/roll/yaw (radians), returns a dict of flap scale arrays"""
+        self._require_numpy()
+        pitch, roll, yaw = np.asarray(pitch, float), np.asarray(roll, float), np.asarray(yaw, float)
+        desired_yaw = self.desired_yaw if desired_yaw is None else np.asarray(desired_yaw, float)
+        desired_pitch_deg = self.desired_pitch_deg if desired_pitch_deg is None else np.asarray(desired_pitch_deg, float)
+        turn_multiplier = self.turn_multiplier if turn_multiplier is None else np.asarray(turn_multiplier, float)
+        if pitch_correction_multiplier is None:
+            pitch_correction_multiplier = self.pitch_correction_multiplier
+
+        delta_pitch = np.radians(desired_pitch_deg) - pitch
+        rear_flap = self._batch_angle_to_scale(delta_pitch * pitch_correction_multiplier, min=rad(-45), max=rad(45))
+
+        delta_yaw = desired_yaw - yaw
+        delta_yaw = np.mod(delta_yaw + math.pi, 2*math.pi) - math.pi
+        rudder = self._batch_angle_to_scale(delta_yaw * turn_multiplier)
+
+        desired_roll = self._scaleAbsToLimit(delta_yaw * turn_multiplier, rad(45))
+        delta_roll = self._batch_angle_to_scale(desired_roll - roll)
+        wing_left = 1-delta_roll
+        wing_right = delta_roll
+
+        shape = np.broadcast(rear_flap, rudder, wing_left).shape
+        scales = dict((flap, np.full(shape, scale, dtype=float)) for flap, scale in self.flap_angle_scales.items())
+        if self.use_near_wing_flaps:
+            scales['left_near'] = np.broadcast_to(wing_left, shape)
+            scales['right_near'] = np.broadcast_to(wing_right, shape)
+        if self.use_far_wing_flaps:
+            scales['left_far'] = np.broadcast_to(wing_left, shape)
+            scales['right_far'] = np.broadcast_to(wing_right, shape)
+        scales['rear'] = np.broadcast_to(rear_flap, shape)
+        scales['rudder'] = np.broadcast_to(rudder, shape)
+        return scales
+
+    def batch_pitch_for_speed(self, speed_mps, nominal_pitch_deg=None, critical_speed=None, nominal_speed=None):
+        """scale_pitch_for_speed for an array of speeds, returns the desired pitch (degrees) for each"""
+        self._require_numpy()
+        nominal_pitch_deg = self.nominal_pitch_deg if nominal_pitch_deg is None else np.asarray(nominal_pitch_deg, float)
+        critical_speed = self.pitch_critical_ground_speed if critical_speed is None else np.asarray(critical_speed, float)
+        nominal_speed = self.pitch_nominal_ground_speed if nominal_speed is None else np.asarray(nominal_speed, float)
+        critical_pitch = -45
+        pos_speed_delta = np.maximum(critical_speed, np.asarray(speed_mps, float))
+        relevant_speed_delta = np.minimum(pos_speed_delta, nominal_speed)
+        return critical_pitch + (nominal_pitch_deg - critical_pitch) * \
+                np.sin(math.pi/2 * (relevant_speed_delta/nominal_speed))
+
+    def batch_desired_heading(self, lat, lon, dest_lat=None, dest_lon=None):
+        """
+        update_desired_heading for a time series of positions, returns the desired yaw (radians) for each.
+        Like the scalar method, samples with a blank/0 coordinate keep the previous desired yaw.
+        """
+        self._require_numpy()
+        x1, y1 = np.asarray(lat, float), np.asarray(lon, float)
+        x2 = np.asarray(self.destination[0] if dest_lat is None else dest_lat, float)
+        y2 = np.asarray(self.destination[1] if dest_lon is None else dest_lon, float)
+        x1, y1, x2, y2 = np.broadcast_arrays(x1, y1, x2, y2)
+        valid = (x1 != 0) & (y1 != 0) & (x2 != 0) & (y2 != 0) & ~np.isnan(x1 + y1 + x2 + y2)
+
+        # Same as the navigator: the destination's n-vector in the position's east/north plane
+        lon1, lat1, lon2, lat2 = np.radians(y1), np.radians(x1), np.radians(y2), np.radians(x2)
+        sin_lat, cos_lat, sin_lon, cos_lon = np.sin(lat1), np.cos(lat1), np.sin(lon1), np.cos(lon1)
+        wx, wy, wz = np.cos(lat2) * np.cos(lon2), np.cos(lat2) * np.sin(lon2), np.sin(lat2)
+        east = -sin_lon * wx + cos_lon * wy
+        north = -sin_lat * (cos_lon * wx + sin_lon * wy) + cos_lat * wz
+        bearing = np.mod(np.arctan2(east, north), 2*math.pi)
+
+        # Hold the last valid bearing (or the current desired yaw) over invalid samples
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(valid.size), -1))
+        return np.where(last_valid >= 0, bearing[np.maximum(last_valid, 0)], self.desired_yaw)
+
+    def batch_update(self, pitch, roll, yaw, speed_mps, lat, lon, dest_lat=None, dest_lon=None, **gains):
+        """
+        Run the pilot over a recorded series: position sets the desired heading, speed the desired pitch,
+        and attitude the flaps. Returns (flap scale arrays, desired yaw array).
+        'gains' are passed on: turn_multiplier, pitch_correction_multiplier, nominal_pitch_deg,
+        critical_speed, nominal_speed.
+        """
+        desired_yaw = self.batch_desired_heading(lat, lon, dest_lat, dest_lon)
+        desired_pitch_deg = self.batch_pitch_for_speed(
+            speed_mps,
+            nominal_pitch_deg=gains.get("nominal_pitch_deg"),
+            critical_speed=gains.get("critical_speed"),
+            nominal_speed=gains.get("nominal_speed")
+        )
+        flap_scales = self.batch_flap_scales(
+            pitch, roll, yaw, desired_yaw=desired_yaw, desired_pitch_deg=desired_pitch_deg,
+            turn_multiplier=gains.get("turn_multiplier"),
+            pitch_correction_multiplier=gains.get("pitch_correction_multiplier")
+        )
+        return flap_scales, desired_yaw
@@ -1,12 +1,25 @@
 import math
 import time
 import logging
-# noinspection PyUnresolvedReferences
-import Adafruit_PCA9685
 from threading import Thread
 from . import glider_config
+from .glider_clock import monotonic
+from .flight_recorder import get_recorder
+from .glider_logging import HotLog
+from .glider_metrics import METRICS, timed
 
 LOG = logging.getLogger("glider.%s" % __name__)
+HOT_LOG = HotLog(LOG)  # For the servo writes
+
+# PCA9685 registers (see Adafruit_PCA9685)
+MODE1 = 0x00
+MODE1_RESTART = 0x80
+MODE1_AUTO_INCREMENT = 0x20
+LED0_ON_L = 0x06
+# An SMBus block write carries at most 32 bytes = 8 channels of 4 registers
+MAX_BLOCK_CHANNELS = 8
+# Flap scales (0 to 1) are quantized to this many steps for the pulse tables
+SCALE_STEPS = 256
 
 
 class GliderPWMController(object):
@@ -16,6 +29,12 @@ class GliderPWMController(object):
     if we write too many angles to the servos at once, they all go nuts!
     So instead we will set desired angle, and a thread will iterate over
     and update all servo angles in sequence with some delay.
+
+    Only channels whose pulse actually changed are written, and runs of
+    neighbouring channels go out as one auto-increment block write.
+
+    The pulse for every quantized flap scale (and every whole servo angle) is
+    worked out once when the config is read, so setting a flap is a table lookup.
     """
 
     threadAlive = False
@@ -44,14 +63,38 @@ class GliderPWMController(object):
                     'left_near': None, 'right_near': None,
                     'left_far': None, 'right_far': None}
 
-    _current_flap_angles = {} # Used to maintain the current angle and reduce calls to the PWM controller (unused)
+    # (on, off) register values indexed by quantized scale, and the current value for each flap
+    flap_pulse_tables = {'rudder': None, 'rear': None,
+                    'left_near': None, 'right_near': None,
+                    'left_far': None, 'right_far': None}
 
-    def __init__(self):
+    flap_pulses = {'rudder': None, 'rear': None,
+                    'left_near': None, 'right_near': None,
+                    'left_far': None, 'right_far': None}
+
+    servo_pulses = {"parachute": None, "release": None}
+
+    def __init__(self, pwm=None, autostart=True):
         LOG.debug("Staring up PWM Controller (Address=%s Frequency=%shz)" % (self.address, self.frequency))
-        self.pwm = Adafruit_PCA9685.PCA9685(address=int(self.address, 16))
+        self._written_pulses = {}  # Last (on, off) pulse written to each servo address
+        self._command_times = {}  # When each servo address was first commanded to a not-yet-written angle
+        self.output_latency = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+        self.waker = None  # Called when a pulse changes, without a servo thread (see glider_runtime)
+        if pwm is None:
+            # noinspection PyUnresolvedReferences
+            import Adafruit_PCA9685 # Only importable with the I2C libraries (benchmarks pass in a fake)
+            pwm = Adafruit_PCA9685.PCA9685(address=int(self.address, 16))
+        self.pwm = pwm
         self.pwm.set_pwm_freq(self.frequency)
+        self._enable_auto_increment()
         self._read_flap_config()
-        self.start()
+        if autostart:
+            self.start()
+
+    def _enable_auto_increment(self):
+        # Lets one I2C transaction write the registers of several neighbouring channels
+        mode = self.pwm._device.readU8(MODE1) & ~MODE1_RESTART
+        self.pwm._device.write8(MODE1, mode | MODE1_AUTO_INCREMENT)
 
     def _read_flap_config(self):
         for flap in self.flap_addresses.keys():
@@ -59,15 +102,26 @@ class GliderPWMController(object):
             flap_angle_range = [float(x) for x in glider_config.get("flight", "flap_range_%s" % flap).split(",")]
             self.flap_ranges[flap] = flap_angle_range
             self.flap_angles[flap] = sum(flap_angle_range)/2
+            self.flap_pulse_tables[flap] = self._build_pulse_table(flap_angle_range)
+            self.flap_pulses[flap] = self.flap_pulse_tables[flap][SCALE_STEPS // 2]
+        self._angle_pulse_table = [self._angle_to_pulse(angle) for angle in range(181)]
         for servo in self.servo_addresses.keys():
             self.servo_addresses[servo] = glider_config.getint("servo", "servo_address_%s" % servo)
             self.servo_angles[servo] = glider_config.getfloat("servo", "servo_center_%s" % servo)
+            self.servo_pulses[servo] = self._angle_to_pulse(self.servo_angles[servo])
+
+    def _build_pulse_table(self, angle_range):
+        """(on, off) register values for each of the SCALE_STEPS + 1 scales between 0 and 1"""
+        return [self._angle_to_pulse(angle_range[0] + step * (angle_range[1] - angle_range[0]) / float(SCALE_STEPS))
+                for step in range(SCALE_STEPS + 1)]
 
-    def start(self):
+    def start(self, threaded=True):
         servo_update_thread = Thread( target=self.update_servo_angles, args=() )
         self.threadAlive = True
         LOG.info("Setting initial servo position")
         self.servo_init_position()
+        if not threaded:
+            return  # glider_runtime calls write_pending()
         LOG.info("Starting up Servo Controller thread now")
         servo_update_thread.start()
 
@@ -81,61 +135,129 @@ class GliderPWMController(object):
         self.servo_init_position(delay=0.1)
         time.sleep(1)
         self.threadAlive = False
+        LOG.info("Servo command to output latency: %s" % self.get_output_latency())
 
     def update_servo_angles(self):
         while self.threadAlive:
-            for flap_id, angle in self.flap_angles.items():
-                servo_address = self.flap_addresses[flap_id]
-                self._set_servo_angle(servo_address, angle, flap_id=flap_id)
-            for servo_id, angle in self.servo_angles.items():
-                servo_address = self.servo_addresses[servo_id]
-                self._set_servo_angle(servo_address, angle, servo_id=servo_id)
+            self.write_pending()
             time.sleep(self.controller_breather) # Sleep at least this much - can happen if there are no angle updates
 
-    def _set_servo_angle(self, servo_address, angle, min_ms=None, max_ms=None, force=True, flap_id=None, servo_id=None):
+    def write_pending(self):
+        """Write the pulses set since the last write"""
+        self._write_changed_pulses(self._desired_pulses())
+
+    def _desired_pulses(self):
+        pulses = {}
+        for flap_id, pulse in self.flap_pulses.items():
+            pulses[self.flap_addresses[flap_id]] = pulse
+        for servo_id, pulse in self.servo_pulses.items():
+            pulses[self.servo_addresses[servo_id]] = pulse
+        return pulses
+
+    @timed("servo.write")
+    def _write_changed_pulses(self, pulses):
+        changed = sorted(address for address, pulse in pulses.items() if self._written_pulses.get(address) != pulse)
+        for address in list(self._command_times):
+            if address not in changed:
+                # Commanded to the pulse it already has, nothing to wait for
+                self._command_times.pop(address, None)
+        if not changed:
+            return
+        # Group into runs of neighbouring addresses, each run is a single block write
+        runs = [[changed[0]]]
+        for address in changed[1:]:
+            if address == runs[-1][-1] + 1 and len(runs[-1]) < MAX_BLOCK_CHANNELS:
+                runs[-1].append(address)
+            else:
+                runs.append([address])
+        for run in runs:
+            registers = []
+            for address in run:
+                on, off = pulses[address]
+                registers += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+            self.pwm._device.writeList(LED0_ON_L + 4 * run[0], registers)
+        now = monotonic()
+        for address in changed:
+            self._written_pulses[address] = pulses[address]
+            commanded = self._command_times.pop(address, None)
+            if commanded is not None:
+                self._record_latency(now - commanded)
+        get_recorder().record_servos(self._written_pulses)
+
+    def _record_latency(self, latency):
+        self.output_latency["count"] += 1
+        self.output_latency["total"] += latency
+        self.output_latency["last"] = latency
+        self.output_latency["max"] = max(self.output_latency["max"], latency)
+        METRICS.observe("servo.latency", latency)
+
+    def get_output_latency(self):
+        """Seconds from an angle being commanded to its pulse reaching the PCA9685"""
+        count = self.output_latency["count"]
+        return {
+            "count": count,
+            "mean": self.output_latency["total"] / count if count else 0.0,
+            "max": self.output_latency["max"],
+            "last": self.output_latency["last"],
+        }
+
+    def _angle_to_pulse(self, angle, min_ms=None, max_ms=None):
         if not min_ms:
             min_ms = self.servo_min_ms
         if not max_ms:
             max_ms = self.servo_max_ms
 
         angle = math.ceil(angle)  # round the angle to reduce calls for minor adjustments
-        # if not force:
-        #     if flap_id and angle == self.flap_angles[flap_id]:
-        #         return
-        #     if servo_id and angle == self.servo_angles[servo_id]:
-        #         return
-
         ms_range = float(max_ms - min_ms)
-        LOG.debug("Servo pulse ms range: %s" % ms_range)
         # This is the pulse we add to the initial pulse of 1ms to change the angle
         # e.g. 1ms = 0deg, 2ms = 180deg, so angle_pulse of 0.5 results in 1.5 = 90deg
         angle_pulse = (angle/180.0 * ms_range)
-        LOG.debug("Angle fraction (%s = %s)" % (angle, angle_pulse))
         pulse_width = int(4096/(1000/self.frequency)*(min_ms + angle_pulse))
-        LOG.debug("Setting servo(%s) pulse (fraction=%s duration=%sms)" % (
-            servo_address, min_ms+angle_pulse, pulse_width))
-        self.pwm.set_pwm(servo_address, self.servo_pulse_lag, pulse_width + self.servo_pulse_lag)
+        return self.servo_pulse_lag, pulse_width + self.servo_pulse_lag
+
+    def _set_servo_angle(self, servo_address, angle, min_ms=None, max_ms=None, force=True, flap_id=None, servo_id=None):
+        on, off = self._angle_to_pulse(angle, min_ms, max_ms)
+        HOT_LOG.debug("Setting servo(%s) angle %s pulse (%s, %s)", servo_address, angle, on, off)
+        self.pwm.set_pwm(servo_address, on, off)
+        self._written_pulses[servo_address] = (on, off)
         time.sleep(self.controller_breather)
 
     # def set_flap_angles(self, angle_dictionary):
     #     LOG.debug("Setting flaps: %s" % (angle_dictionary))
     #     self.flap_angles.update(angle_dictionary)
 
+    @timed("servo.set_scales")
     def set_flap_scales(self, scale_angle_dictionary):
         # Used to take in a range between 0 and 1 and set the angle accordingly between the servo min/max
         # 0.5 would be center flap for neutral
-        LOG.debug("Setting flap scales: %s" % (scale_angle_dictionary))
+        HOT_LOG.debug("Setting flap scales: %s", scale_angle_dictionary)
+        now = monotonic()
         for flap, scale in scale_angle_dictionary.items():
-            angle_range = self.flap_ranges[flap]
-            scaled_angle = angle_range[0] + scale*(angle_range[1]-angle_range[0])
-            self.flap_angles[flap] = scaled_angle
+            step = min(max(int(scale * SCALE_STEPS + 0.5), 0), SCALE_STEPS)
+            self._mark_commanded(self.flap_addresses[flap], now)
+            self.flap_pulses[flap] = self.flap_pulse_tables[flap][step]
+        if self.waker is not None:
+            self.waker()
+
+    def _mark_commanded(self, address, now=None):
+        # Latency is measured from the first command that hasn't been written yet
+        if address not in self._command_times:
+            self._command_times[address] = now or monotonic()
 
     def release_parachute(self, reset=False):
         LOG.debug("Releasing parachute")
         angle_parachute = 180 if reset else 0
+        self._mark_commanded(self.servo_addresses['parachute'])
         self.servo_angles['parachute'] = angle_parachute
+        self.servo_pulses['parachute'] = self._angle_pulse_table[angle_parachute]
+        if self.waker is not None:
+            self.waker()
 
     def release_from_balloon(self, reset=False):
         LOG.debug("Releasing from balloon")
         angle_balloon_release = 10 if reset else 180
+        self._mark_commanded(self.servo_addresses['release'])
         self.servo_angles['release'] = angle_balloon_release
+        self.servo_pulses['release'] = self._angle_pulse_table[angle_balloon_release]
+        if self.waker is not None:
+            self.waker()
@@ -4,16 +4,13 @@
 # Author: Daniel Vagg
 # 
 ##############################################
-import base64
-import os
 import logging
 import traceback
-from threading import Thread
-
-import time
 
 from sat_radio import SatRadio
 from . import glider_config
+from .tx_scheduler import TransmitScheduler, COMMAND, TELEMETRY, DATA, BULK
+from .image_downlink import ImageDownlink
 
 ##########################################
 # GLOBALS
@@ -26,61 +23,77 @@ class GliderRadio(SatRadio):
         self.ready = True
         self.groundstation_address = int(glider_config.get("radio", "groundstation_address"), 16)
 
-        self.push_data = False
-        self.data_packet_queue = []
-
         port = glider_config.get("radio", "port")
         callsign = glider_config.get("radio", "callsign")
         baud_rate = glider_config.get("radio", "baud_rate")
         address = int(glider_config.get("radio", "address"), 16)
-        super(self.__class__, self).__init__(port, address, callsign, baud_rate=baud_rate, callback=callback)
+        telemetry_format = glider_config.get("telemetry", "format")
+        super(self.__class__, self).__init__(
+            port, address, callsign, baud_rate=baud_rate, callback=callback, telemetry_format=telemetry_format)
+        self.tx_scheduler = TransmitScheduler(
+            self._transmit, int(baud_rate),
+            burst_bytes=glider_config.getint("radio", "tx_burst_bytes"),
+            max_utilization=glider_config.getfloat("radio", "tx_max_utilization")
+        )
+        self.image_downlink = ImageDownlink(
+            self.groundstation_address,
+            chunk_size=glider_config.getint("radio", "image_chunk_size"),
+            keep_transfers=glider_config.getint("radio", "image_keep_transfers")
+        )
+        self.tx_scheduler.add_source(self.image_downlink, BULK)
+
+    def _transmit(self, data, address):
+        # Only ever called from the transmit scheduler's thread
+        super(GliderRadio, self).send_packet(data, address=address)
+
+    def send_packet(self, data, address=0xFF, priority=COMMAND):
+        """Queue a packet for the transmit scheduler"""
+        self.tx_scheduler.enqueue(data, address, priority)
+
+    def send_telem(self, *telemetry):
+        self.send_packet(self.construct_telem(*telemetry), priority=TELEMETRY)
 
     def send_data(self, data):
         LOG.debug("Sending Data: %s to %s" % (data, self.groundstation_address))
         packet = "|".join(["D"] + data)
-        self.send_packet(packet, address=self.groundstation_address)
+        self.send_packet(packet, address=self.groundstation_address, priority=DATA)
+
+    def send_frame(self, frame):
+        """Send an already encoded (binary) frame to the groundstation"""
+        LOG.debug("Sending %s byte frame to %s" % (len(frame), self.groundstation_address))
+        self.send_packet(frame, address=self.groundstation_address, priority=DATA)
+
+    def tx_stats(self):
+        """Transmit queue depths and airtime utilization, see TransmitScheduler.stats"""
+        return self.tx_scheduler.stats()
 
-    def start(self):
-        super(self.__class__, self).start()
-        self.push_data = True
-        self.queue_push_thread = Thread(target=self._queued_push_data, args=[])
-        self.queue_push_thread.start()
+    def start(self, threaded=True):
+        super(self.__class__, self).start(threaded)
+        self.tx_scheduler.start(threaded)
 
     def stop(self):
-        self.push_data = False
-        self.queue_push_thread.join()
+        self.tx_scheduler.stop()
+        self.image_downlink.close()
         super(self.__class__, self).stop()
 
-    def sendImage(self, image_path):
-        LOG.warning("Sending Image: %s" % image_path)
-        packet_bit_rate = 220
-        # Start
+    def sendImage(self, image_path, offset=0, length=None, name=None):
+        """
+        Start sending an image (optionally 'length' bytes at 'offset' in image_path),
+        it goes out in the airtime left over by everything else
+        """
+        LOG.info("Sending Image: %s" % (name or image_path))
         try:
-            self.data_packet_queue.append("I|S|%s" % image_path)
-            packet_index = 0
-            image_size = os.path.getsize(image_path)
-            total_packets = image_size/packet_bit_rate
-            with open(image_path, "rb") as image:
-                data = image.read()
-                if not data:
-                    return
-            encoded_data = base64.b64encode(data)
-            while encoded_data:
-                self.data_packet_queue.append("I|P|%s|%s" % (packet_index, bytearray(encoded_data[:packet_bit_rate])))
-                encoded_data = encoded_data[packet_bit_rate:]
-                packet_index += 1
-            # End
-            self.data_packet_queue.append("I|E|%s" % image_path)
-            LOG.warning("Set the packet_queue: %s" % self.data_packet_queue)
+            transfer_id = self.image_downlink.start_transfer(image_path, offset, length, name)
         except Exception:
             LOG.critical(traceback.format_exc())
+            return None
+        self.tx_scheduler.wake()
+        return transfer_id
 
-    def _queued_push_data(self):
-        while self.push_data:
-            data_queue_length = len(self.data_packet_queue)
-            if data_queue_length > 0:
-                LOG.warning("Sending image part. Queue length: %s" % data_queue_length)
-                data_part = self.data_packet_queue.pop(0)
-                self.send_packet(data_part, address=self.groundstation_address)
-            time.sleep(1)
+    def resend_image_chunks(self, transfer_id, spec):
+        """Resend the chunks of an image the groundstation is missing (spec like "1,5,7-9")"""
+        accepted = self.image_downlink.resend(transfer_id, spec)
+        if accepted:
+            self.tx_scheduler.wake()
+        return accepted
 #---------- END CLASS -------------
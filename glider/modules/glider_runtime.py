@@ -0,0 +1,375 @@
+import os
+import math
+import heapq
+import fcntl
+import errno
+import select
+import logging
+import itertools
+import threading
+import Queue
+from collections import deque
+
+from . import glider_config
+from .glider_clock import monotonic
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+
+class Timer(object):
+    """A callback due at 'when' on the loop (again every 'interval' seconds if set), cancel() to drop it"""
+    __slots__ = ("when", "interval", "callback", "args", "cancelled")
+
+    def __init__(self, when, interval, callback, args):
+        self.when = when
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop(object):
+    """
+    Runs callbacks on one thread: at times on the monotonic clock, when a
+    file descriptor is readable, or handed over from other threads. The
+    thread sleeps in one select() until the next of these, so nothing
+    wakes up just to find it has nothing to do.
+
+    Callbacks run one at a time in a fixed order each pass: readers (by
+    fd), then callbacks from other threads (in the order they came), then
+    the timers that are due (by time, then the order they were set).
+    Blocking calls go to run_in_executor(), a few worker threads that hand
+    the result back to the loop.
+
+    With 'sleep' the loop runs on that clock instead (e.g. the simulator's
+    virtual time): it sleeps until the next timer and only polls the file
+    descriptors.
+    """
+
+    def __init__(self, clock=monotonic, sleep=None, workers=2):
+        self.clock = clock
+        self.sleep = sleep
+        self.workers = workers
+        self.running = False
+        self.wakeups = 0  # Passes through the loop
+        self.thread = None
+        self._timers = []  # Heap of (when, sequence, Timer)
+        self._sequence = itertools.count()
+        self._readers = {}  # fd: (callback, args)
+        self._lock = threading.Lock()
+        self._handed_over = deque()  # (callback, args) from other threads
+        self._signalled = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        for fd in (self._wakeup_read, self._wakeup_write):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._jobs = Queue.Queue()
+        self._workers = []
+
+    def call_at(self, when, callback, *args):
+        timer = Timer(when, None, callback, args)
+        heapq.heappush(self._timers, (when, next(self._sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + max(0.0, delay), callback, *args)
+
+    def call_soon(self, callback, *args):
+        """On the next pass, after everything already due (only from the loop's own thread)"""
+        return self.call_at(self.clock(), callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """
+        Every interval seconds from now, against fixed deadlines so the rate
+        doesn't drift. Deadlines already passed when a call returns are skipped.
+        """
+        timer = Timer(self.clock() + interval, interval, callback, args)
+        heapq.heappush(self._timers, (timer.when, next(self._sequence), timer))
+        return timer
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Run a callback on the loop, from any thread"""
+        with self._lock:
+            self._handed_over.append((callback, args))
+            if self._signalled or threading.current_thread() is self.thread:
+                return
+            self._signalled = True
+        try:
+            os.write(self._wakeup_write, b"x")
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def add_reader(self, fd, callback, *args):
+        self._readers[fd] = (callback, args)
+
+    def remove_reader(self, fd):
+        self._readers.pop(fd, None)
+
+    def run_in_executor(self, function, args=(), callback=None):
+        """
+        Call function(*args) on a worker thread, then callback(result) on the loop.
+        If it raises, the error is logged and the callback gets None.
+        """
+        if not self._workers:
+            for number in range(self.workers):
+                worker = threading.Thread(target=self._work, name="runtime-worker-%d" % number)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        self._jobs.put((function, args, callback))
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            function, args, callback = job
+            try:
+                result = function(*args)
+            except Exception:
+                LOG.exception("Error in %s" % getattr(function, "__name__", function))
+                result = None
+            if callback is not None:
+                self.call_soon_threadsafe(callback, result)
+
+    def _timeout(self, until=None):
+        """Seconds to wait for, None for as long as it takes"""
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        if self._handed_over:
+            return 0.0
+        deadline = self._timers[0][0] if self._timers else None
+        if until is not None and (deadline is None or until < deadline):
+            deadline = until
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def _wait(self, timeout):
+        """File descriptors ready to read after waiting up to timeout seconds"""
+        fds = sorted(self._readers)
+        if self.sleep is not None:
+            if timeout:
+                self.sleep(timeout)
+            timeout = 0
+        try:
+            ready, _, _ = select.select([self._wakeup_read] + fds, [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        if self._wakeup_read in ready:
+            with self._lock:
+                self._signalled = False
+                try:
+                    os.read(self._wakeup_read, 4096)
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+        return [fd for fd in fds if fd in ready]
+
+    def _call(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            LOG.exception("Error in %s" % getattr(callback, "__name__", callback))
+
+    def run_once(self, until=None):
+        """Wait for the next thing to do and do everything that is ready"""
+        ready = self._wait(self._timeout(until))
+        self.wakeups += 1
+        for fd in ready:
+            if fd in self._readers:  # An earlier reader may have removed it
+                callback, args = self._readers[fd]
+                self._call(callback, args)
+        with self._lock:
+            handed_over = list(self._handed_over)
+            self._handed_over.clear()
+        for callback, args in handed_over:
+            self._call(callback, args)
+        # Only what is due now, a callback setting a timer for now runs on the next pass
+        now = self.clock()
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            due.append(heapq.heappop(self._timers)[2])
+        for timer in due:
+            if timer.cancelled:
+                continue
+            self._call(timer.callback, timer.args)
+            if timer.interval and not timer.cancelled:
+                timer.when += timer.interval
+                now = self.clock()
+                if timer.when <= now:
+                    timer.when += math.ceil((now - timer.when) / timer.interval) * timer.interval
+                heapq.heappush(self._timers, (timer.when, next(self._sequence), timer))
+
+    def run(self, until=None):
+        """Run callbacks until stop() (or the clock reaches 'until')"""
+        self.thread = threading.current_thread()
+        self.running = True
+        try:
+            while self.running and (until is None or self.clock() < until):
+                self.run_once(until)
+        finally:
+            self.running = False
+
+    def stop(self):
+        """Stop run() once the current pass is done, from any thread"""
+        self.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        self.running = False
+
+    def close(self):
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join(5)
+        self._workers = []
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+
+class GliderRuntime(object):
+    """
+    Runs the glider on one EventLoop instead of a thread per module.
+
+    The state machine ticks at its scheduler's deadlines, servo pulses are
+    written after the ticks that change them (at most every
+    controller_breather), telemetry is sent when it is due, the radio is
+    read when its port has bytes and written when the transmit scheduler's
+    bucket allows, and camera captures run on the loop's workers when the
+    next picture is due. Commands from the radio are handled between state
+    ticks, never during one. The GPS, speech, metrics and log writer keep
+    their threads.
+
+    A state whose execute() sleeps (state.blocking, e.g. PACKAGING and
+    RECOVER) would stall all of that for as long as it sleeps, so its ticks
+    run on a worker instead: the loop carries on with telemetry and the
+    radio (commands are then handled during the tick, as with threads) and
+    writes the servo pulses the state sets as it goes.
+    """
+
+    def __init__(self, glider, loop=None):
+        self.glider = glider
+        self.loop = loop or EventLoop(workers=glider_config.getint("runtime", "executor_workers"))
+        self.servo_timer = None
+        self.last_servo_write = None
+        self.tx_timer = None
+        self.camera_timer = None
+        self.capturing = False
+        self.stepping = False  # A blocking state's tick is on a worker
+
+    def start(self):
+        """Put the glider's work on the loop, run() runs it"""
+        loop = self.loop
+        loop.call_soon(self._step)
+        loop.call_soon(self._send_telemetry)
+        if hasattr(self.glider.pwm_controller, "write_pending"):
+            self.glider.pwm_controller.waker = self._servos_changed
+        rhserial = getattr(self.glider.radio, "radio", None)  # SatRadio's RHSerial
+        if getattr(rhserial, "serial", None) is not None:
+            loop.add_reader(rhserial.serial.fileno(), rhserial.read_available)
+        tx_scheduler = getattr(self.glider.radio, "tx_scheduler", None)
+        if tx_scheduler is not None:
+            tx_scheduler.waker = lambda: loop.call_soon_threadsafe(self._wake_transmit)
+            loop.call_soon(self._transmit)
+        if hasattr(self.glider.camera, "take_due"):
+            self.glider.camera.waker = lambda: loop.call_soon_threadsafe(self._wake_camera)
+            loop.call_soon(self._capture)
+
+    def run(self):
+        self.start()
+        try:
+            self.loop.run()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        self.loop.stop()
+
+    def _step(self):
+        if not self.glider.running:
+            self.loop._stop()
+            return
+        state = getattr(self.glider, "state_machine", {}).get(self.glider.current_state)
+        if getattr(state, "blocking", False):
+            self.stepping = True
+            self.loop.run_in_executor(self.glider.step, (False,), callback=self._stepped)
+            return
+        delay = self.glider.step(wait=False)
+        if not delay:
+            # A tick ran (or failed), its flap changes go out now
+            self._output_servos()
+            # Usually just the time to the next tick, unless that is due too (catching up)
+            delay = self.glider.step(wait=False)
+            if not delay:
+                self._output_servos()
+        self.loop.call_later(delay or 0, self._step)
+
+    def _stepped(self, delay):
+        self.stepping = False
+        self._output_servos()
+        self.loop.call_later(delay or 0, self._step)
+
+    def _servos_changed(self):
+        # Ticks on the loop are followed by a write anyway, a blocking state's worker needs the loop to write
+        if threading.current_thread() is not self.loop.thread:
+            self.loop.call_soon_threadsafe(self._output_servos)
+
+    def _output_servos(self):
+        pwm_controller = self.glider.pwm_controller
+        if self.servo_timer is not None or not hasattr(pwm_controller, "write_pending"):
+            return
+        # Spaced like the servo thread did, the servos misbehave when written too often
+        wait = 0
+        if self.last_servo_write is not None:
+            wait = self.last_servo_write + pwm_controller.controller_breather - self.loop.clock()
+        if wait > 0:
+            self.servo_timer = self.loop.call_later(wait, self._write_servos)
+        else:
+            self._write_servos()
+
+    def _write_servos(self):
+        self.servo_timer = None
+        self.last_servo_write = self.loop.clock()
+        self.glider.pwm_controller.write_pending()
+
+    def _send_telemetry(self):
+        telemetry_handler = self.glider.telemetry_handler
+        telemetry_handler.send_due()
+        self.loop.call_later(telemetry_handler.next_due(), self._send_telemetry)
+
+    def _transmit(self):
+        self.tx_timer = None
+        tx_scheduler = self.glider.radio.tx_scheduler
+        wait = tx_scheduler.send_next()
+        while wait == 0:
+            wait = tx_scheduler.send_next()
+        if wait is not None:
+            self.tx_timer = self.loop.call_later(wait, self._transmit)
+
+    def _wake_transmit(self):
+        if self.tx_timer is not None:
+            self.tx_timer.cancel()
+        self._transmit()
+
+    def _capture(self):
+        self.camera_timer = None
+        self.capturing = True
+        self.loop.run_in_executor(self.glider.camera.take_due, callback=self._captured)
+
+    def _captured(self, result):
+        self.capturing = False
+        self.camera_timer = self.loop.call_later(self.glider.camera.next_due(), self._capture)
+
+    def _wake_camera(self):
+        # Something was asked for (e.g. a video), don't wait for the next picture
+        if self.capturing:
+            return  # next_due() says so once the capture in progress is done
+        if self.camera_timer is not None:
+            self.camera_timer.cancel()
+        self._capture()
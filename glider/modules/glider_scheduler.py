@@ -0,0 +1,104 @@
+import math
+import logging
+
+from .glider_clock import monotonic, sleep
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+SKIP = "skip"          # Late: drop the missed ticks and carry on from the next future deadline
+CATCH_UP = "catchup"   # Late: run the missed ticks back to back (up to max_catch_up) until on time again
+
+
+class StateTiming(object):
+    """Timing record for one state"""
+
+    def __init__(self, period, started):
+        self.period = period
+        self.started = started
+        self.ticks = 0
+        self.overruns = 0  # Ticks that started a whole period or more late
+        self.skipped = 0  # Ticks dropped by the SKIP policy (or catch up giving up)
+        self.jitter_total = 0.0  # Seconds woken after the deadline
+        self.jitter_max = 0.0
+
+    def achieved_rate(self, now):
+        elapsed = now - self.started
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def summary(self, now):
+        return {
+            "period": self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_mean": self.jitter_total / self.ticks if self.ticks else 0.0,
+            "jitter_max": self.jitter_max,
+            "rate": self.achieved_rate(now),
+        }
+
+
+class StateScheduler(object):
+    """
+    Runs a state's execute() at the rate set by its sleepTime.
+
+    Deadlines are absolute times on the monotonic clock (start + N * period),
+    so time spent in execute() doesn't stretch the period and the rate
+    doesn't drift with load. What happens when a tick is late is set by the
+    state's overrunPolicy (SKIP or CATCH_UP).
+    """
+    max_catch_up = 10  # CATCH_UP gives up and skips when further behind than this many periods
+
+    def __init__(self, clock=monotonic, sleep=sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.state_name = None
+        self.deadline = None
+        self.timing = {}
+
+    def enter(self, state_name, state):
+        """Start timing a state, its first tick is one period from now"""
+        now = self.clock()
+        if self.state_name is not None and self.state_name in self.timing:
+            LOG.info("State %s timing: %s" % (self.state_name, self.timing[self.state_name].summary(now)))
+        self.state_name = state_name
+        self.deadline = now + state.sleepTime
+        self.timing[state_name] = StateTiming(state.sleepTime, now)
+
+    def wait(self, state_name, state):
+        """Block until the state's next deadline. Call before every execute()"""
+        delay = self.delay(state_name, state)
+        if delay > 0:
+            self.sleep(delay)
+        self.tick(state)
+
+    def delay(self, state_name, state):
+        """
+        Seconds until the state's next deadline (0 or less when it is due), for
+        callers that wait elsewhere (see glider_runtime). Call tick() when it runs.
+        """
+        if state_name != self.state_name:
+            self.enter(state_name, state)
+        period = state.sleepTime
+        timing = self.timing[state_name]
+        now = self.clock()
+        if now > self.deadline + period:
+            # The last tick ran over at least one whole period
+            timing.overruns += 1
+            missed = int(math.floor((now - self.deadline) / period))
+            if state.overrunPolicy == SKIP or missed > self.max_catch_up:
+                timing.skipped += missed
+                self.deadline += missed * period
+        return self.deadline - now
+
+    def tick(self, state):
+        """Count a tick of the current state and move on to its next deadline"""
+        timing = self.timing[self.state_name]
+        lateness = max(0.0, self.clock() - self.deadline)
+        timing.ticks += 1
+        timing.jitter_total += lateness
+        timing.jitter_max = max(timing.jitter_max, lateness)
+        self.deadline += state.sleepTime
+
+    def summary(self):
+        now = self.clock()
+        return dict((name, timing.summary(now)) for name, timing in self.timing.items())
@@ -0,0 +1,202 @@
+import os
+import hashlib
+import logging
+import subprocess
+import threading
+from collections import namedtuple
+
+from . import glider_config
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+VOICE = ["espeak", "-ven-us", "-m", "-p", "70", "-s", "180"]
+PLAYER = ["aplay", "-q"]
+
+
+class Phrase(namedtuple("Phrase", ["text", "alarm", "topic"])):
+    """
+    Something to say. Alarms are said before anything else (and cut short
+    whatever else is being said), a phrase replaces one waiting to be said
+    with the same topic (e.g. a countdown's previous number).
+    """
+    __slots__ = ()
+
+
+def _start(command):
+    """Start a command, quietly"""
+    with open(os.devnull, "w") as devnull:
+        return subprocess.Popen(command, stdout=devnull, stderr=devnull)
+
+
+class NullSpeaker(object):
+    """Says nothing (e.g. the simulator)"""
+
+    def start(self):
+        pass
+
+    def say(self, text, alarm=False, topic=None):
+        pass
+
+    def prerender(self, phrases):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+
+class Speaker(NullSpeaker):
+    """
+    Says phrases one at a time on a thread of its own, so speaking never
+    holds up the caller and there is only ever one espeak (or aplay)
+    running.
+
+    Phrases wait in a queue of at most queue_size: a phrase already
+    waiting isn't queued again and when the queue is full the oldest
+    phrase that isn't an alarm is dropped. Phrases given to prerender()
+    are rendered to WAV files in cache_dir while there is nothing to say,
+    from then on (and on later boots) they are played rather than
+    synthesised.
+    """
+
+    def __init__(self, cache_dir=None, queue_size=8, start_process=_start):
+        self.cache_dir = cache_dir
+        self.queue_size = queue_size
+        self.start_process = start_process
+        self.condition = threading.Condition()
+        self.pending = []
+        self.to_render = []
+        self.speaking = None  # (Phrase, process)
+        self.thread = None
+        self.running = False
+        self.spoken = 0
+        self.played = 0  # Of those, from the cache
+        self.dropped = 0
+        self.coalesced = 0
+        if cache_dir and not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError as e:
+                LOG.error("Can't create speech cache %s, not caching: %s" % (cache_dir, e))
+                self.cache_dir = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="speech")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cache_path(self, text):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, "%s.wav" % hashlib.md5(" ".join(VOICE + [text])).hexdigest())
+
+    def say(self, text, alarm=False, topic=None):
+        phrase = Phrase(str(text), alarm, topic)
+        with self.condition:
+            if any(waiting.text == phrase.text and waiting.alarm >= alarm for waiting in self.pending):
+                self.coalesced += 1
+                return
+            if topic is not None:
+                superseded = [waiting for waiting in self.pending if waiting.topic == topic]
+                self.coalesced += len(superseded)
+                for waiting in superseded:
+                    self.pending.remove(waiting)
+            if len(self.pending) >= self.queue_size:
+                self.dropped += 1
+                droppable = [waiting for waiting in self.pending if not waiting.alarm]
+                if not droppable and not alarm:
+                    LOG.warning("Speech queue full, not saying: %s" % text)
+                    return
+                dropped = (droppable or self.pending)[0]
+                LOG.warning("Speech queue full, not saying: %s" % dropped.text)
+                self.pending.remove(dropped)
+            self.pending.append(phrase)
+            if alarm and self.speaking and not self.speaking[0].alarm:
+                # Cut it short, the alarm is more important
+                try:
+                    self.speaking[1].terminate()
+                except OSError:
+                    pass
+            self.condition.notify()
+
+    def prerender(self, phrases):
+        """Render phrases to the cache in the background, for phrases that are said again and again"""
+        if not self.cache_dir:
+            return
+        with self.condition:
+            for phrase in phrases:
+                if phrase not in self.to_render and not os.path.exists(self.cache_path(phrase)):
+                    self.to_render.append(phrase)
+            self.condition.notify()
+
+    def _next(self):
+        """Wait for the next (phrase, None) to say or (None, text) to render, (None, None) when stopped"""
+        with self.condition:
+            while self.running and not self.pending and not self.to_render:
+                self.condition.wait()
+            if self.pending:
+                alarms = [waiting for waiting in self.pending if waiting.alarm]
+                phrase = (alarms or self.pending)[0]
+                self.pending.remove(phrase)
+                return phrase, None
+            if self.running and self.to_render:
+                return None, self.to_render.pop(0)
+            return None, None
+
+    def _speak(self, phrase):
+        path = self.cache_path(phrase.text)
+        if path and os.path.exists(path):
+            command = PLAYER + [path]
+            self.played += 1
+        else:
+            command = VOICE + [phrase.text]
+        LOG.info("Speaking %s" % phrase.text)
+        process = self.start_process(command)
+        with self.condition:
+            self.speaking = (phrase, process)
+            if not phrase.alarm and any(waiting.alarm for waiting in self.pending):
+                process.terminate()  # An alarm came in while it was starting
+        process.wait()
+        with self.condition:
+            self.speaking = None
+        self.spoken += 1
+
+    def _render(self, text):
+        path = self.cache_path(text)
+        partial = path + ".part"
+        process = self.start_process(VOICE + ["-w", partial, text])
+        if process.wait() == 0 and os.path.exists(partial):
+            os.rename(partial, path)  # Never play a half written file
+        else:
+            LOG.error("Couldn't render speech for: %s" % text)
+
+    def run(self):
+        while True:
+            phrase, text = self._next()
+            if phrase is None and text is None:
+                break
+            try:
+                if phrase is not None:
+                    self._speak(phrase)
+                else:
+                    self._render(text)
+            except OSError as e:
+                LOG.error("Can't speak (%s): %s" % (phrase.text if phrase else text, e))
+
+    def stop(self, timeout=10):
+        """Say what is waiting (giving up after timeout seconds) and stop"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        LOG.info("Speech: %s spoken (%s from the cache), %s coalesced, %s dropped" % (
+            self.spoken, self.played, self.coalesced, self.dropped))
+
+
+def open_speaker():
+    """A started Speaker as set up in [speech]"""
+    speaker = Speaker(glider_config.get("speech", "cache_dir"), glider_config.getint("speech", "queue_size"))
+    speaker.start()
+    return speaker
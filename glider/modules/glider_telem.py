@@ -4,16 +4,17 @@
 # Author: Daniel Vagg
 #
 ##############################################
-import time
 import math
 import logging
 import traceback
 deg = math.degrees
 
 import datetime
-import dateutil.parser
 from threading import Thread
 from . import glider_config
+from . import glider_clock
+from . import telem_codec
+from .glider_metrics import timed
 
 ##########################################
 # GLOBALS
@@ -39,31 +40,45 @@ class TelemetryHandler():
         self.glider_state = None
         self.alien_gps_dump = {}
 
-        self.glider_data_lastsent = time.time()
-        self.telemetry_lastsent = time.time()
-        self.aliendatadump_lastsent = time.time()
+        self.glider_data_lastsent = glider_clock.monotonic()
+        self.telemetry_lastsent = glider_clock.monotonic()
+        self.aliendatadump_lastsent = glider_clock.monotonic()
 
         self.glider_data_interval = glider_config.getfloat("telemetry", "interval_data")
         self.telemetry_interval = glider_config.getfloat("telemetry", "interval_telem")
+        self.binary = glider_config.get("telemetry", "format") == "binary"
 
+    @timed("telemetry.data")
     def send_glider_data(self):
         LOG.debug("Sending glider data")
+        orientation = self.imu.snapshot()
+        location_data = self.gps.data
+        if self.binary:
+            self.radio.send_frame(telem_codec.encode_glider_data(
+                deg(orientation.roll), deg(orientation.pitch), deg(orientation.yaw),
+                self.pilot.flap_angle_scales,
+                deg(self.pilot.desired_yaw), self.pilot.desired_pitch_deg,
+                location_data.speed, location_data.track,
+                self.glider.commands_received, self.glider.last_command_dir
+            ))
+            return
         data = [
-            "O:%2.1f_%2.1f_%2.1f" % (deg(self.imu.roll), deg(self.imu.pitch), deg(self.imu.yaw)),
+            "O:%2.1f_%2.1f_%2.1f" % (deg(orientation.roll), deg(orientation.pitch), deg(orientation.yaw)),
             "W:%s" % ("_".join(["%1.2f" % float(x) for x in self.pilot.flap_angle_scales.values()])),
             "H:%s_%s" % (deg(self.pilot.desired_yaw), self.pilot.desired_pitch_deg),
-            "G:%s_%s" % (self.gps.data.speed, self.gps.data.track),
+            "G:%s_%s" % tuple("n/a" if value is None else value for value in (location_data.speed, location_data.track)),
             "C:%s_%s" % (self.glider.commands_received, self.glider.last_command_dir),
         ]
         self.radio.send_data(data)
 
+    @timed("telemetry.position")
     def send_telemetry(self):
         LOG.debug("Sending glider telemetry")
         location_data = self.gps.data
-        hhmmss = datetime.datetime.now()
-        try:
-            hhmmss = dateutil.parser.parse(location_data.time)
-        except:
+        if location_data.time is not None:
+            hhmmss = datetime.datetime.utcfromtimestamp(location_data.time)
+        else:
+            hhmmss = datetime.datetime.now()
             LOG.warning("Can't generate gps telemetry - no time fix")
         self.radio.send_telem(
             hhmmss,
@@ -77,21 +92,34 @@ class TelemetryHandler():
         self.glider_state = state
 
     def set_message(self, message):
-        self.radio.send_data(["M:%s" % message])
+        if self.binary:
+            self.radio.send_frame(telem_codec.encode_message(message))
+        else:
+            self.radio.send_data(["M:%s" % message])
+
+    def send_due(self):
+        """Send whatever is due according to the data/telemetry intervals"""
+        now = glider_clock.monotonic()
+        if now - self.glider_data_lastsent >= self.glider_data_interval:
+            self.send_glider_data()
+            self.glider_data_lastsent = now
+        if now - self.telemetry_lastsent >= self.telemetry_interval:
+            self.send_telemetry()
+            self.telemetry_lastsent = now
+
+    def next_due(self):
+        """Seconds until send_due() has something to send"""
+        due = min(self.glider_data_lastsent + self.glider_data_interval,
+                  self.telemetry_lastsent + self.telemetry_interval)
+        return max(0.0, due - glider_clock.monotonic())
 
     def telemLoop(self):
         while self.threadAlive:
             try:
-                now = time.time()
-                if now - self.glider_data_lastsent > self.glider_data_interval:
-                    self.send_glider_data()
-                    self.glider_data_lastsent = now
-                if now - self.telemetry_lastsent > self.telemetry_interval:
-                    self.send_telemetry()
-                    self.telemetry_lastsent = now
+                self.send_due()
             except:
                 LOG.error(traceback.format_exc())
-            time.sleep(0.1)
+            glider_clock.sleep(0.1)
 
     def start(self):
         LOG.info("Starting Telemetry thread")
@@ -0,0 +1,168 @@
+import os
+import mmap
+import base64
+import logging
+import threading
+from collections import deque, OrderedDict
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+
+class ImageTransfer(object):
+    """
+    One image being sent in chunks.
+
+    The file is memory mapped and each chunk is a view into the map that is
+    only base64 encoded when the transmit scheduler asks for it, so memory
+    use doesn't depend on the image size. The image can be a range of a
+    bigger file (a media store segment, see media_store). Packets:
+
+        I|S|<transfer id>|<chunk count>|<size>|<file name>
+        I|P|<transfer id>|<chunk index>|<base64 chunk>
+        I|E|<transfer id>
+    """
+
+    def __init__(self, transfer_id, path, chunk_size, offset=0, length=None, name=None):
+        self.transfer_id = transfer_id
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(path) - offset if length is None else length
+        if self.size <= 0:
+            raise ValueError("Image is empty: %s" % self.name)
+        self.chunk_count = (self.size + chunk_size - 1) // chunk_size
+        # Maps have to start on an allocation boundary
+        map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self._start = offset - map_offset
+        with open(path, "rb") as image:
+            self._map = mmap.mmap(image.fileno(), self._start + self.size, access=mmap.ACCESS_READ, offset=map_offset)
+        self._next_index = 0  # Next chunk in the first pass
+        self._resend = deque()
+        self._resend_pending = set()
+        self.started = False
+        self.ended = False
+        self.chunks_sent = 0
+
+    def chunk(self, index):
+        """Zero copy view of chunk 'index'"""
+        offset = index * self.chunk_size
+        return buffer(self._map, self._start + offset, min(self.chunk_size, self.size - offset))
+
+    def resend(self, indices):
+        """Queue chunks the ground station is missing, returns how many were accepted"""
+        accepted = 0
+        for index in indices:
+            if 0 <= index < self.chunk_count and index not in self._resend_pending:
+                self._resend.append(index)
+                self._resend_pending.add(index)
+                accepted += 1
+        if accepted:
+            # Say the transfer is finished again once the resends have gone
+            self.ended = False
+        return accepted
+
+    def has_packets(self):
+        return not self.ended
+
+    def next_packet(self):
+        if not self.started:
+            self.started = True
+            return "I|S|%s|%s|%s|%s" % (self.transfer_id, self.chunk_count, self.size, self.name)
+        if self._resend:
+            index = self._resend.popleft()
+            self._resend_pending.discard(index)
+        elif self._next_index < self.chunk_count:
+            index = self._next_index
+            self._next_index += 1
+        else:
+            self.ended = True
+            return "I|E|%s" % self.transfer_id
+        self.chunks_sent += 1
+        return "I|P|%s|%s|%s" % (self.transfer_id, index, base64.b64encode(self.chunk(index)))
+
+    def close(self):
+        self._map.close()
+
+
+class ImageDownlink(object):
+    """
+    Bulk packet source for the transmit scheduler: images are sent one
+    transfer at a time, oldest first, and the last 'keep_transfers' are
+    kept open so missing chunks can be resent on request.
+    """
+    max_transfer_id = 2 ** 16
+
+    def __init__(self, address, chunk_size=165, keep_transfers=4):
+        self.address = address
+        self.chunk_size = chunk_size  # 165 bytes is 220 base64 characters
+        self.keep_transfers = keep_transfers
+        self.transfers = OrderedDict()
+        self.active = deque()
+        self.lock = threading.Lock()
+        self.next_transfer_id = 1
+
+    def start_transfer(self, path, offset=0, length=None, name=None):
+        """Queue an image ('length' bytes at 'offset' in 'path', all of it by default), returns its transfer id"""
+        with self.lock:
+            transfer_id = self.next_transfer_id
+            self.next_transfer_id = (self.next_transfer_id + 1) % self.max_transfer_id
+            transfer = ImageTransfer(transfer_id, path, self.chunk_size, offset, length, name)
+            self.transfers[transfer_id] = transfer
+            self.active.append(transfer)
+            while len(self.transfers) > self.keep_transfers:
+                _, old = self.transfers.popitem(last=False)
+                if old in self.active:
+                    LOG.warning("Dropping unfinished image transfer %s (%s)" % (old.transfer_id, old.name))
+                    self.active.remove(old)
+                old.close()
+        LOG.info("Image transfer %s: %s (%s bytes, %s chunks)" % (
+            transfer_id, transfer.name, transfer.size, transfer.chunk_count))
+        return transfer_id
+
+    def resend(self, transfer_id, spec):
+        """
+        Resend chunks of a transfer, spec is a list of chunk indices and
+        ranges (e.g. "1,5,7-9"). Returns how many chunks will be sent.
+        """
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None:
+                LOG.error("Resend requested for unknown image transfer %s" % transfer_id)
+                return 0
+            accepted = transfer.resend(parse_indices(spec, transfer.chunk_count))
+            if accepted and transfer not in self.active:
+                self.active.append(transfer)
+        LOG.info("Resending %s chunks of image transfer %s" % (accepted, transfer_id))
+        return accepted
+
+    def next_packet(self):
+        """The next (data, address) to send, None when there is nothing to send"""
+        with self.lock:
+            while self.active:
+                transfer = self.active[0]
+                if transfer.has_packets():
+                    return transfer.next_packet(), self.address
+                self.active.popleft()
+            return None
+
+    def close(self):
+        with self.lock:
+            for transfer in self.transfers.values():
+                transfer.close()
+            self.transfers.clear()
+            self.active.clear()
+
+
+def parse_indices(spec, count):
+    """'1,5,7-9' -> [1, 5, 7, 8, 9], leaving out anything not below count"""
+    indices = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            indices.extend(range(max(0, int(first)), min(count, int(last) + 1)))
+        elif 0 <= int(part) < count:
+            indices.append(int(part))
+    return indices
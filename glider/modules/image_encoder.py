@@ -0,0 +1,166 @@
+import io
+import os
+import logging
+import threading
+import traceback
+import multiprocessing
+
+from PIL import Image
+
+from . import glider_logging
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+# Output kinds: (kind, name[, size])
+DOWNLINK_JPEG = "downlink_jpeg"  # Small palette reduced JPEG for the radio
+ARCHIVE_PNG = "archive_png"      # Full quality
+THUMBNAIL = "thumbnail"          # JPEG scaled to fit 'size'
+
+
+class RawFrame(object):
+    """
+    An unencoded RGB frame as it comes off the camera. The camera pads the
+    buffer (width to a multiple of 32, height to 16), 'buffer_size' is the
+    padded size and 'size' the picture inside it.
+    """
+    __slots__ = ("data", "size", "buffer_size")
+
+    def __init__(self, data, size, buffer_size=None):
+        self.data = data
+        self.size = size
+        self.buffer_size = buffer_size or size
+
+    def __getstate__(self):
+        return self.data, self.size, self.buffer_size
+
+    def __setstate__(self, state):
+        self.data, self.size, self.buffer_size = state
+
+    def image(self):
+        image = Image.frombytes("RGB", self.buffer_size, self.data)
+        if self.buffer_size != self.size:
+            image = image.crop((0, 0) + tuple(self.size))
+        return image
+
+
+def _encoded(image, *args, **kwargs):
+    stream = io.BytesIO()
+    image.save(stream, *args, **kwargs)
+    return stream.getvalue()
+
+
+def encode_frame(frame, outputs):
+    """
+    Encode one frame into each of the outputs, returns (name, resolution, data)
+    for each. Writing the data is left to the media store (see media_store).
+    """
+    image = frame.image()
+    encoded = []
+    for output in outputs:
+        kind, name = output[0], output[1]
+        resolution = image.size
+        if kind == DOWNLINK_JPEG:
+            data = _encoded(image.convert('P', palette=Image.ADAPTIVE, colors=200).convert("RGB"),
+                            "JPEG", quality=20, optimize=True)
+        elif kind == ARCHIVE_PNG:
+            data = _encoded(image, "PNG")
+        elif kind == THUMBNAIL:
+            thumbnail = image.copy()
+            thumbnail.thumbnail(output[2], Image.ANTIALIAS)
+            data = _encoded(thumbnail, "JPEG", quality=60)
+            resolution = thumbnail.size
+        else:
+            raise ValueError("Unknown output kind: %s" % kind)
+        encoded.append((name, resolution, data))
+    return encoded
+
+
+def _encode_job(frame, outputs):
+    # Exceptions don't make it back through apply_async's callback on py2.7, so return them
+    try:
+        return True, encode_frame(frame, outputs)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def _worker_init(niceness):
+    # The glider's threads (the log writer, speech) are already running when the pool forks
+    glider_logging.after_fork()
+    # Encoding is background work, the flight control loop comes first
+    os.nice(niceness)
+
+
+class EncoderPool(object):
+    """
+    Encodes frames in worker processes, away from the GIL the control loop needs.
+
+    submit() never blocks: at most max_pending frames are queued or being
+    encoded, and a frame arriving when the pool is that far behind is dropped
+    (and counted) rather than stalling the capture loop.
+    """
+
+    def __init__(self, workers=1, max_pending=2, niceness=10):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.niceness = niceness
+        self.pool = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        LOG.info("Starting %s image encoder process(es)" % self.workers)
+        self.pool = multiprocessing.Pool(self.workers, initializer=_worker_init, initargs=(self.niceness,))
+
+    def submit(self, frame, outputs, callback=None):
+        """
+        Queue a frame for encoding, returns False if it was dropped.
+        callback(encoded) is called with encode_frame's result (in this process).
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                LOG.warning("Image encoders busy, dropped frame for %s (%s dropped)" % (outputs[0][1], self.dropped))
+                return False
+            self.pending += 1
+            self.submitted += 1
+        self.pool.apply_async(_encode_job, (frame, outputs), callback=lambda result: self._done(result, callback))
+        return True
+
+    def _done(self, result, callback=None):
+        ok, detail = result
+        with self.lock:
+            self.pending -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if ok:
+            LOG.debug("Encoded %s" % [name for name, _, _ in detail])
+            if callback is not None:
+                try:
+                    callback(detail)
+                except Exception:
+                    LOG.error("Encoded image callback failed: %s" % traceback.format_exc())
+        else:
+            LOG.error("Image encoding failed: %s" % detail)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pending": self.pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        LOG.info("Image encoder stats: %s" % self.stats())
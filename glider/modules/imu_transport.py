@@ -0,0 +1,205 @@
+import os
+import mmap
+import redis
+import struct
+import logging
+from . import glider_config
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+
+class RedisTransport(object):
+    """
+    Sample transport through the redis server.
+    Each sample is written in one pipelined transaction (MSET of the latest
+    sample plus a push onto a capped history list) and read back with one MGET.
+    The history is a list rather than a stream so it works with the redis
+    version packaged for Raspbian.
+
+    Redis keeps its data across a reboot, where the monotonic clock starts
+    again, so the keys expire sample_ttl seconds after the last publish and
+    the writer deletes whatever an earlier reader left behind.
+    """
+    keys = ["roll", "pitch", "yaw", "timestamp", "seq"]
+    history_key = "imu_history"
+
+    def __init__(self, history_length=256, sample_ttl=10, writer=False):
+        self.history_length = history_length
+        self.sample_ttl_ms = int(sample_ttl * 1000)
+        self.redis_client = redis.StrictRedis(
+            host=glider_config.get("redis_client", "host"),
+            port=glider_config.get("redis_client", "port"),
+            db=glider_config.get("redis_client", "db")
+        )
+        if writer:
+            self.redis_client.delete(self.history_key, *self.keys)
+
+    def publish(self, roll, pitch, yaw, timestamp, seq):
+        sample = [roll, pitch, yaw, timestamp, seq]
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.mset(dict(zip(self.keys, sample)))
+        pipe.lpush(self.history_key, ",".join([repr(val) for val in sample]))
+        pipe.ltrim(self.history_key, 0, self.history_length - 1)
+        for key in self.keys + [self.history_key]:
+            pipe.pexpire(key, self.sample_ttl_ms)
+        pipe.execute()
+
+    def read(self):
+        values = [float(val) if val else 0.0 for val in self.redis_client.mget(self.keys)]
+        values[4] = int(values[4])
+        return tuple(values)
+
+    def history(self, count):
+        """The most recent 'count' samples (at most the history length), oldest first"""
+        count = min(count, self.history_length)
+        history = []
+        for entry in reversed(self.redis_client.lrange(self.history_key, 0, count - 1)):
+            values = [float(val) for val in entry.split(b",")]
+            values[4] = int(values[4])
+            history.append(tuple(values))
+        return history
+
+
+class SharedMemoryTransport(object):
+    """
+    Sample transport through a memory mapped file (e.g. on /dev/shm)
+
+    Layout (little endian):
+        header: lock (uint64), ring size (uint32), padding
+        latest: one record
+        ring:   'ring size' records, record N is written to slot N % ring size
+    A record is roll, pitch, yaw, timestamp (doubles) and seq (uint64).
+
+    'lock' is a seqlock: the writer makes it odd before writing and even again
+    once done. A reader retries until it reads the same even value before and
+    after copying the data, so it never sees half of one sample and half of
+    another. Reading is plain memory access - no syscalls, no parsing.
+    There must only ever be one writer (imu_reader.py).
+
+    A writer restarted with another ring size changes it under the lock and
+    never shrinks the file, so a reader that mapped the old size can't read
+    past its end. The reader checks the ring size on each read and maps the
+    file again when it has changed.
+    """
+    header = struct.Struct("<QI4x")
+    record = struct.Struct("<ddddQ")
+    lock = struct.Struct("<Q")
+    max_read_attempts = 1000
+
+    def __init__(self, path, ring_size=256, writer=False):
+        self.path = path
+        self.ring_size = ring_size
+        self.writer = writer
+        self.size = self.header.size + self.record.size * (ring_size + 1)
+        self._mm = None
+        self._lock_value = 0
+        if writer:
+            self._open_writer()
+
+    def _open_writer(self):
+        # Reuse the existing file (rather than unlink + create) so readers that already mapped it keep working
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                # Only ever grown, a reader still on a bigger ring would fault reading past the end
+                os.ftruncate(fd, self.size)
+            self._mm = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self._lock_value = self.lock.unpack_from(self._mm, 0)[0]
+        if self._lock_value % 2:
+            # Previous writer died mid-write
+            self._lock_value += 1
+        # Under the lock, so readers see the new ring size before reading with it
+        self._lock_value += 1
+        self.lock.pack_into(self._mm, 0, self._lock_value)
+        self.header.pack_into(self._mm, 0, self._lock_value, self.ring_size)
+        self._lock_value += 1
+        self.lock.pack_into(self._mm, 0, self._lock_value)
+
+    def _open_reader(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.header.size + self.record.size:
+            return False
+        with open(self.path, "rb") as shm_file:
+            # Map the whole file, the writer decides the ring size
+            self._mm = mmap.mmap(shm_file.fileno(), 0, mmap.MAP_SHARED, mmap.PROT_READ)
+        ring_size = self.header.unpack_from(self._mm, 0)[1]
+        if not ring_size or len(self._mm) < self.header.size + self.record.size * (ring_size + 1):
+            # The writer has not finished setting up the file
+            self.close()
+            return False
+        if ring_size != self.ring_size:
+            LOG.warning("Shared memory ring size is %s, configured %s" % (ring_size, self.ring_size))
+            self.ring_size = ring_size
+        return True
+
+    def _slot_offset(self, seq):
+        return self.header.size + self.record.size * (1 + seq % self.ring_size)
+
+    def publish(self, roll, pitch, yaw, timestamp, seq):
+        mm = self._mm
+        self._lock_value += 1
+        self.lock.pack_into(mm, 0, self._lock_value)
+        self.record.pack_into(mm, self.header.size, roll, pitch, yaw, timestamp, seq)
+        self.record.pack_into(mm, self._slot_offset(seq), roll, pitch, yaw, timestamp, seq)
+        self._lock_value += 1
+        self.lock.pack_into(mm, 0, self._lock_value)
+
+    def _consistent_read(self, read_func):
+        if self._mm is None and not self._open_reader():
+            return None
+        mm = self._mm
+        for _ in range(self.max_read_attempts):
+            before, ring_size = self.header.unpack_from(mm, 0)
+            if before % 2:
+                continue
+            if ring_size != self.ring_size:
+                # The writer restarted with another ring size
+                self.close()
+                if not self._open_reader():
+                    return None
+                mm = self._mm
+                continue
+            data = read_func(mm)
+            if self.lock.unpack_from(mm, 0)[0] == before:
+                return data
+        LOG.error("Could not get a consistent read of %s" % self.path)
+        return None
+
+    def read(self):
+        sample = self._consistent_read(lambda mm: self.record.unpack_from(mm, self.header.size))
+        if sample is None:
+            return (0.0, 0.0, 0.0, 0.0, 0)
+        return sample
+
+    def history(self, count):
+        """The most recent 'count' samples (at most the ring size), oldest first"""
+
+        def read_ring(mm):
+            latest_seq = self.record.unpack_from(mm, self.header.size)[4]
+            first_seq = max(1, latest_seq - min(count, self.ring_size) + 1)
+            return [self.record.unpack_from(mm, self._slot_offset(seq)) for seq in range(first_seq, latest_seq + 1)]
+        return self._consistent_read(read_ring) or []
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def get_transport(writer=False):
+    """Build the sample transport selected by [imu] transport in glider_conf.ini"""
+    transport_type = glider_config.get("imu", "transport")
+    if transport_type == "shm":
+        return SharedMemoryTransport(
+            glider_config.get("imu", "shm_path"),
+            ring_size=glider_config.getint("imu", "history_length"),
+            writer=writer
+        )
+    if transport_type == "redis":
+        return RedisTransport(
+            history_length=glider_config.getint("imu", "history_length"),
+            sample_ttl=glider_config.getfloat("imu", "sample_ttl"),
+            writer=writer
+        )
+    raise ValueError("Unknown IMU transport: %s" % transport_type)
@@ -0,0 +1,198 @@
+import os
+import bisect
+import logging
+import threading
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+LOW = "low"
+HIGH = "high"
+THUMB = "thumb"
+VIDEO = "video"
+KINDS = {
+    "low_": LOW,
+    "high_": HIGH,
+    "thumb_": THUMB,
+    "video_": VIDEO,
+}
+
+
+def kind_for_name(name):
+    """Media kind of a capture from its file name, None for anything else"""
+    for prefix, kind in KINDS.items():
+        if name.startswith(prefix):
+            return kind
+    return None
+
+
+def scan_directory(directory, kinds=None):
+    """(path, name, kind, mtime, size) for each finished capture file in 'directory'"""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        kind = kind_for_name(name)
+        if kind is None or name.endswith(".part") or (kinds and kind not in kinds):
+            continue
+        path = os.path.join(directory, name)
+        stat = os.stat(path)
+        yield path, name, kind, stat.st_mtime, stat.st_size
+
+
+class MediaItem(object):
+    __slots__ = ("path", "kind", "timestamp", "resolution", "size", "sent")
+
+    def __init__(self, path, kind, timestamp, resolution=None, size=0, sent=False):
+        self.path = path
+        self.kind = kind
+        self.timestamp = timestamp  # Wall clock time of the capture
+        self.resolution = resolution
+        self.size = size  # Bytes
+        self.sent = sent  # Downlinked
+
+    def __repr__(self):
+        return "MediaItem(%s, %s, %.3f, %s, %s, sent=%s)" % (
+            self.path, self.kind, self.timestamp, self.resolution, self.size, self.sent)
+
+
+class _KindIndex(object):
+    """All items of one kind, ordered by time, plus the ones not sent yet"""
+
+    def __init__(self):
+        self.keys = []  # (timestamp, path), sorted
+        self.items = []  # Same order as keys
+        self.unsent_keys = []
+
+    def add(self, item):
+        key = (item.timestamp, item.path)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self.items[position] = item
+        else:
+            self.keys.insert(position, key)
+            self.items.insert(position, item)
+        unsent = bisect.bisect_left(self.unsent_keys, key)
+        listed = unsent < len(self.unsent_keys) and self.unsent_keys[unsent] == key
+        if not item.sent and not listed:
+            self.unsent_keys.insert(unsent, key)
+        elif item.sent and listed:
+            del self.unsent_keys[unsent]
+
+    def remove(self, item):
+        key = (item.timestamp, item.path)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+            del self.items[position]
+        self.mark_sent(item)
+
+    def mark_sent(self, item):
+        key = (item.timestamp, item.path)
+        position = bisect.bisect_left(self.unsent_keys, key)
+        if position < len(self.unsent_keys) and self.unsent_keys[position] == key:
+            del self.unsent_keys[position]
+
+    def newest(self, unsent):
+        if unsent:
+            if not self.unsent_keys:
+                return None
+            return self.items[bisect.bisect_left(self.keys, self.unsent_keys[-1])]
+        return self.items[-1] if self.items else None
+
+    def nearest(self, timestamp):
+        if not self.items:
+            return None
+        position = bisect.bisect_left(self.keys, (timestamp,))
+        candidates = [p for p in (position - 1, position) if 0 <= p < len(self.items)]
+        return self.items[min(candidates, key=lambda p: abs(self.keys[p][0] - timestamp))]
+
+
+class MediaCatalog(object):
+    """
+    Index of the pictures and videos in the camera's data directory, so
+    commands don't have to scan the SD card. Per kind, items are kept in
+    time order (lookups are a bisect). Which files have been downlinked is
+    appended to 'sent_log' so that survives a restart.
+    """
+    sent_log_name = "sent.log"
+
+    def __init__(self, photo_path=None):
+        self.photo_path = photo_path
+        self.lock = threading.Lock()
+        self.kinds = {}
+        self.paths = {}
+
+    def _index(self, kind):
+        if kind not in self.kinds:
+            self.kinds[kind] = _KindIndex()
+        return self.kinds[kind]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, path, kind, timestamp, resolution=None, size=None, sent=False):
+        if size is None:
+            size = os.path.getsize(path)
+        with self.lock:
+            old = self.paths.get(path)
+            item = MediaItem(path, kind, timestamp, resolution, size, sent or (old is not None and old.sent))
+            if old is not None and (old.timestamp, old.kind) != (timestamp, kind):
+                self._index(old.kind).remove(old)
+            self.paths[path] = item
+            self._index(kind).add(item)
+        return item
+
+    def get(self, path):
+        return self.paths.get(path)
+
+    def remove(self, paths):
+        """Forget items (e.g. evicted from the media store)"""
+        with self.lock:
+            for path in paths:
+                item = self.paths.pop(path, None)
+                if item is not None:
+                    self._index(item.kind).remove(item)
+
+    def newest(self, kind, unsent=False):
+        """The newest item of a kind (optionally only from those not downlinked yet)"""
+        with self.lock:
+            return self._index(kind).newest(unsent)
+
+    def nearest(self, kind, timestamp):
+        """The item of a kind captured closest to 'timestamp'"""
+        with self.lock:
+            return self._index(kind).nearest(timestamp)
+
+    def mark_sent(self, path):
+        with self.lock:
+            item = self.paths.get(path)
+            if item is None or item.sent:
+                return
+            item.sent = True
+            self._index(item.kind).mark_sent(item)
+        if self.photo_path:
+            with open(os.path.join(self.photo_path, self.sent_log_name), "a") as sent_log:
+                sent_log.write("%s\n" % os.path.basename(path))
+
+    def rebuild(self, resolutions=None, entries=None):
+        """
+        Index what is already on disk: one listdir and one stat per file (or
+        the media store's 'entries', see media_store), at startup rather
+        than per command.
+        """
+        if entries is None:
+            if not os.path.isdir(self.photo_path):
+                LOG.warning("No media directory %s, starting with an empty catalog" % self.photo_path)
+                return 0
+            entries = scan_directory(self.photo_path)
+        resolutions = resolutions or {}
+        sent = set()
+        sent_log_path = os.path.join(self.photo_path, self.sent_log_name)
+        if os.path.exists(sent_log_path):
+            with open(sent_log_path) as sent_log:
+                sent = set(line.strip() for line in sent_log)
+        count = 0
+        for path, name, kind, timestamp, size in entries:
+            self.add(path, kind, timestamp, resolutions.get(kind), size, name in sent)
+            count += 1
+        LOG.info("Media catalog: %s items in %s" % (count, self.photo_path))
+        return count
@@ -0,0 +1,271 @@
+import os
+import re
+import logging
+import threading
+
+from . import glider_config
+from . import glider_clock
+from .media_catalog import kind_for_name, scan_directory
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+
+class FileStore(object):
+    """
+    One file per capture in the data directory (the original layout).
+    Keys are the file paths.
+    """
+
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        self.on_evict = None  # Files are never evicted
+
+    def put(self, name, data, kind, timestamp):
+        path = os.path.join(self.directory, name)
+        # Write then rename, so nobody picks up half a file
+        temp_path = "%s.part" % path
+        with open(temp_path, "wb") as media_file:
+            media_file.write(data)
+            if self.fsync:
+                media_file.flush()
+                os.fsync(media_file.fileno())
+        os.rename(temp_path, path)
+        return path
+
+    def add_file(self, path, kind, timestamp):
+        """A capture the camera wrote to a file itself (a video), it already is where it belongs"""
+        return path
+
+    def locate(self, key):
+        """(file path, offset, length) of a capture's bytes"""
+        return key, 0, os.path.getsize(key)
+
+    def read(self, key):
+        with open(key, "rb") as media_file:
+            return media_file.read()
+
+    def entries(self):
+        """(key, name, kind, timestamp, size) for everything in the store"""
+        return scan_directory(self.directory)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Segment(object):
+    __slots__ = ("kind", "number", "data_path", "index_path", "size", "keys")
+
+    def __init__(self, directory, kind, number):
+        self.kind = kind
+        self.number = number
+        self.data_path = os.path.join(directory, "%s_%08d.seg" % (kind, number))
+        self.index_path = os.path.join(directory, "%s_%08d.idx" % (kind, number))
+        self.size = 0
+        self.keys = []
+
+    @classmethod
+    def for_file(cls, path, kind, size):
+        """A file holding one capture (a video) and no index, counted and evicted like a segment"""
+        segment = cls.__new__(cls)
+        segment.kind = kind
+        segment.number = None
+        segment.data_path = path
+        segment.index_path = None
+        segment.size = size
+        segment.keys = [path]
+        return segment
+
+
+class SegmentStore(object):
+    """
+    Captures appended to large segment files, one series of segments per
+    media kind, each with a text index of "name offset length timestamp".
+
+    Appending to an open file avoids a file create (and directory update)
+    per capture, and fsync is done at most every fsync_interval seconds
+    rather than per file. When the segments are over 'budget' bytes whole
+    segments are deleted, oldest first, from the first kind in evict_order
+    that has a finished segment - so thumbnails and downlink pictures go
+    before archive pictures. Keys are the capture names (e.g. low_....jpg).
+
+    Videos are recorded straight to files by the camera; add_file() counts
+    them against the budget too, each one evicted like a whole segment.
+    Their keys are the file paths.
+    """
+    segment_pattern = re.compile(r"^([a-z]+)_(\d{8})\.idx$")
+
+    def __init__(self, directory, segment_size=64 * 2 ** 20, budget=4 * 2 ** 30,
+                 fsync_interval=5.0, evict_order=("thumb", "low", "video", "high")):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.budget = budget
+        self.fsync_interval = fsync_interval
+        self.evict_order = list(evict_order)
+        self.on_evict = None  # on_evict(keys) when segments are deleted
+        self.lock = threading.Lock()
+        self.segments = {}  # kind -> [_Segment], oldest first
+        self.locations = {}  # key -> (_Segment, offset, length)
+        self.total_size = 0
+        self._entries = []
+        self._open_files = {}  # kind -> (data file, index file)
+        self._retired_files = []  # Of finished segments, closed at the next sync
+        self._unsynced = set()
+        self._last_sync = glider_clock.monotonic()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._load()
+
+    def _load(self):
+        names = sorted(name for name in os.listdir(self.directory) if self.segment_pattern.match(name))
+        for index_name in names:
+            kind, number = self.segment_pattern.match(index_name).groups()
+            segment = _Segment(self.directory, kind, int(number))
+            data_size = os.path.getsize(segment.data_path) if os.path.exists(segment.data_path) else 0
+            with open(segment.index_path) as index_file:
+                for line in index_file:
+                    parts = line.split()
+                    if len(parts) != 4:
+                        continue  # Torn write of the last line
+                    name, offset, length, timestamp = parts[0], int(parts[1]), int(parts[2]), float(parts[3])
+                    if offset + length > data_size:
+                        LOG.warning("%s in %s is past the end of the segment, dropped" % (name, segment.data_path))
+                        continue
+                    self.locations[name] = (segment, offset, length)
+                    segment.keys.append(name)
+                    self._entries.append((name, name, kind_for_name(name), timestamp, length))
+            segment.size = data_size
+            self.total_size += data_size
+            self.segments.setdefault(kind, []).append(segment)
+
+    def _active(self, kind, needed):
+        segments = self.segments.setdefault(kind, [])
+        if segments and segments[-1].size and segments[-1].size + needed > self.segment_size:
+            self._retired_files.extend(self._open_files.pop(kind, ()))
+        if not segments or kind not in self._open_files:
+            if not segments or segments[-1].size:
+                number = segments[-1].number + 1 if segments else 0
+                segments.append(_Segment(self.directory, kind, number))
+            segment = segments[-1]
+            self._open_files[kind] = (open(segment.data_path, "ab"), open(segment.index_path, "a"))
+        return segments[-1]
+
+    def put(self, name, data, kind, timestamp):
+        with self.lock:
+            segment = self._active(kind, len(data))
+            data_file, index_file = self._open_files[kind]
+            offset = segment.size
+            data_file.write(data)
+            data_file.flush()  # Into the page cache, so readers (e.g. the image downlink) see it
+            index_file.write("%s %d %d %.6f\n" % (name, offset, len(data), timestamp))
+            index_file.flush()
+            segment.size += len(data)
+            segment.keys.append(name)
+            self.locations[name] = (segment, offset, len(data))
+            self.total_size += len(data)
+            self._unsynced.add(kind)
+            now = glider_clock.monotonic()
+            if now - self._last_sync >= self.fsync_interval:
+                self._sync(now)
+            evicted = self._enforce_budget()
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return name
+
+    def add_file(self, path, kind, timestamp):
+        """Count a capture the camera wrote to a file itself (a video) against the budget"""
+        with self.lock:
+            segment = _Segment.for_file(path, kind, os.path.getsize(path))
+            self.segments.setdefault(kind, []).append(segment)
+            self.locations[path] = (segment, 0, segment.size)
+            self.total_size += segment.size
+            evicted = self._enforce_budget()
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return path
+
+    def _sync(self, now):
+        for kind in self._unsynced:
+            if kind in self._open_files:
+                for open_file in self._open_files[kind]:
+                    os.fsync(open_file.fileno())
+        for open_file in self._retired_files:
+            os.fsync(open_file.fileno())
+            open_file.close()
+        self._retired_files = []
+        self._unsynced.clear()
+        self._last_sync = now
+
+    def _enforce_budget(self):
+        evicted = []
+        while self.total_size > self.budget:
+            segment = self._oldest_evictable()
+            if segment is None:
+                LOG.error("Media over budget (%s > %s bytes) with nothing left to evict" % (self.total_size, self.budget))
+                break
+            LOG.warning("Media over budget, deleting %s (%s captures)" % (segment.data_path, len(segment.keys)))
+            self.segments[segment.kind].remove(segment)
+            for key in segment.keys:
+                location = self.locations.get(key)
+                if location is not None and location[0] is segment:
+                    del self.locations[key]
+                    evicted.append(key)
+            self.total_size -= segment.size
+            for path in (segment.data_path, segment.index_path):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+        return evicted
+
+    def _oldest_evictable(self):
+        kinds = self.evict_order + sorted(kind for kind in self.segments if kind not in self.evict_order)
+        for kind in kinds:
+            segments = self.segments.get(kind, [])
+            # Never the segment being written to
+            finished = segments[:-1] if kind in self._open_files else segments
+            if finished:
+                return finished[0]
+        return None
+
+    def locate(self, key):
+        segment, offset, length = self.locations[key]
+        return segment.data_path, offset, length
+
+    def read(self, key):
+        path, offset, length = self.locate(key)
+        with open(path, "rb") as segment_file:
+            segment_file.seek(offset)
+            return segment_file.read(length)
+
+    def entries(self):
+        """(key, name, kind, timestamp, size) for what was in the store when it was opened"""
+        return [entry for entry in self._entries if entry[0] in self.locations]
+
+    def flush(self):
+        with self.lock:
+            self._sync(glider_clock.monotonic())
+
+    def close(self):
+        with self.lock:
+            self._sync(glider_clock.monotonic())
+            for kind in list(self._open_files):
+                for open_file in self._open_files.pop(kind):
+                    open_file.close()
+
+
+def get_store(directory):
+    """Build the media store selected by [camera] storage in glider_conf.ini"""
+    storage = glider_config.get("camera", "storage")
+    if storage == "files":
+        return FileStore(directory)
+    if storage == "segments":
+        return SegmentStore(
+            directory,
+            segment_size=glider_config.getint("camera", "segment_size_mb") * 2 ** 20,
+            budget=glider_config.getint("camera", "storage_budget_mb") * 2 ** 20,
+            fsync_interval=glider_config.getfloat("camera", "fsync_interval"),
+            evict_order=[kind.strip() for kind in glider_config.get("camera", "evict_order").split(",")]
+        )
+    raise ValueError("Unknown camera storage: %s" % storage)
@@ -0,0 +1,127 @@
+import math
+import logging
+import threading
+from collections import namedtuple
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+EARTH_RADIUS = 6371000.0  # Metres, mean
+
+
+class Waypoint(object):
+    """A route point, with its n-vector (unit vector from the earth's centre) worked out once"""
+    __slots__ = ("lat", "lon", "x", "y", "z")
+
+    def __init__(self, lat, lon):
+        lat, lon = float(lat), float(lon)
+        if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            raise ValueError("Bad waypoint: %s,%s" % (lat, lon))
+        self.lat = lat
+        self.lon = lon
+        self.x, self.y, self.z = n_vector(lat, lon)
+
+    def __repr__(self):
+        return "Waypoint(%s, %s)" % (self.lat, self.lon)
+
+
+def n_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def _leg_normal(start, end):
+    """Unit normal of the great circle from start to end (n-vectors), None if they are the same point"""
+    x = start[1] * end[2] - start[2] * end[1]
+    y = start[2] * end[0] - start[0] * end[2]
+    z = start[0] * end[1] - start[1] * end[0]
+    length = math.sqrt(x * x + y * y + z * z)
+    if length < 1e-12:
+        return None
+    return x / length, y / length, z / length
+
+
+class Navigation(namedtuple("Navigation", ["bearing", "distance", "cross_track", "waypoint", "index"])):
+    """
+    bearing (radians from north, 0 to 2pi) and distance (metres) to the
+    current waypoint, cross_track the distance (metres) off the leg to it,
+    positive to the right, None when the leg has no start yet.
+    """
+    __slots__ = ()
+
+
+class Navigator(object):
+    """
+    Follows a route of waypoints, moving on to the next one within
+    arrival_radius metres of the current one (the last one is kept).
+
+    Everything about the route that doesn't depend on the position is
+    worked out in set_route(): each waypoint's n-vector and each leg's
+    great circle normal. An update is then one n-vector for the position
+    (sin/cos of lat and lon) and a few dot products: bearing, distance
+    and cross track error take an atan2, an atan2 and an asin between them.
+    The first leg starts wherever the glider is at the first update after
+    the route is set.
+    """
+
+    def __init__(self, arrival_radius=150.0):
+        self.arrival_radius = arrival_radius
+        self.lock = threading.Lock()
+        self.route = []
+        self.index = 0
+        self.leg_normals = []  # leg_normals[i] is for the leg ending at route[i]
+        self.arrivals = 0
+
+    def set_route(self, waypoints):
+        """waypoints: [(lat, lon), ...] in degrees"""
+        route = [Waypoint(lat, lon) for lat, lon in waypoints]
+        if not route:
+            raise ValueError("A route needs at least one waypoint")
+        leg_normals = [None] + [_leg_normal((a.x, a.y, a.z), (b.x, b.y, b.z)) for a, b in zip(route, route[1:])]
+        with self.lock:
+            self.route = route
+            self.leg_normals = leg_normals
+            self.index = 0
+        LOG.info("New route: %s" % route)
+
+    @property
+    def waypoint(self):
+        """The waypoint being flown to"""
+        with self.lock:
+            return self.route[self.index] if self.route else None
+
+    def update(self, lat, lon):
+        """Navigation from the position (degrees), None without a route"""
+        lat, lon = math.radians(lat), math.radians(lon)
+        sin_lat, cos_lat = math.sin(lat), math.cos(lat)
+        sin_lon, cos_lon = math.sin(lon), math.cos(lon)
+        px, py, pz = cos_lat * cos_lon, cos_lat * sin_lon, sin_lat
+        with self.lock:
+            if not self.route:
+                return None
+            while True:
+                waypoint = self.route[self.index]
+                wx, wy, wz = waypoint.x, waypoint.y, waypoint.z
+                # Angle between the position and the waypoint, from both the sine and cosine so it is accurate close in
+                cx, cy, cz = py * wz - pz * wy, pz * wx - px * wz, px * wy - py * wx
+                distance = EARTH_RADIUS * math.atan2(math.sqrt(cx * cx + cy * cy + cz * cz),
+                                                     px * wx + py * wy + pz * wz)
+                if distance > self.arrival_radius or self.index == len(self.route) - 1:
+                    break
+                self.index += 1
+                self.arrivals += 1
+                LOG.info("Reached waypoint %s %s, next %s" % (self.index - 1, waypoint, self.route[self.index]))
+            if self.leg_normals[self.index] is None and self.index == 0:
+                # The first leg starts here
+                self.leg_normals[0] = _leg_normal((px, py, pz), (wx, wy, wz))
+            normal = self.leg_normals[self.index]
+            index = self.index
+        # The waypoint in the position's east/north plane
+        east = -sin_lon * wx + cos_lon * wy
+        north = -sin_lat * (cos_lon * wx + sin_lon * wy) + cos_lat * wz
+        bearing = math.atan2(east, north) % (2 * math.pi)
+        cross_track = None
+        if normal is not None:
+            # The normal points left of the direction of travel
+            cross_track = -EARTH_RADIUS * math.asin(max(-1.0, min(1.0, px * normal[0] + py * normal[1] + pz * normal[2])))
+        return Navigation(bearing, distance, cross_track, waypoint, index)
@@ -15,6 +15,113 @@ DLE = 0x10
 STX = 0x02
 ETX = 0x03
 BROADCAST = 0xFF
+DLE_BYTE = b"\x10"
+ETX_BYTE = b"\x03"
+DLE_STX = b"\x10\x02"
+ETX_TAIL = b"\x10\x03"
+CRC = struct.Struct(">H")
+
+def build_frame(msg, to=0xFF, frm=0xFF, id=0):
+    """
+    The bytes put on the wire for one message.
+    DLEs inside the frame are doubled so a binary payload (or an id of 0x10)
+    can't be mistaken for the DLE ETX at the end of the frame.
+    """
+    msghead = bytearray.fromhex("10 02")
+    message = bytearray([to, frm, id, 0x00]) + bytearray(msg)
+    msgtail = bytearray.fromhex("10 03")
+    checksum = bytearray(struct.pack(">H", crc16(str(message + msgtail))))
+    return msghead + message.replace(b"\x10", b"\x10\x10") + msgtail + checksum
+
+
+class FrameDecoder(object):
+    """
+    Incremental decoder for the DLE STX ... DLE ETX CRC frames.
+
+    feed() takes whatever was read from the port and returns the messages
+    (to, from, id, flags, payload) completed by it. The scanning is done with
+    str.find, so the per byte work stays in C, and the CRC is taken over the
+    message as it is found. Unless the message contained escaped DLEs, the
+    returned message is a buffer() over the data that was read - no copy.
+    A partial frame at the end is kept for the next feed().
+    """
+    header_size = 4
+    max_frame_size = 1024  # Give up on a frame that hasn't ended after this many bytes
+
+    def __init__(self):
+        self.reset()
+        self.frames = 0
+        self.crc_errors = 0
+        self.aborted = 0
+
+    def reset(self):
+        self._pending = b""
+
+    def feed(self, data):
+        data = self._pending + data if self._pending else bytes(data)
+        end = len(data)
+        messages = []
+        pos = 0
+        while True:
+            start = data.find(DLE_STX, pos)
+            if start < 0:
+                # A trailing DLE could be the start of the next frame
+                pos = end - 1 if data.endswith(DLE_BYTE) else end
+                break
+            body = start + 2
+            frame_end, escaped = self._find_end(data, body, end)
+            if frame_end is None:
+                if end - start > self.max_frame_size:
+                    self.aborted += 1
+                    pos = body
+                    continue
+                pos = start  # Incomplete, wait for more
+                break
+            if frame_end < 0:
+                # Bare DLE inside a frame, drop the frame and resync from that DLE
+                self.aborted += 1
+                pos = -frame_end
+                continue
+            if frame_end + 4 > end:
+                pos = start  # Waiting for the CRC
+                break
+            pos = frame_end + 4
+            if escaped:
+                message = data[body:frame_end].replace(DLE_BYTE + DLE_BYTE, DLE_BYTE)
+            else:
+                message = buffer(data, body, frame_end - body)
+            crc = crc16(ETX_TAIL, crc16(message))
+            if crc != CRC.unpack_from(data, frame_end + 2)[0]:
+                self.crc_errors += 1
+                continue
+            if len(message) < self.header_size:
+                self.aborted += 1
+                continue
+            self.frames += 1
+            messages.append(message if not escaped else buffer(message))
+        self._pending = data[pos:]
+        return messages
+
+    @staticmethod
+    def _find_end(data, scan, end):
+        """
+        Position of the DLE ETX ending the frame whose body starts at scan,
+        and whether the body has escaped DLEs.
+        None if the data ends first, minus the position of a bare DLE.
+        """
+        escaped = False
+        while True:
+            dle = data.find(DLE_BYTE, scan)
+            if dle < 0 or dle + 1 >= end:
+                return None, escaped
+            marker = data[dle + 1:dle + 2]
+            if marker == ETX_BYTE:
+                return dle, escaped
+            if marker != DLE_BYTE:
+                return -dle, escaped
+            escaped = True
+            scan = dle + 2
+
 
 class RHSerial(object):
 
@@ -25,109 +132,65 @@ class RHSerial(object):
         self.promiscuous = promiscuous
         self.listen = False
         self.listen_thread = None
+        self.decoder = FrameDecoder()
 
-    def start(self):
+    def start(self, threaded=True):
         if self.listen:
             raise Exception("RHserial is being started again. Don't do this! It screws the serial connection.")
         self.listen = True
+        if not threaded:
+            return  # glider_runtime calls read_available() when the port is readable
         self.listen_thread = Thread(target=self._listen_for_msg, args=[])
         self.listen_thread.start()
 
     def stop(self):
         self.listen = False
-        self.listen_thread.join()
+        if self.listen_thread is not None:
+            self.listen_thread.join()
         self.serial.close()
 
     def _listen_for_msg(self):
-        message = bytearray()
-        checksum = bytearray()
-        state = 'IDLE'
-
         while self.listen:
             try:
-                byte = self.serial.read()
-                if byte:
-                    if state == 'IDLE':
-                        # looking for a DLE to start.
-                        if ord(byte) == DLE:
-                            # Got a DLE, enter STX state.
-                            state = 'STX'
-                    elif state == 'STX':
-                        # looking for a STX to begin reading message.
-                        if ord(byte) == STX:
-                            # Got a STX, enter MESSAGE state and clear out message.
-                            state = 'MESSAGE'
-                            message = bytearray()
-                    elif state == 'MESSAGE':
-                        # looking for DLEs to either escpae a DLE or end the message.
-                        if ord(byte) == DLE:
-                            # Got a DLE, enter MSGDLE state.
-                            state = 'MSGDLE'
-                        else:
-                            # It's part of the message, add it to the message.
-                            message.append(ord(byte))
-                    elif state == 'MSGDLE':
-                        # Looking for a DLE or a ETX.
-                        if ord(byte) == DLE:
-                            # It's a DLE that's part of the message.
-                            message.append(ord(byte))
-                            state = 'MESSAGE'
-                        elif ord(byte) == ETX:
-                            # It's an ETX, we're done with the message, move on to the checksum.
-                            message.append(DLE)
-                            message.append(ETX)
-                            state = 'CHECKSUM1'
-                            checksum = bytearray()
-                        else:
-                            # This shouldn't have happened. Let's abort and go back to the IDLE state.
-                            state = 'IDLE'
-                    elif state == 'CHECKSUM1':
-                        checksum.append(ord(byte))
-                        state = 'CHECKSUM2'
-                    elif state == 'CHECKSUM2':
-                        checksum.append(ord(byte))
-                        # All done, let's check the sum and process the message.
-                        calcedcheck = bytearray(struct.pack(">H", crc16(str(message))))
-                        if calcedcheck == checksum:
-                            # Process message.
-                            msgdict = self._processmsg(message)
-                            if msgdict and self.callback:
-                                self.callback(msgdict)
-                        # Either we processed the message or it didn't pass the checksum, either way let's start over.
-                        state = 'IDLE'
+                # Wait (up to the port timeout) for the first byte, take everything already buffered in the same call
+                data = self.serial.read(max(1, self.serial.inWaiting()))
+                if not data:
+                    continue
+                self._receive(data)
             except Exception as e:
                 print "Throwing away unexpected exception (%s), resetting state"  % e
                 time.sleep(1)
-                state = 'IDLE'
+                self.decoder.reset()
+
+    def read_available(self):
+        """Handle whatever the port has buffered, without waiting for more"""
+        try:
+            self._receive(self.serial.read(self.serial.inWaiting()))
+        except Exception as e:
+            LOG.error("Throwing away unexpected exception (%s), resetting state" % e)
+            self.decoder.reset()
 
+    def _receive(self, data):
+        for message in self.decoder.feed(data):
+            msgdict = self._processmsg(message)
+            if msgdict and self.callback:
+                self.callback(msgdict)
 
     def send(self, msg, to=0xFF, id=0):
         if not self.serial.isOpen():
             raise Exception("Serial port is not open. Start thread to open port.")
-        msghead = bytearray.fromhex("10 02")
-        msgto = chr(to)
-        msgfrom = chr(self.address)
-        msgid = chr(id)
-        msgflag = chr(0x00)
-        message = bytearray(msg)
-        msgtail = bytearray.fromhex("10 03")
-        checkable = msgto + msgfrom + msgid + msgflag + message + msgtail
-        checksum = bytearray(struct.pack(">H", crc16(str(checkable))))
-        full = msghead + checkable + checksum
-        self.serial.write(full)
+        self.serial.write(build_frame(msg, to=to, frm=self.address, id=id))
 
     def _processmsg(self, msg):
-        msgto = msg[0]
-        LOG.debug("raw: %s" % msg)
+        msgto, msgfrom, msgid, rawrssi = bytearray(msg[:4])
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("raw: %r" % msg[:])
         if msgto in [BROADCAST, self.address] or self.promiscuous:
-            msgfrom = msg[1]
-            msgid = msg[2]
-            rawrssi = msg[3]
             if rawrssi > 127:
                 msgrssi = rawrssi - 256
             else:
                 msgrssi = rawrssi
-            payload = msg[4:-2]
+            payload = buffer(msg, 4)
             msgdict = {'to': msgto,
                         'from': msgfrom,
                         'id': msgid,
@@ -135,4 +198,4 @@ class RHSerial(object):
                         'message': payload,
                         }
             return msgdict
-        else: return None
\ No newline at end of file
+        else: return None
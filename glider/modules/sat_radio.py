@@ -1,12 +1,16 @@
 import logging
 from rhserial import RHSerial
+import telem_codec
 
 LOG = logging.getLogger("glider.%s" % __name__)
 
 class SatRadio(RHSerial):
     BROADCAST = 0xFF
 
-    def __init__(self, port, address, callsign, baud_rate=38400, callback=None):
+    def __init__(self, port, address, callsign, baud_rate=38400, callback=None, telemetry_format="text"):
+        if telemetry_format not in ("text", "binary"):
+            raise ValueError("Unknown telemetry format: %s" % telemetry_format)
+        self.telemetry_format = telemetry_format
         self.frame_count = 1
         self.telem_index = 1
         self.callsign = callsign
@@ -37,13 +41,13 @@ class SatRadio(RHSerial):
         # Time
         telem_str += hhmmss.strftime("|%H%M%S") if hhmmss else "|      "
         # GPS stuff
-        telem_str += "|%+08.05f" % lat_dec_deg if type(lat_dec_deg) != str else "|        "
-        telem_str += "|%+09.05f" % lon_dec_deg if type(lon_dec_deg) != str else "|         "
-        telem_str += "|%05.02f" % lat_dil if type(lat_dil) != str else "|     "
-        telem_str += "|%08.02f" % alt if type(alt) != str else "|        "
+        telem_str += "|%+08.05f" % lat_dec_deg if lat_dec_deg is not None else "|        "
+        telem_str += "|%+09.05f" % lon_dec_deg if lon_dec_deg is not None else "|         "
+        telem_str += "|%05.02f" % lat_dil if lat_dil is not None else "|     "
+        telem_str += "|%08.02f" % alt if alt is not None else "|        "
 
-        telem_str += "|%+09.05f" % dest_lat_deg if type(dest_lat_deg) != str else "|         "
-        telem_str += "|%+08.05f" % dest_lon_deg if type(dest_lon_deg) != str else "|        "
+        telem_str += "|%+09.05f" % dest_lat_deg if dest_lat_deg is not None else "|         "
+        telem_str += "|%+08.05f" % dest_lon_deg if dest_lon_deg is not None else "|        "
         telem_str += "|%s" % state
 
         return telem_str
@@ -51,8 +55,8 @@ class SatRadio(RHSerial):
     def _encode_data(self, data):
         return b'%s' % data
  
-    def start(self):
-        self.radio.start()
+    def start(self, threaded=True):
+        self.radio.start(threaded)
  
     def stop(self):
         self.radio.stop()
@@ -66,21 +70,35 @@ class SatRadio(RHSerial):
 
         return frame_id
  
-    def send_telem(self, hhmmss, 
+    def construct_telem(self, hhmmss,
         lat_dec_deg, lon_dec_deg,
         lat_dil, alt,
         dest_lat_deg, dest_lon_deg,
         state):
-        data = self._construct_telemetry(
-            self.callsign.ljust(8)[:8], 
-            self.telem_index, hhmmss, 
-            lat_dec_deg, lon_dec_deg,
-            lat_dil, alt,
-            dest_lat_deg, dest_lon_deg,
-            state
-        )
+        """The next telemetry packet in the configured format"""
+        if self.telemetry_format == "binary":
+            # The callsign is left out, the frame header already says who sent it
+            data = telem_codec.encode_telemetry(
+                self.telem_index, hhmmss,
+                lat_dec_deg, lon_dec_deg,
+                lat_dil, alt,
+                dest_lat_deg, dest_lon_deg,
+                state
+            )
+        else:
+            data = self._construct_telemetry(
+                self.callsign.ljust(8)[:8],
+                self.telem_index, hhmmss,
+                lat_dec_deg, lon_dec_deg,
+                lat_dil, alt,
+                dest_lat_deg, dest_lon_deg,
+                state
+            )
         self.telem_index += 1
-        return self.send_packet(data)
+        return data
+
+    def send_telem(self, *telemetry):
+        return self.send_packet(self.construct_telem(*telemetry))
  
     def send_data(self, data):
         return self.send_packet(data)
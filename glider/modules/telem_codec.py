@@ -0,0 +1,197 @@
+"""
+Binary telemetry frames.
+
+This module is the schema for both ends of the link: the glider encodes with
+it and the ground station decodes with it, so keep it free of glider imports.
+
+Every frame starts with a version byte (high bit set, so it can never be
+mistaken for the text formats which start with an ASCII letter) and a frame
+type byte. Fields are fixed point, little endian:
+
+    T  telemetry     index, time of day, position, position error, altitude,
+                     destination, state
+    D  glider data   attitude, flap scales, desired heading/pitch, GPS speed
+                     and track, commands received and the last command
+    M  message       free text
+
+Values that are missing (None, e.g. no GPS fix) are
+sent as the field's MISSING value and decoded as None.
+"""
+import math
+import struct
+import datetime
+from collections import namedtuple
+
+VERSION = 0x81  # 0x80 | version number
+
+TELEMETRY = b"T"
+GLIDER_DATA = b"D"
+MESSAGE = b"M"
+
+# Append only, the index of a state is what goes over the air
+STATES = (
+    "PACKAGING", "HEALTH_CHECK", "ASCENT", "RELEASE", "FLIGHT",
+    "PARACHUTE", "RECOVER", "ERROR", "TEST_CHUTE", "TEST_RELEASE",
+)
+FLAPS = ("rudder", "rear", "left_near", "right_near", "left_far", "right_far")
+
+HEADER = struct.Struct("<Bc")
+# index, seconds of day, lat, lon (1e-7 deg), epx (cm), alt (cm), dest lat, dest lon (1e-7 deg), state
+TELEMETRY_BODY = struct.Struct("<HIiiHiiiB")
+# roll, pitch, yaw (0.01 deg), flap scales (1/250), desired yaw, desired pitch (0.01 deg),
+# speed (cm/s), track (0.01 deg), commands received, last command
+GLIDER_DATA_BODY = struct.Struct("<hhh6BhhhhH4s")
+
+MISSING_INT32 = -2 ** 31
+MISSING_INT16 = -2 ** 15
+MISSING_UINT32 = 2 ** 32 - 1
+MISSING_UINT16 = 2 ** 16 - 1
+MISSING_UINT8 = 2 ** 8 - 1
+
+DEG_E7 = 1e7
+CENTI = 100.0
+SCALE_STEPS = 250.0
+
+Telemetry = namedtuple("Telemetry", "index time lat lon epx alt dest_lat dest_lon state")
+GliderData = namedtuple("GliderData", "roll pitch yaw flap_scales desired_yaw desired_pitch speed track commands_received last_command")
+
+
+class TelemetryDecodeError(ValueError):
+    pass
+
+
+def _number(value):
+    """value as a float, or None when it is missing/not a number"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return value
+
+
+def _fixed(value, factor, low, high, missing):
+    value = _number(value)
+    if value is None:
+        return missing
+    return int(min(high, max(low, round(value * factor))))
+
+
+def _int32(value, factor):
+    return _fixed(value, factor, MISSING_INT32 + 1, 2 ** 31 - 1, MISSING_INT32)
+
+
+def _int16(value, factor):
+    return _fixed(value, factor, MISSING_INT16 + 1, 2 ** 15 - 1, MISSING_INT16)
+
+
+def _uint16(value, factor):
+    return _fixed(value, factor, 0, MISSING_UINT16 - 1, MISSING_UINT16)
+
+
+def _angle(degrees):
+    """-180 to 180 degrees in 0.01 degree steps"""
+    degrees = _number(degrees)
+    if degrees is None:
+        return MISSING_INT16
+    return _int16((degrees + 180) % 360 - 180, CENTI)
+
+
+def _unfixed(value, factor, missing):
+    return None if value == missing else value / factor
+
+
+def encode_telemetry(index, hhmmss, lat, lon, epx, alt, dest_lat, dest_lon, state):
+    """The binary equivalent of SatRadio._construct_telemetry"""
+    if hhmmss:
+        seconds_of_day = hhmmss.hour * 3600 + hhmmss.minute * 60 + hhmmss.second
+    else:
+        seconds_of_day = MISSING_UINT32
+    state_index = STATES.index(state) if state in STATES else MISSING_UINT8
+    return HEADER.pack(VERSION, TELEMETRY) + TELEMETRY_BODY.pack(
+        index % 2 ** 16, seconds_of_day,
+        _int32(lat, DEG_E7), _int32(lon, DEG_E7),
+        _uint16(epx, CENTI), _int32(alt, CENTI),
+        _int32(dest_lat, DEG_E7), _int32(dest_lon, DEG_E7),
+        state_index
+    )
+
+
+def encode_glider_data(roll, pitch, yaw, flap_scales, desired_yaw, desired_pitch,
+                       speed, track, commands_received, last_command):
+    """
+    The binary equivalent of TelemetryHandler.send_glider_data's text fields.
+    Angles are in degrees, flap_scales is a dict keyed by the names in FLAPS.
+    """
+    scales = [_fixed(flap_scales.get(flap), SCALE_STEPS, 0, MISSING_UINT8 - 1, MISSING_UINT8) for flap in FLAPS]
+    return HEADER.pack(VERSION, GLIDER_DATA) + GLIDER_DATA_BODY.pack(
+        _angle(roll), _angle(pitch), _angle(yaw),
+        *(scales + [
+            _angle(desired_yaw), _angle(desired_pitch),
+            _int16(speed, CENTI), _angle(track),
+            int(commands_received) % 2 ** 16,
+            str(last_command or "")[:4],
+        ])
+    )
+
+
+def encode_message(message):
+    if not isinstance(message, bytes):
+        message = message.encode("utf-8")
+    return HEADER.pack(VERSION, MESSAGE) + message
+
+
+def is_binary(frame):
+    """True for frames from this codec, False for the text formats"""
+    return len(frame) >= HEADER.size and bytearray(frame[:1])[0] & 0x80 != 0
+
+
+def decode(frame):
+    """
+    Decode a frame from encode_*.
+    Returns (frame type, Telemetry/GliderData/message text)
+    """
+    frame = bytes(frame)
+    if len(frame) < HEADER.size:
+        raise TelemetryDecodeError("Frame too short: %s bytes" % len(frame))
+    version, frame_type = HEADER.unpack_from(frame)
+    if version != VERSION:
+        raise TelemetryDecodeError("Unsupported telemetry version: 0x%02x" % version)
+    body = frame[HEADER.size:]
+    try:
+        if frame_type == TELEMETRY:
+            return frame_type, _decode_telemetry(body)
+        if frame_type == GLIDER_DATA:
+            return frame_type, _decode_glider_data(body)
+    except struct.error as e:
+        raise TelemetryDecodeError("Bad %s frame: %s" % (frame_type, e))
+    if frame_type == MESSAGE:
+        return frame_type, body.decode("utf-8", "replace")
+    raise TelemetryDecodeError("Unknown frame type: %r" % frame_type)
+
+
+def _decode_telemetry(body):
+    (index, seconds_of_day, lat, lon, epx, alt,
+     dest_lat, dest_lon, state_index) = TELEMETRY_BODY.unpack(body)
+    time_of_day = None
+    if seconds_of_day != MISSING_UINT32:
+        time_of_day = datetime.time(seconds_of_day // 3600, seconds_of_day // 60 % 60, seconds_of_day % 60)
+    return Telemetry(
+        index, time_of_day,
+        _unfixed(lat, DEG_E7, MISSING_INT32), _unfixed(lon, DEG_E7, MISSING_INT32),
+        _unfixed(epx, CENTI, MISSING_UINT16), _unfixed(alt, CENTI, MISSING_INT32),
+        _unfixed(dest_lat, DEG_E7, MISSING_INT32), _unfixed(dest_lon, DEG_E7, MISSING_INT32),
+        STATES[state_index] if state_index < len(STATES) else None
+    )
+
+
+def _decode_glider_data(body):
+    values = GLIDER_DATA_BODY.unpack(body)
+    roll, pitch, yaw = [_unfixed(v, CENTI, MISSING_INT16) for v in values[0:3]]
+    flap_scales = dict(zip(FLAPS, [_unfixed(v, SCALE_STEPS, MISSING_UINT8) for v in values[3:9]]))
+    desired_yaw, desired_pitch, speed, track = [_unfixed(v, CENTI, MISSING_INT16) for v in values[9:13]]
+    return GliderData(
+        roll, pitch, yaw, flap_scales, desired_yaw, desired_pitch, speed, track,
+        values[13], values[14].rstrip(b"\0")
+    )
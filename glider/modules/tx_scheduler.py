@@ -0,0 +1,180 @@
+import logging
+import threading
+import traceback
+from collections import deque
+
+from . import glider_clock
+
+LOG = logging.getLogger("glider.%s" % __name__)
+
+# Priority classes, lowest number goes first
+COMMAND = 0    # Command responses/acks
+TELEMETRY = 1  # Position reports
+DATA = 2       # Glider data and messages
+BULK = 3       # Image parts, sent in whatever airtime is left
+PRIORITY_NAMES = ["command", "telemetry", "data", "bulk"]
+
+FRAME_OVERHEAD = 10  # DLE STX, to/from/id/flags, DLE ETX, CRC (see rhserial.build_frame)
+
+
+def wire_size(data):
+    """Bytes the frame for 'data' takes on the wire"""
+    return len(data) + FRAME_OVERHEAD + bytes(data).count(b"\x10")
+
+
+class TransmitScheduler(object):
+    """
+    The one place packets leave the radio from.
+
+    Packets are queued per priority class and sent highest class first by a
+    single thread, so nothing is written to the port out of turn. Sending is
+    paced by a token bucket filled at the link rate (baud / 10 bytes per
+    second for 8N1) times max_utilization, so packets wait here, where they
+    can still be reordered, rather than in the UART buffer. The bucket holds
+    at most burst_bytes, so a high priority packet never waits behind more
+    than that much data already sent.
+    """
+
+    def __init__(self, send, baud_rate, burst_bytes=256, max_utilization=1.0):
+        self.send = send  # send(data, address)
+        self.bytes_per_second = baud_rate / 10.0
+        self.fill_rate = self.bytes_per_second * max_utilization
+        self.burst_bytes = burst_bytes
+        self.queues = [deque() for _ in PRIORITY_NAMES]
+        self.sources = [[] for _ in PRIORITY_NAMES]
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.waker = None  # Called instead of waking the thread when there isn't one (see glider_runtime)
+
+        self.tokens = float(burst_bytes)
+        self.last_fill = glider_clock.monotonic()
+        self.sent_packets = [0] * len(PRIORITY_NAMES)
+        self.sent_bytes = 0
+        self.started = self.last_fill
+        self.window_start = self.last_fill
+        self.window_bytes = 0
+
+    def enqueue(self, data, address, priority=DATA):
+        with self.condition:
+            self.queues[priority].append((data, address))
+            self.condition.notify()
+        if self.waker is not None:
+            self.waker()
+
+    def add_source(self, source, priority=BULK):
+        """
+        A source is asked for packets (source.next_packet() -> (data, address) or None)
+        only when its class is next to send, so it can build them as late as possible.
+        """
+        with self.condition:
+            self.sources[priority].append(source)
+
+    def wake(self):
+        """Tell the sending thread a source has packets again"""
+        with self.condition:
+            self.condition.notify()
+        if self.waker is not None:
+            self.waker()
+
+    def queue_depth(self):
+        return dict(zip(PRIORITY_NAMES, [len(queue) for queue in self.queues]))
+
+    def clear(self, priority):
+        """Drop everything waiting in one priority class, returns how many were dropped"""
+        with self.condition:
+            dropped = len(self.queues[priority])
+            self.queues[priority].clear()
+            return dropped
+
+    def stats(self):
+        """
+        Queue depth per class, packets sent per class and airtime utilization
+        (fraction of the link's bytes/second used) since the last call and since start
+        """
+        with self.condition:
+            now = glider_clock.monotonic()
+            window = now - self.window_start
+            total = now - self.started
+            stats = {
+                "queue_depth": self.queue_depth(),
+                "sent_packets": dict(zip(PRIORITY_NAMES, self.sent_packets)),
+                "sent_bytes": self.sent_bytes,
+                "utilization": self.window_bytes / (window * self.bytes_per_second) if window > 0 else 0.0,
+                "utilization_total": self.sent_bytes / (total * self.bytes_per_second) if total > 0 else 0.0,
+            }
+            self.window_start = now
+            self.window_bytes = 0
+            return stats
+
+    def _fill(self, now):
+        self.tokens = min(self.burst_bytes, self.tokens + (now - self.last_fill) * self.fill_rate)
+        self.last_fill = now
+
+    def _next_packet(self):
+        for priority, queue in enumerate(self.queues):
+            if not queue:
+                for source in self.sources[priority]:
+                    packet = source.next_packet()
+                    if packet is not None:
+                        queue.append(packet)
+                        break
+            if queue:
+                return priority, queue
+        return None, None
+
+    def send_next(self):
+        """
+        Send the highest priority packet if the bucket allows it.
+        Returns how long to wait before trying again (None when there is nothing queued).
+        """
+        with self.condition:
+            priority, queue = self._next_packet()
+            if queue is None:
+                return None
+            data, address = queue[0]
+            size = wire_size(data)
+            now = glider_clock.monotonic()
+            self._fill(now)
+            # A packet bigger than the bucket goes once the bucket is full
+            needed = min(size, self.burst_bytes)
+            if needed - self.tokens > 1e-3:  # Rounding can leave the bucket a hair short
+                return (needed - self.tokens) / self.fill_rate
+            queue.popleft()
+            self.tokens -= size
+            self.sent_packets[priority] += 1
+            self.sent_bytes += size
+            self.window_bytes += size
+        # Send outside the lock so enqueue() never waits on the serial port
+        try:
+            self.send(data, address)
+        except Exception:
+            LOG.error("Failed to send %s packet: %s" % (PRIORITY_NAMES[priority], traceback.format_exc()))
+        return 0
+
+    def _run(self):
+        while self.running:
+            wait = self.send_next()
+            if wait == 0:
+                continue
+            with self.condition:
+                if not self.running:
+                    break
+                # With nothing queued, still poll the sources now and then in case a wake() was missed
+                self.condition.wait(1 if wait is None else wait)
+
+    def start(self, threaded=True):
+        LOG.info("Starting transmit scheduler (%d bytes/s)" % self.fill_rate)
+        self.running = True
+        if not threaded:
+            return  # glider_runtime calls send_next()
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        LOG.info("Transmit scheduler stats: %s" % self.stats())
@@ -0,0 +1,411 @@
+"""
+Software in the loop simulator for the glider.
+
+Runs the real Glider state machine, Pilot, IMU and TelemetryHandler against
+stand-in GPS/IMU/PWM/camera/radio backends and a point mass glide model.
+Everything runs on a virtual clock that only moves when the glider sleeps,
+so a whole mission takes seconds. The flap scales set by the pilot drive
+the model, and the model feeds the IMU and GPS, so the loop is closed.
+
+    python simulator.py [--start-state ASCENT] [--verbose]
+"""
+import sys
+import math
+import time
+import json
+import logging
+import argparse
+
+from config import glider_config
+from modules import glider_clock
+from modules.glider_imu import IMU
+from modules.glider_gps import GPSFix, MODE_3D
+from modules.media_catalog import MediaCatalog
+from modules.flight_recorder import FlightRecorder, NullRecorder
+from modules.glider_speech import NullSpeaker
+from glider import Glider
+
+LOG = logging.getLogger("glider.simulator")
+
+GRAVITY = 9.81
+EARTH_RADIUS = 6371000.0
+
+
+class VirtualClock(object):
+    """Time that only passes when something sleeps, moving the model along with it"""
+
+    def __init__(self, model, start=1000.0):
+        self.model = model
+        self.now = start
+        self.wall_start = time.time() - start
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall_start + self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.model.advance(seconds)
+            self.now += seconds
+
+
+class GlideModel(object):
+    """
+    Point mass model of the glider.
+
+    On the balloon it rises at a fixed rate and drifts with the wind.
+    Once released, the wing flaps set the roll rate, the rear flap the pitch
+    rate and the rudder adds yaw rate on top of the turn from banking.
+    Speed comes from gravity along the flight path against quadratic drag
+    (about 20m/s at -10 degrees pitch). Under the parachute it sinks at a
+    fixed rate with the wind.
+    """
+    drag = 0.0043  # 1/m, sets the terminal speed for a given pitch
+    roll_rate = 3.0  # rad/s at full opposite wing flaps
+    pitch_rate = 1.0  # rad/s at full rear flap
+    rudder_rate = 0.2  # rad/s at full rudder
+    max_roll = math.radians(60)
+    max_pitch = math.radians(85)
+    min_turn_speed = 5.0  # m/s, avoids infinite turn rates when hanging still
+    max_step = 0.02  # s, integration step
+
+    def __init__(self, lat, lon, alt=0.0, ascent_rate=5.0, wind_north=0.0, wind_east=0.0, parachute_sink_rate=6.0):
+        self.lat = lat
+        self.lon = lon
+        self.alt = alt
+        self.ascent_rate = ascent_rate
+        self.wind_north = wind_north
+        self.wind_east = wind_east
+        self.parachute_sink_rate = parachute_sink_rate
+        self.phase = "BALLOON"
+        self.airspeed = 0.0
+        self.heading = 0.0
+        self.pitch = 0.0
+        self.roll = 0.0
+        self.velocity_north = wind_north
+        self.velocity_east = wind_east
+        self.velocity_up = ascent_rate
+        self.flap_scales = {'rudder': 0.5, 'rear': 0.5,
+                            'left_near': 0.5, 'right_near': 0.5,
+                            'left_far': 0.5, 'right_far': 0.5}
+
+    def release(self):
+        if self.phase == "BALLOON":
+            LOG.info("Model released from balloon at %.0fm" % self.alt)
+            self.phase = "GLIDE"
+            self.pitch = -self.max_pitch  # Hangs nose down from the balloon
+
+    def deploy_parachute(self):
+        if self.phase in ("BALLOON", "GLIDE"):
+            LOG.info("Model parachute deployed at %.0fm" % self.alt)
+            self.phase = "PARACHUTE"
+
+    @property
+    def ground_speed(self):
+        return math.hypot(self.velocity_north, self.velocity_east)
+
+    @property
+    def track(self):
+        return math.degrees(math.atan2(self.velocity_east, self.velocity_north)) % 360
+
+    def advance(self, seconds):
+        while seconds > 0:
+            dt = min(seconds, self.max_step)
+            self._step(dt)
+            seconds -= dt
+
+    def _step(self, dt):
+        if self.phase == "BALLOON":
+            self.velocity_north, self.velocity_east, self.velocity_up = self.wind_north, self.wind_east, self.ascent_rate
+        elif self.phase == "GLIDE":
+            self._fly(dt)
+        elif self.phase == "PARACHUTE":
+            self.pitch = self.roll = 0.0
+            self.velocity_north, self.velocity_east = self.wind_north, self.wind_east
+            self.velocity_up = -self.parachute_sink_rate
+        else:
+            return
+        self.alt += self.velocity_up * dt
+        self.lat += math.degrees(self.velocity_north * dt / EARTH_RADIUS)
+        self.lon += math.degrees(self.velocity_east * dt / (EARTH_RADIUS * math.cos(math.radians(self.lat))))
+        if self.alt <= 0:
+            self.alt = 0.0
+            self.phase = "LANDED"
+            self.velocity_north = self.velocity_east = self.velocity_up = 0.0
+
+    def _fly(self, dt):
+        flaps = self.flap_scales
+        aileron = (flaps['right_near'] + flaps['right_far'] - flaps['left_near'] - flaps['left_far']) / 2.0
+        self.roll = max(-self.max_roll, min(self.max_roll, self.roll + self.roll_rate * aileron * dt))
+        self.pitch = max(-self.max_pitch, min(self.max_pitch, self.pitch + self.pitch_rate * (2*flaps['rear'] - 1) * dt))
+        turn_speed = max(self.airspeed, self.min_turn_speed)
+        yaw_rate = GRAVITY * math.tan(self.roll) / turn_speed + self.rudder_rate * (2*flaps['rudder'] - 1)
+        self.heading = (self.heading + yaw_rate * dt) % (2*math.pi)
+        self.airspeed += (-GRAVITY * math.sin(self.pitch) - self.drag * self.airspeed**2) * dt
+        self.airspeed = max(self.airspeed, 0.0)
+        horizontal_speed = self.airspeed * math.cos(self.pitch)
+        self.velocity_north = horizontal_speed * math.cos(self.heading) + self.wind_north
+        self.velocity_east = horizontal_speed * math.sin(self.heading) + self.wind_east
+        self.velocity_up = self.airspeed * math.sin(self.pitch)
+
+
+#-----------------------------------
+#         Stand-in hardware
+#-----------------------------------
+class SimIMUTransport(object):
+    """Feeds the real IMU class with the model attitude, like imu_reader.py would"""
+
+    def __init__(self, model, yaw_error=0.0):
+        self.model = model
+        self.yaw_error = yaw_error
+        self.seq = 0
+
+    def read(self):
+        self.seq += 1
+        model = self.model
+        return model.roll, model.pitch, model.heading + self.yaw_error, glider_clock.monotonic(), self.seq
+
+    def history(self, count):
+        return []
+
+
+class SimGPS(object):
+    """A 3D fix of the model's position whenever asked"""
+    epx = 5.0
+    epy = 5.0
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def data(self):
+        model = self.model
+        return GPSFix(model.lat, model.lon, model.alt, model.ground_speed, model.track, None,
+                      self.epx, self.epy, glider_clock.wall_time(), MODE_3D, glider_clock.monotonic())
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class SimPWMController(object):
+    """Hands the flap scales and release/parachute servos to the model"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_flap_scales(self, scale_angle_dictionary):
+        self.model.flap_scales.update(scale_angle_dictionary)
+
+    def release_parachute(self, reset=False):
+        if not reset:
+            self.model.deploy_parachute()
+
+    def release_from_balloon(self, reset=False):
+        if not reset:
+            self.model.release()
+
+
+class SimCamera(object):
+    photo_path = "/tmp"
+
+    def __init__(self):
+        self.videos = []
+        self.catalog = MediaCatalog()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def take_video(self, seconds):
+        self.videos.append((glider_clock.monotonic(), seconds))
+
+    def locate(self, key):
+        return key, 0, None
+
+
+class SimRadio(object):
+    def __init__(self):
+        self.packets = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def send_packet(self, data, address=0xFF):
+        self.packets.append((glider_clock.monotonic(), data))
+
+    def send_data(self, data):
+        self.send_packet("|".join(["D"] + data))
+
+    def send_frame(self, frame):
+        self.send_packet(frame)
+
+    def send_telem(self, *telemetry):
+        self.send_packet(("T",) + telemetry)
+
+    def sendImage(self, image_path):
+        self.send_packet("I|S|%s" % image_path)
+
+
+class SimGPIO(object):
+    BCM = "BCM"
+    OUT = "OUT"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        self.pins = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction):
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, value):
+        self.pins[pin] = value
+
+
+class SimProcess(object):
+    def kill(self):
+        pass
+
+
+class SimGlider(Glider):
+    """The real Glider, with sound/threads replaced for the simulator"""
+
+    def __init__(self, **modules):
+        self.spoken = []
+        # Fresh states for every run (the class level ones carry state, e.g. parachute.chute_delay)
+        self.state_machine = dict((name, state.__class__()) for name, state in Glider.state_machine.items())
+        self.state_machine["RECOVER"].gpio = SimGPIO()
+        modules.setdefault("speaker", NullSpeaker())  # speak() is recorded instead
+        super(SimGlider, self).__init__(**modules)
+
+    def speak(self, text, alarm=False, topic=None):
+        LOG.debug("Speaking %s" % text)
+        self.spoken.append((glider_clock.monotonic(), text))
+
+    def play_sound(self, command):
+        return SimProcess()
+
+    def start_modules(self):
+        # Telemetry is driven from the simulation loop rather than its own thread
+        pass
+
+    def stop_modules(self):
+        pass
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2-lon1)/2)**2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def run_simulation(start_state="ASCENT", release_altitude=None, parachute_height=None, max_time=None,
+                   record_path=None):
+    """
+    Fly a mission from start_state until the glider is in RECOVER, returns a report.
+    With record_path the flight recorder log is written there (see flight_recorder.load_flight).
+    """
+    launch_lat, launch_lon = [float(x) for x in glider_config.get("simulator", "launch_location").split(",")]
+    if parachute_height is None:
+        parachute_height = glider_config.getfloat("simulator", "parachute_height")
+    if max_time is None:
+        max_time = glider_config.getfloat("simulator", "max_mission_time")
+    model = GlideModel(
+        launch_lat, launch_lon,
+        ascent_rate=glider_config.getfloat("simulator", "ascent_rate"),
+        wind_north=glider_config.getfloat("simulator", "wind_north"),
+        wind_east=glider_config.getfloat("simulator", "wind_east"),
+        parachute_sink_rate=glider_config.getfloat("simulator", "parachute_sink_rate")
+    )
+    clock = VirtualClock(model)
+    real_clock = glider_clock.get_clock()
+    glider_clock.set_clock(clock)
+    wall_start = time.time()
+    try:
+        radio = SimRadio()
+        glider = SimGlider(
+            gps=SimGPS(model),
+            imu=IMU(SimIMUTransport(model, math.radians(glider_config.getfloat("simulator", "imu_yaw_error")))),
+            radio=radio,
+            camera=SimCamera(),
+            pwm_controller=SimPWMController(model),
+            recorder=FlightRecorder(record_path, 16 * 2 ** 20) if record_path else NullRecorder()
+        )
+        glider.state_machine["FLIGHT"].parachute_height = parachute_height
+        if release_altitude is not None:
+            glider.state_machine["ASCENT"].desiredAltitude = release_altitude
+        glider.current_state = start_state
+        if start_state != "ASCENT":
+            model.release()
+
+        mission_start = clock.now
+        states = [(start_state, 0.0, model.alt)]
+        parachute_position = None
+        while clock.now - mission_start < max_time:
+            glider.step()
+            glider.telemetry_handler.send_due()
+            if glider.current_state != states[-1][0]:
+                states.append((glider.current_state, clock.now - mission_start, model.alt))
+                if glider.current_state == "PARACHUTE":
+                    parachute_position = (model.lat, model.lon)
+                if glider.current_state == "RECOVER":
+                    glider.step()  # Run the recovery state once too
+                    break
+        state_timing = glider.scheduler.summary()  # While still on virtual time
+        glider.recorder.close()
+    finally:
+        glider_clock.set_clock(real_clock)
+
+    wall_seconds = time.time() - wall_start
+    virtual_seconds = clock.now - mission_start
+    destination = glider.pilot.destination
+    report = {
+        "states": [{"state": state, "time": round(t, 2), "alt": round(alt, 1)} for state, t, alt in states],
+        "completed": states[-1][0] == "RECOVER",
+        "virtual_seconds": virtual_seconds,
+        "wall_seconds": wall_seconds,
+        "speedup": virtual_seconds / wall_seconds if wall_seconds else float("inf"),
+        "launch_to_parachute_m": distance_m(launch_lat, launch_lon, *parachute_position) if parachute_position else None,
+        "parachute_to_destination_m": distance_m(destination[0], destination[1], *parachute_position) if parachute_position else None,
+        "radio_packets": len(radio.packets),
+        "state_timing": state_timing,
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fly the glider software against a simulated glider")
+    parser.add_argument("--start-state", default="ASCENT")
+    parser.add_argument("--release-altitude", type=float, help="Override [mission] balloon_release_altitude")
+    parser.add_argument("--parachute-height", type=float, help="Override [simulator] parachute_height")
+    parser.add_argument("--verbose", action="store_true", help="Show the glider's warnings")
+    parser.add_argument("--record", metavar="PATH", help="Write a flight recorder log of the mission")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger("glider").setLevel(logging.ERROR)
+    report = run_simulation(args.start_state, args.release_altitude, args.parachute_height, record_path=args.record)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    return 0 if report["completed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,3 +23,14 @@ class TestIMU(TestCase):
         new_yaw = self.imu_reader.yaw
         self.assertNotEqual(old_yaw, new_yaw)
 
+    def test_snapshot(self):
+        sample = self.imu_reader.snapshot()
+        self.assertGreater(sample.seq, 0)
+        self.assertFalse(self.imu_reader.is_stale(sample))
+        time.sleep(1)
+        self.assertGreater(self.imu_reader.snapshot().seq, sample.seq)
+
+    def test_history(self):
+        history = self.imu_reader.history(10)
+        self.assertEqual(len(history), 10)
+        self.assertEqual([sample.seq for sample in history], range(history[0].seq, history[0].seq + 10))
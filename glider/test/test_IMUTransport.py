@@ -0,0 +1,189 @@
+import os
+import tempfile
+from unittest import TestCase
+from glider.modules import imu_transport
+from glider.modules.glider_clock import monotonic
+from glider.modules.glider_imu import IMU
+from glider.modules.imu_transport import SharedMemoryTransport, RedisTransport
+
+
+class TestSharedMemoryTransport(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "glider_imu")
+        self.writer = SharedMemoryTransport(self.path, ring_size=8, writer=True)
+        self.reader = SharedMemoryTransport(self.path, ring_size=8)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+        os.remove(self.path)
+
+    def test_read_before_publish(self):
+        self.assertEqual(self.reader.read(), (0.0, 0.0, 0.0, 0.0, 0))
+
+    def test_read_latest(self):
+        for seq in range(1, 4):
+            self.writer.publish(0.1 * seq, 0.2 * seq, 0.3 * seq, 100.0 + seq, seq)
+        self.assertEqual(self.reader.read(), (0.1 * 3, 0.2 * 3, 0.3 * 3, 103.0, 3))
+
+    def test_history_wraps(self):
+        for seq in range(1, 21):
+            self.writer.publish(0.0, 0.0, 0.0, float(seq), seq)
+        history = self.reader.history(5)
+        self.assertEqual([sample[4] for sample in history], [16, 17, 18, 19, 20])
+        self.assertEqual(len(self.reader.history(100)), 8)
+
+    def test_writer_restart(self):
+        self.writer.publish(0.0, 0.0, 0.0, 1.0, 1)
+        self.assertEqual(self.reader.read()[4], 1)
+        self.writer.close()
+        self.writer = SharedMemoryTransport(self.path, ring_size=8, writer=True)
+        self.writer.publish(0.0, 0.0, 0.0, 2.0, 2)
+        self.assertEqual(self.reader.read()[4], 2)
+
+    def test_writer_restart_smaller_ring(self):
+        for seq in range(1, 21):
+            self.writer.publish(0.0, 0.0, 0.0, float(seq), seq)
+        self.assertEqual(len(self.reader.history(100)), 8)
+        self.writer.close()
+        self.writer = SharedMemoryTransport(self.path, ring_size=4, writer=True)
+        # The file isn't shrunk under the reader's mapping
+        self.assertEqual(os.path.getsize(self.path), SharedMemoryTransport(self.path, ring_size=8).size)
+        for seq in range(21, 31):
+            self.writer.publish(0.0, 0.0, 0.0, float(seq), seq)
+        self.assertEqual([sample[4] for sample in self.reader.history(100)], [27, 28, 29, 30])
+        self.assertEqual(self.reader.ring_size, 4)
+
+    def test_writer_restart_larger_ring(self):
+        self.writer.publish(0.0, 0.0, 0.0, 1.0, 1)
+        self.assertEqual(self.reader.read()[4], 1)
+        self.writer.close()
+        self.writer = SharedMemoryTransport(self.path, ring_size=16, writer=True)
+        for seq in range(2, 31):
+            self.writer.publish(0.0, 0.0, 0.0, float(seq), seq)
+        self.assertEqual([sample[4] for sample in self.reader.history(100)], list(range(15, 31)))
+        self.assertEqual(self.reader.read()[4], 30)
+
+
+class TestSampleAge(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "glider_imu")
+        self.writer = SharedMemoryTransport(self.path, ring_size=8, writer=True)
+        self.imu = IMU(SharedMemoryTransport(self.path, ring_size=8))
+
+    def tearDown(self):
+        self.imu.transport.close()
+        self.writer.close()
+        os.remove(self.path)
+
+    def test_fresh(self):
+        self.writer.publish(0.0, 0.0, 0.0, monotonic(), 1)
+        self.assertFalse(self.imu.is_stale(self.imu.snapshot()))
+
+    def test_old(self):
+        self.writer.publish(0.0, 0.0, 0.0, monotonic() - 10, 1)
+        self.assertTrue(self.imu.is_stale(self.imu.snapshot()))
+
+    def test_from_before_a_reboot(self):
+        # Published on the last boot's monotonic clock, which had got further than this one
+        self.writer.publish(0.0, 0.0, 0.0, monotonic() + 3600, 1)
+        self.assertTrue(self.imu.is_stale(self.imu.snapshot()))
+
+    def test_never_published(self):
+        self.assertTrue(self.imu.is_stale(self.imu.snapshot()))
+
+
+class FakePipeline(object):
+    def __init__(self, server):
+        self.server = server
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name,) + args)
+
+    def execute(self):
+        self.server.executed.append([command[0] for command in self.commands])
+        for command in self.commands:
+            getattr(self.server, command[0])(*command[1:])
+
+
+class FakeRedis(object):
+    """The few commands RedisTransport uses, keys expire on 'now' (milliseconds)"""
+
+    def __init__(self):
+        self.now = 0
+        self.data = {}
+        self.expires = {}
+        self.executed = []  # Command names of each pipeline run
+
+    def _get(self, key):
+        if key in self.expires and self.now >= self.expires[key]:
+            self.data.pop(key, None)
+            del self.expires[key]
+        return self.data.get(key)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def mset(self, mapping):
+        for key, value in mapping.items():
+            self.data[key] = repr(value).encode()
+
+    def mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value.encode())
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data[key][start:end + 1]
+
+    def lrange(self, key, start, end):
+        return (self._get(key) or [])[start:end + 1]
+
+    def pexpire(self, key, milliseconds):
+        self.expires[key] = self.now + milliseconds
+
+
+class TestRedisTransport(TestCase):
+    def setUp(self):
+        self.server = FakeRedis()
+        self.real_redis = imu_transport.redis.StrictRedis
+        imu_transport.redis.StrictRedis = lambda **kwargs: self.server
+        self.writer = RedisTransport(history_length=4, sample_ttl=10, writer=True)
+        self.reader = RedisTransport(history_length=4, sample_ttl=10)
+
+    def tearDown(self):
+        imu_transport.redis.StrictRedis = self.real_redis
+
+    def test_publish_is_one_transaction(self):
+        self.writer.publish(0.1, 0.2, 0.3, 100.5, 1)
+        self.assertEqual(len(self.server.executed), 1)
+        commands = self.server.executed[0]
+        self.assertEqual(commands[:3], ["mset", "lpush", "ltrim"])
+        self.assertEqual(commands[3:], ["pexpire"] * 6)
+        self.assertEqual(self.reader.read(), (0.1, 0.2, 0.3, 100.5, 1))
+
+    def test_history_capped_oldest_first(self):
+        for seq in range(1, 8):
+            self.writer.publish(0.0, 0.0, 0.0, float(seq), seq)
+        self.assertEqual([sample[4] for sample in self.reader.history(2)], [6, 7])
+        self.assertEqual([sample[4] for sample in self.reader.history(100)], [4, 5, 6, 7])
+
+    def test_writer_clears_old_samples(self):
+        self.writer.publish(0.0, 0.0, 0.0, 100.0, 1)
+        RedisTransport(writer=True)
+        self.assertEqual(self.reader.read(), (0.0, 0.0, 0.0, 0.0, 0))
+        self.assertEqual(self.reader.history(10), [])
+
+    def test_expired_sample_is_stale(self):
+        imu = IMU(self.reader)
+        self.writer.publish(0.0, 0.0, 0.0, monotonic(), 1)
+        self.assertFalse(imu.is_stale(imu.snapshot()))
+        self.server.now += 10000  # imu_reader.py stopped publishing sample_ttl ago
+        self.assertTrue(imu.is_stale(imu.snapshot()))
+        self.assertEqual(self.reader.history(10), [])
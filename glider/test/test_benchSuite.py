@@ -0,0 +1,44 @@
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.bench import suite
+
+
+class TestBenchSuite(TestCase):
+    def test_compare(self):
+        baselines = {
+            "steady": {"us": 10.0, "reference_us": 20.0},
+            "slower": {"us": 10.0, "reference_us": 20.0},
+            "drift": {"us": 10.0, "reference_us": 20.0},
+        }
+        results = {
+            "steady": {"us": 11.0, "reference_us": 20.0},
+            "slower": {"us": 14.0, "reference_us": 20.0},
+            "drift": {"us": 14.0, "reference_us": 28.0},  # The whole machine is slower
+            "added": {"us": 1.0, "reference_us": 20.0},
+        }
+        comparison = dict((name, (change, status)) for name, _, change, status in suite.compare(results, baselines))
+        self.assertEqual(comparison["steady"][1], "ok")
+        self.assertEqual(comparison["slower"][1], "regressed")
+        self.assertAlmostEqual(comparison["slower"][0], 0.4)
+        self.assertEqual(comparison["drift"][1], "ok")
+        self.assertEqual(comparison["added"], (None, "new"))
+        self.assertEqual(suite.compare(results, baselines, tolerance=0.5)[3][3], "ok")
+
+    def test_own_tolerance(self):
+        name = "rhserial.send"  # A few microseconds a call, so noisier
+        baselines = {name: {"us": 10.0, "reference_us": 20.0}}
+        results = {name: {"us": 13.5, "reference_us": 20.0}}
+        self.assertGreater(suite.TOLERANCES[name], 0.35)
+        self.assertEqual(suite.compare(results, baselines)[0][3], "ok")
+        self.assertEqual(suite.compare(results, baselines, tolerance=0.25)[0][3], "regressed")
+
+    def test_benchmarks_run(self):
+        # Every benchmark sets up and runs without the hardware
+        directory = tempfile.mkdtemp()
+        try:
+            for name, setup in suite.BENCHMARKS:
+                setup(directory)()
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn("pilot.update_flap_angles", dict(suite.BENCHMARKS))
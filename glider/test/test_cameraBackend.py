@@ -0,0 +1,57 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from PIL import Image
+from glider.modules.camera_backend import FakeCameraBackend
+from glider.modules.glider_camera import GliderCamera
+from glider.modules.media_store import SegmentStore
+
+
+class TestCameraSession(TestCase):
+    def setUp(self):
+        self.photo_path = tempfile.mkdtemp()
+        self.backend = FakeCameraBackend(open_time=0, mode_switch_time=0, capture_time=0)
+        self.store = SegmentStore(self.photo_path, fsync_interval=0)
+        self.camera = GliderCamera(photo_path=self.photo_path, backend=self.backend, store=self.store)
+
+    def tearDown(self):
+        shutil.rmtree(self.photo_path)
+
+    def test_session_kept_open(self):
+        low = self.camera.take_low_pic()
+        high = self.camera.take_high_pic()
+        self.camera.take_low_pic()
+        self.assertEqual(self.backend.opens, 1)
+        self.assertEqual(self.backend.captures, 3)
+        self.assertEqual(Image.open(io.BytesIO(self.store.read(low))).size, (640, 480))
+        self.assertEqual(Image.open(io.BytesIO(self.store.read(high))).size, (1296, 972))
+        self.assertEqual(os.listdir(self.photo_path).count("precompressed.jpg"), 0)
+
+    def test_reopened_after_close(self):
+        self.camera.take_low_pic()
+        self.backend.close()
+        self.camera.take_low_pic()
+        self.assertEqual(self.backend.opens, 2)
+
+    def test_captures_catalogued(self):
+        low = self.camera.take_low_pic()
+        high = self.camera.take_high_pic()
+        self.assertEqual(self.camera.catalog.newest("low", unsent=True).path, low)
+        self.assertEqual(self.camera.catalog.get(high).resolution, (1296, 972))
+        self.assertEqual(self.camera.catalog.newest("thumb").resolution, (160, 120))
+
+    def test_catalog_rebuilt_from_store(self):
+        low = self.camera.take_low_pic()
+        self.camera.catalog.mark_sent(low)
+        self.camera.take_video(1)
+        video = self.camera._take_video()
+        self.store.close()
+        reopened = GliderCamera(photo_path=self.photo_path, backend=self.backend,
+                                store=SegmentStore(self.photo_path))
+        self.assertTrue(reopened.catalog.get(low).sent)
+        self.assertEqual(reopened.catalog.newest("video").path, video)
+        self.assertEqual(reopened.locate(video), (video, 0, os.path.getsize(video)))  # Counted in the budget
+        path, offset, length = reopened.locate(low)
+        self.assertEqual(length, reopened.catalog.get(low).size)
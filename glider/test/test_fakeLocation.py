@@ -0,0 +1,74 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules import glider_clock
+from glider.modules.glider_gps import FakeLocation, NO_FIX, MODE_3D
+
+
+class ManualClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestFakeLocation(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "location.json")
+        self.real_clock = glider_clock.get_clock()
+        self.clock = ManualClock()
+        glider_clock.set_clock(self.clock)
+        self.real_fix = NO_FIX._replace(time=1527854400.0)
+
+    def tearDown(self):
+        glider_clock.set_clock(self.real_clock)
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mtime):
+        with open(self.path, "w") as fake_file:
+            json.dump(data, fake_file)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_fixed_values_reloaded_on_change(self):
+        self.write({"lat": 54.5, "lon": -7.25}, 1000)
+        fake = FakeLocation(self.path, check_interval=1)
+        fix = fake.fix(self.real_fix)
+        self.assertEqual((fix.lat, fix.lon, fix.time), (54.5, -7.25, 1527854400.0))
+        self.assertTrue(fix.has_fix)
+        self.assertEqual(fix.age, 0)
+        self.write({"lat": 55.0, "lon": -7.25}, 2000)
+        self.assertEqual(fake.fix(self.real_fix).lat, 54.5)  # Not checked again yet
+        self.clock.sleep(1)
+        self.assertEqual(fake.fix(self.real_fix).lat, 55.0)
+        self.clock.sleep(1)
+        fake.fix(self.real_fix)
+        self.assertEqual(fake.loads, 2)
+
+    def test_playback(self):
+        self.write([
+            {"time": 10, "lat": 54.0, "alt": 1000, "track": 350},
+            {"time": 0, "lat": 53.0, "alt": 1500, "track": 340},
+            {"time": 20, "lat": 54.0, "alt": 1000, "track": 10, "mode": 2},
+        ], 1000)
+        fake = FakeLocation(self.path)
+        self.assertEqual(fake.fix(self.real_fix).lat, 53.0)
+        self.clock.sleep(5)
+        fix = fake.fix(self.real_fix)
+        self.assertAlmostEqual(fix.lat, 53.5)
+        self.assertAlmostEqual(fix.alt, 1250)
+        self.clock.sleep(10)
+        fix = fake.fix(self.real_fix)
+        self.assertAlmostEqual(fix.track, 0)
+        self.assertEqual((fix.mode, fix.time), (MODE_3D, self.clock.now))
+        self.clock.sleep(100)
+        self.assertEqual(fake.fix(self.real_fix).mode, 2)
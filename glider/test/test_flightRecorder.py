@@ -0,0 +1,88 @@
+import os
+import errno
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules import flight_recorder
+from glider.modules.glider_imu import IMUSample
+from glider.modules.flight_recorder import FlightRecorder, load_flight, remove_old_logs
+
+
+class FakeFix(object):
+    lat = 54.5
+    lon = -7.25
+    alt = 1200.0
+    speed = "n/a"
+    track = 90.0
+    epx = 5
+    epy = 7
+
+
+class TestFlightRecorder(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "flight.fdr")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        recorder = FlightRecorder(self.path, size=64 * 1024)
+        recorder.record_state(None, "FLIGHT")
+        recorder.record_imu(IMUSample(0.1, -0.2, 1.5, 100.0, 7))
+        recorder.record_gps(FakeFix())
+        recorder.record_pilot(1.25, -10)
+        recorder.record_flaps({"rudder": 0.25, "rear": 0.75})
+        recorder.record_servos({0: (0, 300), 5: (0, 410), None: (0, 1)})
+        recorder.record_command("PA|-15")
+        recorder.record_imu(IMUSample(0.2, -0.1, 1.4, 100.1, 8))
+        recorder.close()
+
+        flight = load_flight(self.path)
+        self.assertEqual(list(flight["imu"]["sample_seq"]), [7, 8])
+        self.assertAlmostEqual(flight["imu"]["yaw"][0], 1.5, places=5)
+        self.assertEqual(flight["gps"]["lat"][0], 54.5)
+        self.assertTrue(flight["gps"]["speed"][0] != flight["gps"]["speed"][0])  # NaN for "n/a"
+        self.assertEqual(flight["pilot"]["desired_pitch"][0], -10)
+        self.assertEqual(flight["flaps"]["rudder"][0], 0.25)
+        self.assertEqual(list(flight["servos"]["pulses"][0][[0, 5]]), [300, 410])
+        self.assertEqual(flight["state"]["to_state"][0], b"FLIGHT")
+        self.assertEqual(flight["command"]["command"][0], b"PA|-15")
+        self.assertTrue((flight["imu"]["t"] >= flight["state"]["t"][0]).all())
+
+    def test_wraps_keeping_newest(self):
+        recorder = FlightRecorder(self.path, size=64 * 11)  # Room for 10 records
+        for seq in range(25):
+            recorder.record_pilot(seq, 0)
+        recorder.record_pilot(None, 0)  # Not recordable, its slot (the oldest record) is emptied
+        recorder.close()
+        self.assertEqual(recorder.errors, 1)
+        flight = load_flight(self.path)
+        self.assertEqual(list(flight["pilot"]["desired_yaw"]), range(16, 25))
+        self.assertEqual(list(flight["pilot"]["seq"]), range(16, 25))
+
+    def test_blocks_reserved(self):
+        recorder = FlightRecorder(self.path, size=1024 * 1024)
+        # Not sparse: every page of the map has a block behind it
+        self.assertGreaterEqual(os.stat(self.path).st_blocks * 512, 1024 * 1024)
+        recorder.close()
+
+    def test_old_logs_removed(self):
+        names = ["flight_20180601_%06d.fdr" % run for run in range(120000, 120005)]
+        for name in names + ["notes.txt"]:
+            open(os.path.join(self.directory, name), "w").close()
+        removed = remove_old_logs(self.directory, 2)
+        self.assertEqual(removed, [os.path.join(self.directory, name) for name in names[:3]])
+        self.assertEqual(sorted(os.listdir(self.directory)), names[3:] + ["notes.txt"])
+        self.assertEqual(remove_old_logs(self.directory, 2), [])
+
+    def test_full_card_fails_at_open(self):
+        real_fallocate = flight_recorder._posix_fallocate
+        flight_recorder._posix_fallocate = lambda fd, offset, size: errno.ENOSPC
+        try:
+            with self.assertRaises(OSError) as raised:
+                FlightRecorder(self.path, size=1024 * 1024)
+            self.assertEqual(raised.exception.errno, errno.ENOSPC)
+            self.assertFalse(os.path.exists(self.path))
+        finally:
+            flight_recorder._posix_fallocate = real_fallocate
@@ -0,0 +1,42 @@
+from unittest import TestCase
+from glider.modules.rhserial import FrameDecoder, RHSerial, build_frame
+
+
+class TestFrameDecoder(TestCase):
+    def setUp(self):
+        self.decoder = FrameDecoder()
+
+    def test_frames_split_across_reads(self):
+        stream = bytes(build_frame(b"D|one", id=1) + build_frame(b"D|two", id=2))
+        messages = []
+        for position in range(0, len(stream), 3):
+            messages += self.decoder.feed(stream[position:position + 3])
+        self.assertEqual([str(message[4:]) for message in messages], ["D|one", "D|two"])
+
+    def test_escaped_dle(self):
+        payload = b"\x81D\x10\x03\x10\x10"
+        messages = self.decoder.feed(bytes(build_frame(payload, frm=0x10, id=0x10)))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][:], b"\xff\x10\x10\x00" + payload)
+
+    def test_bad_crc_and_noise(self):
+        good = bytes(build_frame(b"D|good"))
+        bad = bytearray(build_frame(b"D|bad!"))
+        bad[-1] ^= 0xFF
+        noise = b"\x10\x02\xaa\x10\x55junk\x10"
+        messages = self.decoder.feed(noise + bytes(bad) + good)
+        self.assertEqual([str(message[4:]) for message in messages], ["D|good"])
+        self.assertEqual(self.decoder.crc_errors, 1)
+        self.assertEqual(self.decoder.aborted, 1)
+
+    def test_processmsg_payload_is_a_view(self):
+        radio = RHSerial.__new__(RHSerial)
+        radio.address = 0xAA
+        radio.promiscuous = False
+        message = self.decoder.feed(bytes(build_frame(b"PA|-10", to=0xAA, frm=0xFF, id=7)))[0]
+        msgdict = radio._processmsg(message)
+        self.assertIsInstance(msgdict["message"], buffer)
+        self.assertEqual(str(msgdict["message"]), "PA|-10")
+        self.assertEqual((msgdict["to"], msgdict["from"], msgdict["id"]), (0xAA, 0xFF, 7))
+        other = self.decoder.feed(bytes(build_frame(b"PA|-10", to=0xBB)))[0]
+        self.assertIsNone(radio._processmsg(other))
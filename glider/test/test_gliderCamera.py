@@ -16,10 +16,12 @@ class TestGliderCamera(TestCase):
         self.camera.stop()
         time.sleep(2)
 
-    def test_get_cam(self):
-        cam = self.camera.get_cam("low")
-        self.assertEqual(cam.resolution, (640, 480))
-        cam.close()
+    def test_session_mode(self):
+        session = self.camera._session()
+        session.set_mode("low")
+        self.assertEqual(session.camera.resolution, (640, 480))
+        session.set_mode("high")
+        self.assertEqual(session.camera.resolution, (1296, 972))
 
     def test_take_video(self):
         data_content = os.listdir(self.camera.photo_path)
@@ -0,0 +1,118 @@
+import Queue
+import logging
+import threading
+from unittest import TestCase
+from glider.modules import glider_clock, glider_logging
+from glider.modules.glider_logging import QueueHandler, QueueListener, HotLog, start_async_logging, stop_async_logging, \
+    after_fork
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.setFormatter(logging.Formatter("%(funcName)s L.%(lineno)d %(message)s"))
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class TestGliderLogging(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("glider.test_logging")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+        self.clock = FakeClock()
+        self.previous_clock = glider_clock.get_clock()
+        glider_clock.set_clock(self.clock)
+
+    def tearDown(self):
+        stop_async_logging()
+        glider_clock.set_clock(self.previous_clock)
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def test_queue(self):
+        scales = {"rudder": 0.5}
+        start_async_logging(self.logger)
+        self.assertIsInstance(self.logger.handlers[0], QueueHandler)
+        self.logger.info("Scales %s", scales)
+        scales["rudder"] = 0.9  # Changed before the writer gets to it
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            self.logger.exception("Failed")
+        stop_async_logging()
+        self.assertTrue(self.handler.lines[0].startswith("test_queue L."))
+        self.assertTrue(self.handler.lines[0].endswith("Scales {'rudder': 0.5}"))
+        self.assertIn("ValueError: bad", self.handler.lines[1])
+        self.assertEqual(self.logger.handlers, [self.handler])
+
+    def test_after_fork(self):
+        queue_handler = start_async_logging(self.logger)
+        listener = glider_logging._async[2]
+        # As if the log writer was writing when the process forked
+        writer = threading.Thread(target=self.handler.acquire)
+        writer.start()
+        writer.join()
+        try:
+            after_fork()
+            self.assertEqual(self.logger.handlers, [self.handler])
+            self.logger.info("In the child")
+            self.assertTrue(self.handler.lines[-1].endswith("In the child"))
+            self.assertEqual(queue_handler.queue.qsize(), 0)
+        finally:
+            listener.stop()
+
+    def test_queue_full(self):
+        queue_handler = QueueHandler(Queue.Queue(2))
+        self.logger.removeHandler(self.handler)
+        self.logger.addHandler(queue_handler)
+        for i in range(5):
+            self.logger.warning("Record %s", i)
+        self.assertEqual(queue_handler.dropped, 3)
+        listener = QueueListener(queue_handler.queue, [self.handler])
+        listener.start()
+        listener.stop()
+        self.assertEqual([line.split()[-1] for line in self.handler.lines], ["0", "1"])
+
+    def test_listener_levels(self):
+        warnings = ListHandler(logging.WARNING)
+        listener = QueueListener(Queue.Queue(), [self.handler, warnings])
+        listener.queue.put(self.logger.makeRecord(self.logger.name, logging.INFO, "f", 1, "info", (), None))
+        listener.queue.put(self.logger.makeRecord(self.logger.name, logging.ERROR, "f", 2, "error", (), None))
+        listener.start()
+        listener.stop()
+        self.assertEqual(len(self.handler.lines), 2)
+        self.assertEqual([line.split()[-1] for line in warnings.lines], ["error"])
+
+    def test_hot_log_rate_limit(self):
+        hot_log = HotLog(self.logger, interval=1.0)
+        for tick in range(250):
+            self.clock.now = 100.0 + tick * 0.01
+            hot_log.info("Tick %s", tick)
+            hot_log.debug("Other %s", tick)
+        self.assertEqual([line.split(" ", 2)[2] for line in self.handler.lines], [
+            "Tick 0", "Other 0", "Tick 100 (99 more in 1.0s)", "Other 100 (99 more in 1.0s)",
+            "Tick 200 (99 more in 1.0s)", "Other 200 (99 more in 1.0s)"])
+        # Reported where it was logged from
+        self.assertTrue(self.handler.lines[0].startswith("test_hot_log_rate_limit L."))
+
+    def test_hot_log_disabled(self):
+        hot_log = HotLog(self.logger, interval=0)
+        self.logger.setLevel(logging.WARNING)
+        hot_log.info("Not logged %s", 1)
+        self.assertEqual(hot_log.sites, {})
+        for i in range(3):
+            hot_log.error("Logged %s", i)
+        self.assertEqual(len(self.handler.lines), 3)
@@ -0,0 +1,87 @@
+import os
+import json
+import socket
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules.glider_metrics import Histogram, Metrics, MetricsServer, timed
+
+
+class TestGliderMetrics(TestCase):
+    def test_histogram(self):
+        histogram = Histogram("test", bounds=(0.001, 0.01, 0.1))
+        for seconds in [0.0005] * 90 + [0.005] * 9 + [0.5]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.counts, [90, 9, 0, 1])
+        self.assertEqual(histogram.percentile(0.5), 0.001)
+        self.assertEqual(histogram.percentile(0.99), 0.01)
+        self.assertEqual(histogram.percentile(1.0), 0.5)  # Past the last bound, the max
+        snapshot = histogram.snapshot()
+        self.assertEqual((snapshot["count"], snapshot["max"]), (100, 0.5))
+        self.assertAlmostEqual(snapshot["mean"], (0.045 + 0.045 + 0.5) / 100)
+        self.assertEqual(Histogram("empty").percentile(0.5), 0.0)
+
+    def test_timed(self):
+        metrics = Metrics()
+
+        @timed("stage", metrics)
+        def stage(value):
+            return value * 2
+
+        self.assertEqual(stage(21), 42)
+        self.assertEqual(stage.__name__, "stage")
+        self.assertEqual(metrics.histograms["stage"].count, 1)
+        metrics.increment("commands")
+        metrics.increment("commands")
+        summary = metrics.summary()
+        self.assertRegexpMatches(summary, r"^stage \d+u/\d+u/\d+u commands=2$")
+
+    def test_summary_pages(self):
+        metrics = Metrics()
+        for stage in range(8):
+            metrics.observe("state.STAGE_%02d" % stage, 0.0123)
+        metrics.increment("imu.stale", 3)
+        pages = [metrics.summary(page) for page in range(1, 4)]
+        self.assertTrue(all(len(page) <= 220 for page in pages))
+        self.assertEqual([page.split(" ")[0] for page in pages], ["1/2", "2/2", "2/2"])
+        self.assertTrue(pages[1].endswith(" imu.stale=3"))
+        # Every stage is on one of the pages, once
+        stages = " ".join(pages[:2]).split()
+        self.assertEqual(len([part for part in stages if part.startswith("state.")]), 8)
+
+    def test_disabled(self):
+        metrics = Metrics(enabled=False)
+
+        def stage():
+            pass
+
+        self.assertIs(timed("stage", metrics)(stage), stage)
+        metrics.observe("stage", 1.0)
+        metrics.increment("commands")
+        self.assertEqual(metrics.snapshot()["histograms"], {})
+        self.assertEqual(metrics.snapshot()["counters"], {})
+        self.assertEqual(metrics.summary(), "metrics off")
+
+    def test_server(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metrics = Metrics()
+            metrics.observe("imu.read", 0.00002)
+            server = MetricsServer(os.path.join(directory, "metrics.sock"), metrics)
+            server.start()
+            for _ in range(2):
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                client.connect(server.path)
+                data = b""
+                while True:
+                    chunk = client.recv(4096)
+                    if not chunk:
+                        break
+                    data += chunk
+                client.close()
+                self.assertEqual(json.loads(data)["histograms"]["imu.read"]["count"], 1)
+            server.stop()
+            self.assertFalse(os.path.exists(server.path))
+            MetricsServer(None, metrics).start()  # No path, nothing to do
+        finally:
+            shutil.rmtree(directory)
@@ -1,4 +1,6 @@
 import time
+from glider.modules.glider_clock import monotonic
+from glider.modules.glider_imu import IMUSample
 from glider.modules.glider_pilot import Pilot
 from glider.modules.glider_pwm_controller import GliderPWMController
 from unittest import TestCase
@@ -11,6 +13,12 @@ class FakeIMU(object):
         self._p = 0.0
         self._y = 0.0
 
+    def snapshot(self):
+        return IMUSample(self._r, self._p, self._y, monotonic(), 0)
+
+    def is_stale(self, sample):
+        return False
+
     @property
     def roll(self):
         return self._r
@@ -84,4 +92,4 @@ class TestGliderPilot(TestCase):
             for scale in [0.25, 0.5, 0.75, 0.5]:
                 print("Moving to scale: %s" % (scale))
                 self.pwm_controller.set_flap_scales({flap_id: scale})
-                time.sleep(1)
\ No newline at end of file
+                time.sleep(1)
@@ -0,0 +1,312 @@
+import os
+import time
+import threading
+from unittest import TestCase
+from glider.glider_states import packaging
+from glider.modules import glider_clock
+from glider.modules.glider_pwm_controller import GliderPWMController
+from glider.modules.glider_runtime import EventLoop, GliderRuntime
+from glider.modules.glider_scheduler import StateScheduler
+from glider.modules.tx_scheduler import TransmitScheduler, DATA
+from glider.bench.fakes import FakePCA9685
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FastClock(object):
+    """Real time sped up, so states that sleep for seconds take milliseconds"""
+
+    def __init__(self, speed=1000.0):
+        self.speed = speed
+        self.started = time.time()
+
+    @property
+    def now(self):
+        return 100.0 + (time.time() - self.started) * self.speed
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+
+class FakeState(object):
+    sleepTime = 0.01
+    overrunPolicy = "skip"
+
+
+class FakePWMController(object):
+    controller_breather = 0.02
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.writes = []
+
+    def write_pending(self):
+        self.writes.append(self.clock.now)
+
+
+class FakeTelemetryHandler(object):
+    interval = 1.0
+
+    def __init__(self, clock, tx_scheduler):
+        self.clock = clock
+        self.tx_scheduler = tx_scheduler
+        self.last_sent = clock.now
+
+    def send_due(self):
+        self.checks = getattr(self, "checks", 0) + 1
+        if self.clock.now - self.last_sent >= self.interval:
+            self.tx_scheduler.enqueue("D|%s" % self.clock.now, 0xFF, DATA)
+            self.last_sent = self.clock.now
+
+    def next_due(self):
+        return max(0.0, self.last_sent + self.interval - self.clock.now)
+
+
+class FakeRadio(object):
+    def __init__(self, tx_scheduler):
+        self.tx_scheduler = tx_scheduler
+
+
+class FakeGlider(object):
+    """Ticks a state like Glider.step(wait=False) does, without the modules"""
+    running = True
+    camera = None
+    current_state = "FLIGHT"
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.scheduler = StateScheduler(clock=clock.monotonic, sleep=clock.sleep)
+        self.ticks = []
+        self.sent = []
+        tx_scheduler = TransmitScheduler(lambda data, address: self.sent.append((self.clock.now, data)), 1000)
+        self.radio = FakeRadio(tx_scheduler)
+        self.telemetry_handler = FakeTelemetryHandler(clock, tx_scheduler)
+        self.pwm_controller = FakePWMController(clock)
+
+    def step(self, wait=True):
+        delay = self.scheduler.delay("FLIGHT", FakeState)
+        if delay > 0:
+            return delay
+        self.scheduler.tick(FakeState)
+        self.ticks.append(self.clock.now)
+        return 0
+
+
+class PackagingGlider(FakeGlider):
+    """Runs the real PACKAGING state against a PWM controller on fake I2C"""
+
+    def __init__(self, clock):
+        super(PackagingGlider, self).__init__(clock)
+        self.state_machine = {"PACKAGING": packaging()}
+        self.current_state = "PACKAGING"
+        self.pwm_controller = GliderPWMController(pwm=FakePCA9685(), autostart=False)
+        self.written = []
+        write_pending = self.pwm_controller.write_pending
+
+        def record():
+            write_pending()
+            self.written.append(dict(self.pwm_controller._written_pulses))
+        self.pwm_controller.write_pending = record
+
+    def speak(self, text, alarm=False, topic=None):
+        pass
+
+    def step(self, wait=True):
+        state = self.state_machine[self.current_state]
+        delay = self.scheduler.delay(self.current_state, state)
+        if delay > 0:
+            return delay
+        self.scheduler.tick(state)
+        state.execute(self)
+        if state.switch():
+            self.running = False
+        return 0
+
+
+class TestEventLoop(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.loop = EventLoop(clock=self.clock.monotonic, sleep=self.clock.sleep)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_timers_run_in_order(self):
+        calls = []
+        self.loop.call_later(2, calls.append, "last")
+        self.loop.call_later(1, calls.append, "first")
+        self.loop.call_later(1, calls.append, "second")  # Same time, so in the order they were set
+        self.loop.call_later(1.5, calls.append, "cancelled").cancel()
+        self.loop.run(until=self.clock.now + 3)
+        self.assertEqual(calls, ["first", "second", "last"])
+        self.assertAlmostEqual(self.clock.now, 103.0)
+        # Woken for each time something was due and the end, not in between
+        self.assertEqual(self.loop.wakeups, 3)
+
+    def test_call_every_keeps_its_rate(self):
+        calls = []
+
+        def work():
+            calls.append(self.clock.now)
+            self.clock.now += 0.3 if len(calls) == 3 else 0.1  # The third call overruns
+
+        self.loop.call_every(0.25, work)
+        self.loop.run(until=self.clock.now + 2.1)
+        # Fixed deadlines, the one missed by the overrun is skipped
+        self.assertEqual([round(t - 100, 3) for t in calls], [0.25, 0.5, 0.75, 1.25, 1.5, 1.75, 2.0])
+
+    def test_call_soon_runs_on_the_next_pass(self):
+        calls = []
+
+        def again():
+            calls.append(self.loop.wakeups)
+            self.loop.call_soon(again)
+
+        self.loop.call_soon(again)
+        self.loop.run_once()
+        self.loop.run_once()
+        self.assertEqual(calls, [1, 2])
+
+    def test_reader(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            received = []
+            self.loop.add_reader(read_fd, lambda: received.append(os.read(read_fd, 100)))
+            os.write(write_fd, b"frame")
+            self.loop.run_once(until=self.clock.now + 1)
+            self.assertEqual(received, [b"frame"])
+            self.loop.remove_reader(read_fd)
+            os.write(write_fd, b"more")
+            self.loop.run_once(until=self.clock.now + 1)
+            self.assertEqual(received, [b"frame"])
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+
+class TestEventLoopThreads(TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_executor_result_comes_back_on_the_loop(self):
+        results = []
+
+        def done(result):
+            results.append((result, threading.current_thread()))
+            self.loop.stop()
+
+        self.loop.run_in_executor(lambda a, b: a + b, (20, 22), callback=done)
+        self.loop.call_later(5, self.loop.stop)  # Don't hang if it never comes back
+        self.loop.run()
+        self.assertEqual(results, [(42, threading.current_thread())])
+
+    def test_executor_error(self):
+        results = []
+
+        def fail():
+            raise IOError("camera gone")
+
+        def done(result):
+            results.append(result)
+            self.loop.stop()
+
+        self.loop.run_in_executor(fail, callback=done)
+        self.loop.call_later(5, self.loop.stop)
+        self.loop.run()
+        self.assertEqual(results, [None])
+
+    def test_call_soon_threadsafe(self):
+        threading.Timer(0.05, self.loop.stop).start()
+        self.loop.call_later(5, self.loop.stop)
+        self.loop.run()
+        # Slept until the other thread woke it
+        self.assertLessEqual(self.loop.wakeups, 2)
+
+
+class TestGliderRuntime(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.real_clock = glider_clock.get_clock()
+        glider_clock.set_clock(self.clock)  # For the transmit scheduler
+        self.loop = EventLoop(clock=self.clock.monotonic, sleep=self.clock.sleep)
+        self.glider = FakeGlider(self.clock)
+        self.runtime = GliderRuntime(self.glider, self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        glider_clock.set_clock(self.real_clock)
+
+    def test_one_second(self):
+        self.runtime.start()
+        self.loop.run(until=self.clock.now + 1.0001)
+        self.assertEqual(len(self.glider.ticks), 100)
+        # Written after the ticks, but never closer together than the breather
+        writes = self.glider.pwm_controller.writes
+        self.assertEqual(writes[0], self.glider.ticks[0])
+        self.assertTrue(all(b - a >= 0.02 - 1e-9 for a, b in zip(writes, writes[1:])))
+        self.assertGreaterEqual(len(writes), 49)
+        # Telemetry woke up once and went straight out of the radio
+        self.assertEqual(len(self.glider.sent), 1)
+        self.assertAlmostEqual(self.glider.sent[0][0], 101.0)
+
+    def test_stops_with_the_glider(self):
+        self.runtime.start()
+        self.loop.run(until=self.clock.now + 0.1)
+        self.glider.running = False
+        self.loop.run(until=self.clock.now + 10)
+        self.assertFalse(self.loop.running)
+        self.assertLess(self.clock.now, 100.2)
+
+
+class TestBlockingState(TestCase):
+    def setUp(self):
+        self.clock = FastClock()
+        self.real_clock = glider_clock.get_clock()
+        glider_clock.set_clock(self.clock)  # The states' sleeps
+        self.loop = EventLoop(clock=self.clock.monotonic, sleep=self.clock.sleep)
+        self.glider = PackagingGlider(self.clock)
+        self.runtime = GliderRuntime(self.glider, self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        glider_clock.set_clock(self.real_clock)
+
+    def test_packaging_pulses_reach_the_servos(self):
+        self.runtime.start()
+        self.loop.run(until=self.clock.now + 200)
+        self.assertFalse(self.glider.running)  # PACKAGING finished
+        controller = self.glider.pwm_controller
+        table = controller._angle_pulse_table
+
+        def history(address):
+            pulses = [written.get(address) for written in self.glider.written]
+            return [pulse for n, pulse in enumerate(pulses) if n == 0 or pulse != pulses[n - 1]]
+
+        # Opened (so the rod and chute can be loaded) and closed again
+        self.assertEqual(history(controller.servo_addresses["release"])[-2:], [table[180], table[10]])
+        self.assertEqual(history(controller.servo_addresses["parachute"])[-2:], [table[0], table[180]])
+        flap = controller.flap_addresses["left_near"]
+        self.assertIn(controller.flap_pulse_tables["left_near"][0], history(flap))
+        # The loop kept sending telemetry while the state slept
+        self.assertGreater(self.glider.telemetry_handler.checks, 20)
@@ -0,0 +1,77 @@
+from unittest import TestCase
+from glider.modules.glider_scheduler import StateScheduler, SKIP, CATCH_UP
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeState(object):
+    def __init__(self, period, policy=SKIP):
+        self.sleepTime = period
+        self.overrunPolicy = policy
+
+
+class TestStateScheduler(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = StateScheduler(clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_fixed_rate_without_drift(self):
+        state = FakeState(0.01)
+        for _ in range(100):
+            self.scheduler.wait("FLIGHT", state)
+            self.clock.now += 0.004  # execute() time must not stretch the period
+        self.assertAlmostEqual(self.clock.now, 100.0 + 100 * 0.01 + 0.004)
+        timing = self.scheduler.summary()["FLIGHT"]
+        self.assertEqual(timing["ticks"], 100)
+        self.assertEqual(timing["overruns"], 0)
+
+    def test_skip_policy(self):
+        state = FakeState(0.01, SKIP)
+        self.scheduler.wait("FLIGHT", state)
+        self.clock.now += 0.055  # execute() overran by five periods
+        self.scheduler.wait("FLIGHT", state)
+        timing = self.scheduler.summary()["FLIGHT"]
+        self.assertEqual(timing["overruns"], 1)
+        self.assertEqual(timing["skipped"], 4)
+        before = self.clock.now
+        self.scheduler.wait("FLIGHT", state)
+        self.assertGreater(self.clock.now, before)
+
+    def test_catch_up_policy(self):
+        state = FakeState(0.01, CATCH_UP)
+        self.scheduler.wait("PARACHUTE", state)
+        self.clock.now += 0.035
+        before = self.clock.now
+        for _ in range(3):
+            # The missed ticks run straight away
+            self.scheduler.wait("PARACHUTE", state)
+            self.assertEqual(self.clock.now, before)
+        self.scheduler.wait("PARACHUTE", state)
+        self.assertGreater(self.clock.now, before)
+        self.assertEqual(self.scheduler.summary()["PARACHUTE"]["skipped"], 0)
+
+    def test_state_change_restarts_timing(self):
+        self.scheduler.wait("ASCENT", FakeState(10))
+        self.assertAlmostEqual(self.clock.now, 110.0)
+        self.scheduler.wait("RELEASE", FakeState(1))
+        self.assertAlmostEqual(self.clock.now, 111.0)
+        self.assertEqual(sorted(self.scheduler.summary()), ["ASCENT", "RELEASE"])
+
+    def test_delay_and_tick_without_sleeping(self):
+        state = FakeState(0.5)
+        self.assertAlmostEqual(self.scheduler.delay("ASCENT", state), 0.5)
+        self.clock.now += 0.5
+        self.assertAlmostEqual(self.scheduler.delay("ASCENT", state), 0.0)
+        self.scheduler.tick(state)
+        self.assertAlmostEqual(self.scheduler.delay("ASCENT", state), 0.5)
+        self.assertEqual(self.clock.now, 100.5)  # Never slept
+        self.assertEqual(self.scheduler.summary()["ASCENT"]["ticks"], 1)
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from glider.modules.glider_speech import Speaker, VOICE, PLAYER
+
+
+class FakeProcess(object):
+    """Runs until finish() (or terminate()), rendering writes the WAV file straight away"""
+
+    def __init__(self, command):
+        self.command = command
+        self.finished = threading.Event()
+        self.returncode = None
+        if "-w" in command:
+            with open(command[command.index("-w") + 1], "w") as wav:
+                wav.write("RIFF")
+            self.finish()
+
+    def finish(self, returncode=0):
+        self.returncode = returncode
+        self.finished.set()
+
+    def terminate(self):
+        self.finish(-15)
+
+    def wait(self):
+        self.finished.wait(5)
+        return self.returncode
+
+
+class TestGliderSpeech(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.processes = []
+        self.started = threading.Semaphore(0)
+        self.speaker = Speaker(os.path.join(self.directory, "speech"), queue_size=3, start_process=self.start)
+
+    def tearDown(self):
+        for process in self.processes:
+            process.finish()
+        self.speaker.stop(timeout=5)
+        shutil.rmtree(self.directory)
+
+    def start(self, command):
+        process = FakeProcess(command)
+        self.processes.append(process)
+        self.started.release()
+        return process
+
+    def spoken(self):
+        return [process.command[-1] for process in self.processes if "-w" not in process.command]
+
+    def wait_for_process(self):
+        self.assertTrue(self.started.acquire(True) is not False)
+        return self.processes[-1]
+
+    def test_one_at_a_time(self):
+        self.speaker.start()
+        self.speaker.say("Initializing")
+        first = self.wait_for_process()
+        self.speaker.say("Updating pitch")
+        self.speaker.say("Updating pitch")  # Already waiting
+        self.speaker.say("3", topic="countdown")
+        self.speaker.say("2", topic="countdown")  # Supersedes 3
+        self.assertEqual(len(self.processes), 1)
+        self.assertEqual(self.speaker.coalesced, 2)
+        first.finish()
+        self.wait_for_process().finish()
+        self.wait_for_process().finish()
+        self.speaker.stop()
+        self.assertEqual(self.spoken(), ["Initializing", "Updating pitch", "2"])
+        self.assertEqual(self.processes[0].command, VOICE + ["Initializing"])
+
+    def test_alarm_first(self):
+        self.speaker.start()
+        self.speaker.say("Initializing")
+        first = self.wait_for_process()
+        for text in ["a", "b", "c", "d"]:
+            self.speaker.say(text)
+        self.assertEqual(self.speaker.dropped, 1)  # a, the oldest
+        self.speaker.say("Please help me!", alarm=True)
+        first.finished.wait(5)
+        self.assertEqual(first.returncode, -15)  # Cut short
+        for _ in range(3):
+            self.wait_for_process().finish()
+        self.speaker.stop()
+        self.assertEqual(self.spoken(), ["Initializing", "Please help me!", "c", "d"])
+        self.assertEqual(self.speaker.dropped, 2)  # And b for the alarm
+
+    def test_full_of_alarms(self):
+        for text in ["a", "b", "c"]:
+            self.speaker.say(text, alarm=True)
+        self.speaker.say("d")
+        self.assertEqual([phrase.text for phrase in self.speaker.pending], ["a", "b", "c"])
+        self.speaker.say("e", alarm=True)
+        self.assertEqual([phrase.text for phrase in self.speaker.pending], ["b", "c", "e"])
+
+    def test_prerendered(self):
+        self.speaker.prerender(["Switching state to FLIGHT", "Switching state to FLIGHT", "Wing test"])
+        self.speaker.start()
+        self.wait_for_process()
+        self.wait_for_process()
+        path = self.speaker.cache_path("Switching state to FLIGHT")
+        self.assertTrue(os.path.exists(path))
+        self.speaker.say("Switching state to FLIGHT")
+        self.wait_for_process().finish()
+        self.speaker.stop()
+        self.assertEqual(self.processes[-1].command, PLAYER + [path])
+        self.assertEqual(self.speaker.played, 1)
+        # Nothing to render next boot
+        speaker = Speaker(self.speaker.cache_dir, start_process=self.start)
+        speaker.prerender(["Switching state to FLIGHT", "Wing test"])
+        self.assertEqual(speaker.to_render, [])
@@ -0,0 +1,72 @@
+from unittest import TestCase
+from glider.glider_states import glide
+from glider.modules import glider_clock
+from glider.modules.glider_gps import GPSFix, NO_FIX
+from glider.modules.glider_pilot import Pilot
+from glider.bench.fakes import FakeIMU
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeGPS(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeIMUReader(FakeIMU):
+    def correct_heading(self, track):
+        self.track = track
+
+
+class FakePWMController(object):
+    def __init__(self):
+        self.scales = None
+
+    def set_flap_scales(self, scales):
+        self.scales = dict(scales)
+
+
+class FakeGlider(object):
+    def __init__(self, gps_data):
+        self.gps = FakeGPS(gps_data)
+        self.imu = FakeIMUReader()
+        self.pilot = Pilot(self.imu)
+        self.pwm_controller = FakePWMController()
+
+
+class TestGlide(TestCase):
+    def setUp(self):
+        self.real_clock = glider_clock.get_clock()
+        # Just after boot, sooner than the location refresh interval
+        self.clock = FakeClock(5.0)
+        glider_clock.set_clock(self.clock)
+
+    def tearDown(self):
+        glider_clock.set_clock(self.real_clock)
+
+    def test_first_tick_soon_after_boot(self):
+        state = glide()
+        glider = FakeGlider(GPSFix(54.6, -7.4, 1200.0, 20.0, 90.0, None, 3.0, 3.0, None, 3, 5.0))
+        state.execute(glider)
+        self.assertEqual(glider.imu.track, 90.0)
+        self.assertIsNotNone(glider.pwm_controller.scales)
+        self.assertFalse(state.readyToSwitch)
+
+    def test_no_fix(self):
+        state = glide()
+        glider = FakeGlider(NO_FIX)
+        state.execute(glider)
+        self.assertIsNotNone(glider.pwm_controller.scales)
+        self.assertFalse(state.readyToSwitch)
@@ -0,0 +1,116 @@
+import time
+import socket
+import threading
+from unittest import TestCase
+from glider.modules.glider_gps import GPS, GPSFix, NO_FIX, MODE_2D, MODE_3D, parse_time
+
+
+class TestGPSFix(TestCase):
+    def test_from_report(self):
+        fix = GPSFix.from_report({
+            "class": "TPV", "mode": 3, "time": "2018-06-01T12:00:01.500Z",
+            "lat": 54.6, "lon": -7.4, "alt": 1200.5, "speed": 20, "track": 90.0, "epx": 4.2, "epy": 6.1,
+        }, received=100.0)
+        self.assertEqual((fix.lat, fix.lon, fix.alt, fix.speed), (54.6, -7.4, 1200.5, 20.0))
+        self.assertEqual(fix.time, 1527854401.5)
+        self.assertEqual(fix.mode, MODE_3D)
+        self.assertIsNone(fix.climb)
+        self.assertTrue(fix.has_fix)
+        self.assertEqual(fix.max_error, 6.1)
+        self.assertRaises(AttributeError, setattr, fix, "lat", 0)
+
+    def test_no_fix(self):
+        fix = GPSFix.from_report({"class": "TPV", "mode": 1, "lat": "n/a", "time": "n/a"})
+        self.assertIsNone(fix.lat)
+        self.assertIsNone(fix.time)
+        self.assertFalse(fix.has_fix)
+        self.assertEqual(fix.max_error, float("inf"))
+        self.assertFalse(NO_FIX.has_fix)
+        self.assertEqual(NO_FIX.age, float("inf"))
+        self.assertFalse(GPSFix.from_report({"mode": MODE_2D, "lat": 54.6}).has_fix)
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("2018-06-01T12:00:00Z"), 1527854400.0)
+        self.assertEqual(parse_time("2018-06-01T12:00:00.25Z"), 1527854400.25)
+        self.assertIsNone(parse_time("n/a"))
+        self.assertIsNone(parse_time(None))
+
+
+class TestGPSConnection(TestCase):
+    def setUp(self):
+        # A gpsd that hangs up on everyone
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(5)
+        self.accepted = 0
+        self.serving = True
+        self.thread = threading.Thread(target=self.hang_up)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def hang_up(self):
+        while self.serving:
+            connection, _ = self.server.accept()
+            self.accepted += 1
+            connection.close()
+
+    def tearDown(self):
+        self.serving = False
+        self.server.close()
+
+    def test_reconnects_when_gpsd_hangs_up(self):
+        gps = GPS(*self.server.getsockname())
+        gps.poll_timeout = 0.05
+        gps.start()
+        time.sleep(0.5)
+        gps.threadAlive = False
+        gps.thread.join()
+        # Waits between attempts rather than spinning on the closed socket
+        self.assertGreaterEqual(gps.reconnects, 2)
+        self.assertLessEqual(gps.reconnects, 12)
+        self.assertEqual(self.accepted, gps.reconnects + 1)
+
+
+class TestGPSDown(TestCase):
+    def setUp(self):
+        # A port nothing listens on until gpsd "restarts"
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.bind(("127.0.0.1", 0))
+        self.address = probe.getsockname()
+        probe.close()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.close()
+
+    def serve(self):
+        connection, _ = self.server.accept()
+        connection.sendall(b'{"class":"TPV","mode":3,"lat":54.6,"lon":-7.4}\n')
+        time.sleep(1)
+        connection.close()
+
+    def test_reconnects_when_gpsd_comes_back(self):
+        gps = GPS(*self.address)
+        self.assertFalse(gps.connected)
+        gps.poll_timeout = 0.05
+        gps.max_reconnect_wait = 0.1
+        gps.start()
+        time.sleep(0.5)  # Down for several poll timeouts
+        attempts = gps.reconnects
+        self.assertGreaterEqual(attempts, 3)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen(1)
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+        for _ in range(50):
+            if gps.reports:
+                break
+            time.sleep(0.05)
+        gps.stop()
+        self.assertEqual(gps.reports, 1)
+        self.assertEqual(gps.fix.lat, 54.6)
+        self.assertIsNone(gps.reconnect_wait)  # Backoff over once gpsd talks again
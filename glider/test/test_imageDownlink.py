@@ -0,0 +1,72 @@
+import os
+import base64
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules.image_downlink import ImageDownlink, parse_indices
+
+
+class TestImageDownlink(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image_data = os.urandom(1000)
+        self.image_path = os.path.join(self.directory, "low_1.jpg")
+        with open(self.image_path, "wb") as image:
+            image.write(self.image_data)
+        self.downlink = ImageDownlink(0xFF, chunk_size=165, keep_transfers=2)
+
+    def tearDown(self):
+        self.downlink.close()
+        shutil.rmtree(self.directory)
+
+    def drain(self):
+        packets = []
+        while True:
+            packet = self.downlink.next_packet()
+            if packet is None:
+                return packets
+            packets.append(packet[0])
+
+    def chunks(self, packets):
+        return dict((int(p.split("|")[3]), base64.b64decode(p.split("|")[4])) for p in packets if p.startswith("I|P|"))
+
+    def test_transfer(self):
+        transfer_id = self.downlink.start_transfer(self.image_path)
+        packets = self.drain()
+        self.assertEqual(packets[0], "I|S|%s|7|1000|low_1.jpg" % transfer_id)
+        self.assertEqual(packets[-1], "I|E|%s" % transfer_id)
+        chunks = self.chunks(packets)
+        self.assertEqual(sorted(chunks), range(7))
+        self.assertEqual(b"".join(chunks[index] for index in range(7)), self.image_data)
+
+    def test_transfer_from_segment(self):
+        segment_path = os.path.join(self.directory, "low_00000000.seg")
+        offset = 70000  # Not on an mmap boundary
+        with open(segment_path, "wb") as segment:
+            segment.write(os.urandom(offset) + self.image_data + os.urandom(50))
+        transfer_id = self.downlink.start_transfer(segment_path, offset, len(self.image_data), "low_2.jpg")
+        packets = self.drain()
+        self.assertEqual(packets[0], "I|S|%s|7|1000|low_2.jpg" % transfer_id)
+        chunks = self.chunks(packets)
+        self.assertEqual(b"".join(chunks[index] for index in range(7)), self.image_data)
+
+    def test_resend(self):
+        transfer_id = self.downlink.start_transfer(self.image_path)
+        self.drain()
+        self.assertEqual(self.downlink.resend(transfer_id, "1,4-5,99"), 3)
+        packets = self.drain()
+        chunks = self.chunks(packets)
+        self.assertEqual(sorted(chunks), [1, 4, 5])
+        self.assertEqual(chunks[4], self.image_data[4 * 165:5 * 165])
+        self.assertEqual(packets[-1], "I|E|%s" % transfer_id)
+        self.assertEqual(self.downlink.resend(transfer_id + 100, "1"), 0)
+
+    def test_old_transfers_dropped(self):
+        first = self.downlink.start_transfer(self.image_path)
+        self.downlink.start_transfer(self.image_path)
+        self.downlink.start_transfer(self.image_path)
+        self.assertNotIn(first, self.downlink.transfers)
+        self.assertEqual(len(self.downlink.active), 2)
+
+    def test_parse_indices(self):
+        self.assertEqual(parse_indices("1, 5,7-9,30,20-1000", 22), [1, 5, 7, 8, 9, 20, 21])
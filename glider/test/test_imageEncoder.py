@@ -0,0 +1,40 @@
+import io
+from unittest import TestCase
+from PIL import Image
+from glider.modules.image_encoder import (
+    EncoderPool, RawFrame, encode_frame, DOWNLINK_JPEG, ARCHIVE_PNG, THUMBNAIL)
+
+
+def noise_frame(size, buffer_size):
+    return RawFrame(Image.effect_noise(buffer_size, 64).convert("RGB").tobytes(), size, buffer_size)
+
+
+class TestImageEncoder(TestCase):
+    def test_encode_outputs(self):
+        frame = noise_frame((1296, 972), (1312, 976))
+        encoded = encode_frame(frame, [
+            (ARCHIVE_PNG, "high.png"),
+            (THUMBNAIL, "thumb.jpg", (160, 120)),
+            (DOWNLINK_JPEG, "low.jpg"),
+        ])
+        self.assertEqual([name for name, _, _ in encoded], ["high.png", "thumb.jpg", "low.jpg"])
+        for name, resolution, data in encoded:
+            image = Image.open(io.BytesIO(data))
+            self.assertEqual(image.size, resolution)
+            self.assertEqual(image.format, "PNG" if name.endswith(".png") else "JPEG")
+        self.assertEqual(encoded[1][1], (160, 120))
+
+    def test_pool_drops_instead_of_blocking(self):
+        pool = EncoderPool(workers=1, max_pending=1)
+        pool.start()
+        frame = noise_frame((640, 480), (640, 480))
+        encoded = []
+        accepted = [pool.submit(frame, [(ARCHIVE_PNG, "%s.png" % index)], encoded.extend) for index in range(3)]
+        pool.stop()
+        stats = pool.stats()
+        self.assertTrue(accepted[0])
+        self.assertEqual(stats["dropped"], accepted.count(False))
+        self.assertGreater(stats["dropped"], 0)
+        self.assertEqual(stats["completed"] + stats["dropped"], 3)
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(len(encoded), stats["completed"])
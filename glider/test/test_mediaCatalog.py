@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules.media_catalog import MediaCatalog, LOW, HIGH
+
+
+class TestMediaCatalog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = MediaCatalog(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make(self, name, mtime):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as media:
+            media.write(b"x" * 10)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_newest_unsent(self):
+        for index in range(5):
+            self.catalog.add("low_%s.jpg" % index, LOW, 1000 + index, (640, 480), 10)
+        self.catalog.add("high_9.png", HIGH, 2000, (1296, 972), 10)
+        self.assertEqual(self.catalog.newest(LOW).path, "low_4.jpg")
+        self.catalog.mark_sent("low_4.jpg")
+        self.catalog.mark_sent("low_2.jpg")
+        self.assertEqual(self.catalog.newest(LOW, unsent=True).path, "low_3.jpg")
+        self.assertEqual(self.catalog.newest(LOW).path, "low_4.jpg")
+        self.assertIsNone(self.catalog.newest("video"))
+
+    def test_nearest(self):
+        for index in range(5):
+            self.catalog.add("low_%s.jpg" % index, LOW, 1000 + index * 10, size=10)
+        self.assertEqual(self.catalog.nearest(LOW, 1016).path, "low_2.jpg")
+        self.assertEqual(self.catalog.nearest(LOW, 0).path, "low_0.jpg")
+        self.assertEqual(self.catalog.nearest(LOW, 5000).path, "low_4.jpg")
+
+    def test_rebuild_keeps_sent(self):
+        old = self.make("low_1.jpg", 1000)
+        self.make("low_2.jpg", 2000)
+        self.make("high_1.png", 1500)
+        self.make("low_3.jpg.part", 3000)
+        self.make("notes.txt", 3000)
+        self.catalog.rebuild()
+        self.catalog.mark_sent(old)
+        rebuilt = MediaCatalog(self.directory)
+        self.assertEqual(rebuilt.rebuild({LOW: (640, 480)}), 3)
+        self.assertTrue(rebuilt.get(old).sent)
+        self.assertEqual(rebuilt.get(old).resolution, (640, 480))
+        self.assertEqual(os.path.basename(rebuilt.newest(LOW, unsent=True).path), "low_2.jpg")
+        self.assertEqual(os.path.basename(rebuilt.nearest(HIGH, 0).path), "high_1.png")
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules.media_store import FileStore, SegmentStore
+
+
+class TestMediaStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def segment_store(self, **kwargs):
+        options = dict(segment_size=100, budget=10 ** 6, fsync_interval=0)
+        options.update(kwargs)
+        return SegmentStore(self.directory, **options)
+
+    def test_put_locate(self):
+        for store in (FileStore(self.directory), self.segment_store()):
+            first = store.put("low_1.jpg", b"a" * 30, "low", 1000.0)
+            second = store.put("low_2.jpg", b"b" * 20, "low", 1001.0)
+            self.assertEqual(store.read(first), b"a" * 30)
+            self.assertEqual(store.read(second), b"b" * 20)
+            path, offset, length = store.locate(second)
+            with open(path, "rb") as media_file:
+                media_file.seek(offset)
+                self.assertEqual(media_file.read(length), b"b" * 20)
+            store.close()
+
+    def test_segments_rotate(self):
+        store = self.segment_store()
+        keys = [store.put("low_%s.jpg" % index, b"x" * 40, "low", index) for index in range(5)]
+        self.assertEqual(len(store.segments["low"]), 3)
+        self.assertEqual(store.locate(keys[2])[1], 0)
+        self.assertEqual(store.total_size, 200)
+
+    def test_evicts_low_priority_first(self):
+        evicted = []
+        store = self.segment_store(budget=250)
+        store.on_evict = evicted.extend
+        store.put("high_0.png", b"h" * 60, "high", 0)
+        store.put("high_1.png", b"h" * 60, "high", 1)
+        for index in range(4):
+            store.put("thumb_%s.jpg" % index, b"t" * 50, "thumb", index)
+        self.assertEqual(evicted, ["thumb_0.jpg", "thumb_1.jpg"])
+        self.assertEqual(store.total_size, 220)
+        # The thumbnail segment left is being written to, so the oldest high pictures go next
+        store.put("low_0.jpg", b"l" * 50, "low", 5)
+        self.assertEqual(evicted[2:], ["high_0.png"])
+        self.assertLessEqual(store.total_size, 250)
+        self.assertRaises(KeyError, store.locate, "high_0.png")
+
+    def test_videos_counted(self):
+        evicted = []
+        store = self.segment_store(budget=250)
+        store.on_evict = evicted.extend
+        videos = []
+        for index in range(2):
+            path = os.path.join(self.directory, "video_%s.h264" % index)
+            with open(path, "wb") as video_file:
+                video_file.write(b"v" * 100)
+            videos.append(store.add_file(path, "video", index))
+        self.assertEqual(store.total_size, 200)
+        self.assertEqual(store.locate(videos[0]), (videos[0], 0, 100))
+        # Videos go before archive pictures
+        store.put("high_0.png", b"h" * 60, "high", 2)
+        self.assertEqual(evicted, [videos[0]])
+        self.assertFalse(os.path.exists(videos[0]))
+        self.assertEqual(store.total_size, 160)
+        self.assertRaises(KeyError, store.locate, videos[0])
+
+    def test_reopen(self):
+        store = self.segment_store()
+        for index in range(3):
+            store.put("low_%s.jpg" % index, b"%s" % index * 40, "low", 1000 + index)
+        store.close()
+        # A capture whose data never made it to the card
+        with open(store.segments["low"][-1].index_path, "a") as index_file:
+            index_file.write("low_9.jpg 40 40 1009.0\n")
+        reopened = self.segment_store()
+        entries = sorted(reopened.entries())
+        self.assertEqual([entry[0] for entry in entries], ["low_0.jpg", "low_1.jpg", "low_2.jpg"])
+        self.assertEqual(entries[1][2:], ("low", 1001.0, 40))
+        self.assertEqual(reopened.read("low_2.jpg"), b"2" * 40)
+        reopened.put("low_3.jpg", b"3" * 40, "low", 1003)
+        self.assertEqual(len(reopened.segments["low"]), 3)
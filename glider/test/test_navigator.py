@@ -0,0 +1,67 @@
+import math
+from unittest import TestCase
+from glider.modules.navigator import Navigator, EARTH_RADIUS
+
+
+def old_bearing(lat1, lon1, lat2, lon2):
+    # The formula the pilot used before the navigator
+    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+    bearing = math.atan2(
+        math.sin(lon2 - lon1) * math.cos(lat2),
+        math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    )
+    return (bearing + (2 * math.pi)) % (2 * math.pi)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class TestNavigator(TestCase):
+    def setUp(self):
+        self.navigator = Navigator(arrival_radius=100)
+
+    def test_bearing_and_distance(self):
+        self.navigator.set_route([(54.673146, -7.490621)])
+        for lat, lon in [(54.5, -7.2), (55.1, -7.9), (54.673, -7.3), (50.0, 0.5), (54.6731, -7.4906)]:
+            navigation = self.navigator.update(lat, lon)
+            self.assertAlmostEqual(navigation.bearing, old_bearing(lat, lon, 54.673146, -7.490621), places=9)
+            self.assertAlmostEqual(navigation.distance, haversine(lat, lon, 54.673146, -7.490621), places=5)
+
+    def test_cross_track(self):
+        # A leg due east along the equator, the left side is north
+        self.navigator.set_route([(0.0, 0.0), (0.0, 1.0)])
+        self.navigator.update(0.0, 0.0)
+        navigation = self.navigator.update(0.01, 0.5)
+        self.assertEqual(navigation.index, 1)
+        self.assertAlmostEqual(navigation.cross_track, -EARTH_RADIUS * math.radians(0.01), places=3)
+        self.assertAlmostEqual(self.navigator.update(-0.01, 0.5).cross_track, EARTH_RADIUS * math.radians(0.01), places=3)
+
+    def test_first_leg_starts_at_first_update(self):
+        self.navigator.set_route([(54.7, -7.5)])
+        self.assertIsNone(self.navigator.update(54.7, -7.5).cross_track)  # Already there, no leg
+        self.navigator.set_route([(54.7, -7.5)])
+        self.assertAlmostEqual(self.navigator.update(54.6, -7.5).cross_track, 0, places=6)
+        self.assertGreater(self.navigator.update(54.65, -7.45).cross_track, 0)  # East of a leg north
+
+    def test_arrival_advances(self):
+        route = [(54.60, -7.40), (54.62, -7.40), (54.62, -7.36)]
+        self.navigator.set_route(route)
+        self.assertEqual(self.navigator.update(54.50, -7.40).index, 0)
+        navigation = self.navigator.update(54.5995, -7.40)  # ~56m short of the first waypoint
+        self.assertEqual(navigation.index, 1)
+        self.assertAlmostEqual(math.cos(navigation.bearing), 1, places=9)  # North
+        # Straight through the second (within the radius of it) and the last is held once reached
+        self.assertEqual(self.navigator.update(54.62, -7.4005).index, 2)
+        navigation = self.navigator.update(54.62, -7.36)
+        self.assertEqual((navigation.index, navigation.distance), (2, 0))
+        self.assertEqual(self.navigator.arrivals, 2)
+        self.assertEqual((self.navigator.waypoint.lat, self.navigator.waypoint.lon), route[-1])
+
+    def test_bad_routes(self):
+        self.assertRaises(ValueError, self.navigator.set_route, [])
+        self.assertRaises(ValueError, self.navigator.set_route, [(91, 0)])
+        self.assertRaises(ValueError, self.navigator.set_route, [("n/a", 0)])
+        self.assertIsNone(self.navigator.update(54.6, -7.4))
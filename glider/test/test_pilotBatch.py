@@ -0,0 +1,73 @@
+import math
+from unittest import TestCase
+from glider.modules.glider_clock import monotonic
+from glider.modules.glider_imu import IMUSample
+from glider.modules.glider_pilot import Pilot
+
+
+class FakeIMU(object):
+    """Reads back whatever attitude the test set"""
+
+    def __init__(self):
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+
+    def snapshot(self):
+        return IMUSample(self.roll, self.pitch, self.yaw, monotonic(), 0)
+
+    def is_stale(self, sample):
+        return False
+
+
+class TestGliderPilotBatch(TestCase):
+    """The batch (NumPy) control laws must match the scalar ones"""
+
+    def setUp(self):
+        import numpy as np
+        self.np = np
+        self.imu_reader = FakeIMU()
+        self.pilot = Pilot(self.imu_reader)
+        rng = np.random.RandomState(1234)
+        self.count = 500
+        self.pitch = rng.uniform(-math.pi/2, math.pi/2, self.count)
+        self.roll = rng.uniform(-math.pi, math.pi, self.count)
+        self.yaw = rng.uniform(-math.pi, 3*math.pi, self.count)
+        self.speed = rng.uniform(0, 50, self.count)
+        self.lat = rng.uniform(50, 56, self.count)
+        self.lon = rng.uniform(-10, -5, self.count)
+        self.lat[::7] = 0  # Bad fixes keep the previous heading
+
+    def test_flap_scales(self):
+        self.pilot.desired_yaw = 1.0
+        batch = self.pilot.batch_flap_scales(self.pitch, self.roll, self.yaw)
+        for i in range(self.count):
+            self.imu_reader.pitch, self.imu_reader.roll, self.imu_reader.yaw = self.pitch[i], self.roll[i], self.yaw[i]
+            scalar = self.pilot.update_flap_angles()
+            self.assertEqual(self.pilot.last_sample.pitch, self.pitch[i])  # What the flight recorder records
+            for flap, scale in scalar.items():
+                self.assertAlmostEqual(batch[flap][i], scale, places=12)
+
+    def test_pitch_for_speed(self):
+        batch = self.pilot.batch_pitch_for_speed(self.speed)
+        for i in range(self.count):
+            self.pilot.scale_pitch_for_speed(self.speed[i])
+            self.assertAlmostEqual(batch[i], self.pilot.desired_pitch_deg, places=12)
+
+    def test_desired_heading(self):
+        self.pilot.desired_yaw = 0.25
+        batch = self.pilot.batch_desired_heading(self.lat, self.lon)
+        for i in range(self.count):
+            self.pilot.update_location(self.lat[i], self.lon[i])
+            self.assertAlmostEqual(batch[i], self.pilot.desired_yaw, places=12)
+
+    def test_gain_sweep(self):
+        gains = self.np.linspace(0.5, 2.5, 20)[:, None]
+        flap_scales, desired_yaw = self.pilot.batch_update(
+            self.pitch, self.roll, self.yaw, self.speed, self.lat, self.lon, turn_multiplier=gains)
+        self.assertEqual(flap_scales['rudder'].shape, (20, self.count))
+        self.pilot.turn_multiplier = gains[3, 0]
+        single = self.pilot.batch_flap_scales(
+            self.pitch, self.roll, self.yaw, desired_yaw=desired_yaw,
+            desired_pitch_deg=self.pilot.batch_pitch_for_speed(self.speed))
+        self.assertTrue(self.np.allclose(flap_scales['rudder'][3], single['rudder']))
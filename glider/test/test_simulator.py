@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from glider.modules import glider_clock
+from glider.modules.flight_recorder import load_flight
+from glider.simulator import run_simulation
+
+
+class TestSimulator(TestCase):
+    def test_mission_reaches_recovery(self):
+        report = run_simulation(release_altitude=1000, parachute_height=500)
+        self.assertTrue(report["completed"])
+        self.assertEqual(
+            [entry["state"] for entry in report["states"]],
+            ["ASCENT", "RELEASE", "FLIGHT", "PARACHUTE", "RECOVER"]
+        )
+        self.assertGreater(report["radio_packets"], 0)
+        self.assertGreater(report["state_timing"]["FLIGHT"]["ticks"], 0)
+
+    def test_real_clock_restored(self):
+        real_clock = glider_clock.get_clock()
+        run_simulation(start_state="FLIGHT", parachute_height=500, max_time=5)
+        self.assertIs(glider_clock.get_clock(), real_clock)
+
+    def test_flight_recorded(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "flight.fdr")
+            run_simulation(release_altitude=1000, parachute_height=500, record_path=path)
+            flight = load_flight(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(list(flight["state"]["to_state"]), [b"ASCENT", b"RELEASE", b"FLIGHT", b"PARACHUTE", b"RECOVER"])
+        self.assertGreater(len(flight["imu"]), 100)
+        self.assertEqual(len(flight["flaps"]), len(flight["imu"]))
+        self.assertGreater(len(flight["gps"]), 0)
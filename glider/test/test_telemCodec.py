@@ -0,0 +1,50 @@
+import datetime
+from unittest import TestCase
+from glider.modules import telem_codec
+from glider.modules.rhserial import build_frame
+
+
+class TestTelemCodec(TestCase):
+    def test_telemetry_round_trip(self):
+        frame = telem_codec.encode_telemetry(
+            70000, datetime.datetime(2017, 6, 1, 12, 34, 56),
+            54.4512345, -7.2512345, 12.5, 2345.67, 54.5, -6.9, "PARACHUTE")
+        self.assertTrue(telem_codec.is_binary(frame))
+        frame_type, telemetry = telem_codec.decode(frame)
+        self.assertEqual(frame_type, telem_codec.TELEMETRY)
+        self.assertEqual(telemetry.index, 70000 % 2 ** 16)
+        self.assertEqual(telemetry.time, datetime.time(12, 34, 56))
+        self.assertAlmostEqual(telemetry.lat, 54.4512345, places=6)
+        self.assertAlmostEqual(telemetry.lon, -7.2512345, places=6)
+        self.assertAlmostEqual(telemetry.alt, 2345.67, places=2)
+        self.assertEqual(telemetry.state, "PARACHUTE")
+
+    def test_missing_values(self):
+        frame = telem_codec.encode_telemetry(1, None, "n/a", "n/a", "n/a", "n/a", 54.5, -6.9, "UNKNOWN")
+        telemetry = telem_codec.decode(frame)[1]
+        self.assertEqual(
+            [telemetry.time, telemetry.lat, telemetry.lon, telemetry.epx, telemetry.alt, telemetry.state],
+            [None] * 6)
+
+    def test_glider_data_round_trip(self):
+        scales = {"rudder": 0.44, "rear": 1.0, "left_near": 0.57, "right_near": 0.43, "left_far": 0}
+        frame = telem_codec.encode_glider_data(-12.34, 5, 190, scales, 45, -10, "n/a", 359.99, 7, "DEST")
+        data = telem_codec.decode(frame)[1]
+        self.assertAlmostEqual(data.roll, -12.34)
+        self.assertAlmostEqual(data.yaw, -170)
+        self.assertAlmostEqual(data.flap_scales["rear"], 1.0)
+        self.assertAlmostEqual(data.flap_scales["left_near"], 0.572)
+        self.assertIsNone(data.flap_scales["right_far"])
+        self.assertIsNone(data.speed)
+        self.assertEqual(data.commands_received, 7)
+        self.assertEqual(data.last_command, "DEST")
+
+    def test_text_frames_are_not_binary(self):
+        self.assertFalse(telem_codec.is_binary("T|glider  |00001"))
+        self.assertRaises(telem_codec.TelemetryDecodeError, telem_codec.decode, "D|O:1.0_2.0_3.0")
+
+    def test_frame_escapes_dle(self):
+        frame = build_frame(b"\x10\x03payload", to=0xFF, frm=0xAA, id=0x10)
+        body = frame[2:-4]
+        self.assertEqual(body.replace(b"\x10\x10", b""), bytearray([0xFF, 0xAA, 0x00]) + b"\x03payload")
+        self.assertEqual(frame[-4:-2], bytearray(b"\x10\x03"))
@@ -0,0 +1,88 @@
+from unittest import TestCase
+from glider.modules import glider_clock
+from glider.modules.tx_scheduler import TransmitScheduler, wire_size, COMMAND, TELEMETRY, DATA, BULK
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTransmitScheduler(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.real_clock = glider_clock.get_clock()
+        glider_clock.set_clock(self.clock)
+        self.sent = []
+        # 1000 baud = 100 bytes/s
+        self.scheduler = TransmitScheduler(lambda data, address: self.sent.append(data), 1000, burst_bytes=50)
+
+    def tearDown(self):
+        glider_clock.set_clock(self.real_clock)
+
+    def drain(self):
+        while True:
+            wait = self.scheduler.send_next()
+            if wait is None:
+                return
+            self.clock.sleep(wait)
+
+    def test_priority_order(self):
+        self.scheduler.enqueue("image", 0xFF, BULK)
+        self.scheduler.enqueue("data", 0xFF, DATA)
+        self.scheduler.enqueue("telem", 0xFF, TELEMETRY)
+        self.scheduler.enqueue("ack", 0xFF, COMMAND)
+        self.drain()
+        self.assertEqual(self.sent, ["ack", "telem", "data", "image"])
+
+    def test_rate_limited_to_link(self):
+        packet = "x" * 40
+        for _ in range(11):
+            self.scheduler.enqueue(packet, 0xFF, BULK)
+        start = self.clock.now
+        self.drain()
+        elapsed = self.clock.now - start
+        self.assertEqual(len(self.sent), 11)
+        # The first packet goes from the full bucket, the other 10 at 100 bytes/s
+        self.assertAlmostEqual(elapsed, 10 * wire_size(packet) / 100.0 - (50 - wire_size(packet)) / 100.0)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["queue_depth"]["bulk"], 0)
+        self.assertEqual(stats["sent_packets"]["bulk"], 11)
+        self.assertAlmostEqual(stats["utilization"], 11 * wire_size(packet) / (elapsed * 100.0))
+
+    def test_high_priority_overtakes_queued_bulk(self):
+        for index in range(5):
+            self.scheduler.enqueue("image%s" % index, 0xFF, BULK)
+        self.scheduler.send_next()
+        self.scheduler.enqueue("telem", 0xFF, TELEMETRY)
+        self.drain()
+        self.assertEqual(self.sent[:2], ["image0", "telem"])
+
+    def test_wire_size_counts_escapes(self):
+        self.assertEqual(wire_size(b"\x10ab"), 3 + 10 + 1)
+
+    def test_sources_pulled_when_their_class_is_next(self):
+        pulled = []
+
+        class Source(object):
+            def next_packet(self):
+                if len(pulled) < 3:
+                    pulled.append(len(pulled))
+                    return "chunk%s" % pulled[-1], 0xFF
+                return None
+
+        self.scheduler.add_source(Source(), BULK)
+        self.scheduler.enqueue("telem", 0xFF, TELEMETRY)
+        self.scheduler.send_next()
+        self.assertEqual(pulled, [])
+        self.drain()
+        self.assertEqual(self.sent, ["telem", "chunk0", "chunk1", "chunk2"])